@@ -0,0 +1,210 @@
+# Benchmarks for the crack spread parameter sweep in crack_sweep.py
+#
+# HOW TO USE:
+# python bench_crack_sweep.py
+
+import time
+from itertools import product
+
+import numpy as np
+import pandas as pd
+
+from crack_sweep import (
+    CRUDE,
+    GASOLINE,
+    HEATING_OIL,
+    TRADING_DAYS,
+    crack_spread,
+    simulate,
+    sweep,
+)
+
+REFINER = "VLO"
+# The notebook's thresholds, then others with exits beyond the opposite
+# entries, with entries and exits crossing each other, and with the long
+# and short thresholds overlapping
+THRESHOLDS = [
+    (-2, 2, 1.7, 1.5),
+    (-1, 0.5, 1, -0.5),
+    (-1.5, -1, 1.5, 1),
+    (-0.5, -1, 0.5, 1),
+    (0.5, -0.5, -0.5, 0.5),
+]
+
+
+def make_prices(n_days=1500, seed=0):
+    """Build random walk closes of the three futures and a refiner."""
+    rng = np.random.default_rng(seed)
+    index = pd.bdate_range("2018-01-01", periods=n_days)
+    starts = {CRUDE: 70.0, GASOLINE: 2.0, HEATING_OIL: 2.2, REFINER: 100.0}
+    return pd.DataFrame(
+        {
+            symbol: start * np.exp(rng.normal(0, 0.02, n_days).cumsum())
+            for symbol, start in starts.items()
+        },
+        index=index,
+    )
+
+
+def notebook_zscore(prices, window):
+    """The z-score as the notebook computes it."""
+    crack_spread_rank = crack_spread(prices).rolling(window).rank(pct=True)
+    refiner_rank = prices[REFINER].rolling(window).rank(pct=True)
+    rank_spread = refiner_rank - crack_spread_rank
+    roll = rank_spread.rolling(window)
+    return (rank_spread - roll.mean()) / roll.std()
+
+
+def crossed_above(first, second):
+    """
+    Where ``first`` crosses above ``second``, as ``vbt.crossed_above``: it
+    must have been below since the last NaN, and not above the day before.
+    """
+    out = np.zeros(len(first), dtype=bool)
+    was_below, was_above = False, False
+    for i, (a, b) in enumerate(zip(first, second)):
+        if np.isnan(a) or np.isnan(b):
+            was_below, was_above = False, False
+        elif a > b:
+            out[i] = was_below and not was_above
+            was_above = True
+        else:
+            was_below = was_below or a < b
+            was_above = False
+    return out
+
+
+def clean(entries, exits):
+    """
+    ``vbt.signals.clean``: keep the first entry after each exit and the
+    first exit after each entry, dropping both on a day with both.
+    """
+    entries_out = np.zeros(len(entries), dtype=bool)
+    exits_out = np.zeros(len(exits), dtype=bool)
+    entered = False
+    for i, (is_entry, is_exit) in enumerate(zip(entries, exits)):
+        if is_entry and is_exit:
+            continue
+        if is_entry and not entered:
+            entered = entries_out[i] = True
+        elif is_exit and entered:
+            entered = False
+            exits_out[i] = True
+    return entries_out, exits_out
+
+
+def notebook_positions(zscore, long_entry, long_exit, short_entry, short_exit):
+    """
+    The positions of the notebook's signals under
+    ``vbt.Portfolio.from_signals``'s defaults: conflicting entries are
+    ignored and an opposite entry reverses the position before an exit
+    closes it.
+    """
+    z = zscore.to_numpy()
+
+    def level(threshold):
+        return np.full(len(z), float(threshold))
+
+    # zscore.vbt.crossed_below(x) is crossed_above(x, zscore)
+    long_entries, long_exits = clean(
+        crossed_above(level(long_entry), z), crossed_above(z, level(long_exit))
+    )
+    short_entries, short_exits = clean(
+        crossed_above(z, level(short_entry)), crossed_above(level(short_exit), z)
+    )
+
+    positions = np.zeros(len(z))
+    position = 0
+    for t in range(len(z)):
+        go_long, go_short = long_entries[t], short_entries[t]
+        if go_long and go_short:
+            go_long = go_short = False
+        if position > 0:
+            if go_short:
+                position = -1
+            elif long_exits[t]:
+                position = 0
+        elif position < 0:
+            if go_long:
+                position = 1
+            elif short_exits[t]:
+                position = 0
+        elif go_long:
+            position = 1
+        elif go_short:
+            position = -1
+        positions[t] = position
+    return pd.Series(positions, index=zscore.index)
+
+
+def notebook_stats(positions, returns):
+    """The sweep's statistics of a position series, computed with pandas."""
+    daily = (positions.shift() * returns).iloc[1:]
+    equity = (1 + daily).cumprod()
+    opened = (positions != 0) & (positions != positions.shift(fill_value=0))
+    return {
+        "sharpe": daily.mean() / daily.std() * np.sqrt(TRADING_DAYS),
+        "max_drawdown": min((equity / equity.cummax() - 1).min(), 0.0),
+        "trades": opened.sum(),
+        "total_return": equity.iloc[-1] - 1,
+    }
+
+
+def bench_crack_sweep(n_days=1500, window=22, seeds=range(3)):
+    """
+    Check ``simulate``'s positions, trade counts and statistics, and the
+    rows of ``sweep``, against the notebook's entry and exit logic for single
+    threshold combinations on random prices, then time the sweep of a grid.
+    """
+    for seed in seeds:
+        prices = make_prices(n_days, seed)
+        returns = prices[REFINER].pct_change().fillna(0.0)
+        zscore = notebook_zscore(prices, window)
+        results = sweep(
+            prices,
+            [REFINER],
+            windows=[window],
+            long_entries=sorted({t[0] for t in THRESHOLDS}),
+            long_exits=sorted({t[1] for t in THRESHOLDS}),
+            short_entries=sorted({t[2] for t in THRESHOLDS}),
+            short_exits=sorted({t[3] for t in THRESHOLDS}),
+            max_workers=2,
+        ).set_index(["long_entry", "long_exit", "short_entry", "short_exit"])
+
+        for thresholds in THRESHOLDS:
+            positions = notebook_positions(zscore, *thresholds)
+            expected = notebook_stats(positions, returns)
+            actual = simulate(
+                zscore.to_numpy(),
+                returns.to_numpy(),
+                *np.array(thresholds, dtype=np.float64)[:, None],
+                positions=True,
+            )
+            np.testing.assert_array_equal(actual["positions"][:, 0], positions)
+            row = results.loc[thresholds]
+            for name, value in expected.items():
+                np.testing.assert_allclose(actual[name][0], value, rtol=1e-9)
+                np.testing.assert_allclose(row[name], value, rtol=1e-9)
+            assert expected["trades"] > 10, "Too few trades to check the signals."
+
+    thresholds = [i / 10 for i in range(-35, 35, 5)]
+    grid = dict(
+        long_entries=[t for t in thresholds if t < 0],
+        long_exits=thresholds,
+        short_entries=[t for t in thresholds if t > 0],
+        short_exits=thresholds,
+    )
+    n_combinations = len(list(product(*grid.values())))
+    start = time.perf_counter()
+    sweep(prices, [REFINER], windows=[10, 22, 44, 66], **grid)
+    seconds = time.perf_counter() - start
+
+    print(
+        f"crack sweep: {len(THRESHOLDS)} threshold sets x {len(seeds)} price "
+        "paths match the notebook"
+    )
+    print(f"  sweep of {4 * n_combinations:,} combinations {seconds:8.3f}s")
+
+
+if __name__ == "__main__":
+    bench_crack_sweep()
@@ -0,0 +1,112 @@
+# Benchmarks for the vectorized cross-section utilities in cross_section.py
+#
+# HOW TO USE:
+# python bench_cross_section.py
+
+import time
+
+import numpy as np
+import pandas as pd
+
+from cross_section import bottom, latest, quantiles, rank, top
+
+
+def make_factor(n_assets=3000, n_dates=2500, seed=0):
+    """Build a dates x assets factor with staggered starts, gaps and ties."""
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range("2015-01-01", periods=n_dates, name="date")
+    # Rounding makes ties common, as with discrete or clipped factors
+    values = np.round(rng.normal(0, 1, (n_dates, n_assets)), 2)
+    starts = rng.integers(0, n_dates // 2, n_assets)
+    values[np.arange(n_dates)[:, None] < starts] = np.nan
+    values[rng.random(values.shape) < 0.02] = np.nan
+    return pd.DataFrame(
+        values,
+        index=dates,
+        columns=pd.Index([f"S{i:04d}" for i in range(n_assets)], name="symbol"),
+    )
+
+
+def timed(label, func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    print(f"  {label:<34}{time.perf_counter() - start:8.3f}s")
+    return result
+
+
+def bench_rank(n_assets=3000, n_dates=2500):
+    """Compare ``rank`` with the groupby rank of the notebooks."""
+    factor = make_factor(n_assets, n_dates)
+    long = factor.stack().rename("momentum").to_frame().swaplevel().sort_index()
+
+    print(f"rank: {n_assets} assets x {n_dates} dates")
+    expected = timed(
+        "groupby(level=[1]).momentum.rank()",
+        lambda: long.groupby(level=[1]).momentum.rank(ascending=False),
+    )
+    actual = timed("rank", rank, factor, ascending=False)
+    actual = actual.stack().swaplevel().reindex(expected.index)
+    pd.testing.assert_series_equal(expected, actual, check_names=False)
+
+    for method in ["min", "max", "first"]:
+        pd.testing.assert_frame_equal(
+            factor.rank(axis=1, method=method), rank(factor, method=method)
+        )
+
+
+def bench_top(n_assets=3000, n_dates=2500, n=50):
+    """Compare ``top``, ``bottom`` and ``quantiles`` with pandas."""
+    factor = make_factor(n_assets, n_dates)
+
+    print(f"top/bottom({n}): {n_assets} assets x {n_dates} dates")
+    ordinal = timed(
+        "rank(axis=1, method='first') <= n",
+        lambda: factor.rank(axis=1, method="first", ascending=False) <= n,
+    )
+    mask = timed("top", top, factor, n)
+    pd.testing.assert_frame_equal(ordinal, mask)
+    pd.testing.assert_frame_equal(
+        factor.rank(axis=1, method="first") <= n, bottom(factor, n)
+    )
+
+    print(f"quantiles(5): {n_assets} assets x {n_dates} dates")
+    valid = factor.count(axis=1) >= 5
+    expected = timed(
+        "apply(pd.qcut(rank(method='first')))",
+        lambda: factor[valid].apply(
+            lambda row: pd.qcut(row.rank(method="first"), 5, labels=False) + 1,
+            axis=1,
+        ),
+    )
+    actual = timed("quantiles", quantiles, factor, 5)
+    pd.testing.assert_frame_equal(expected, actual[valid], check_dtype=False)
+
+
+def bench_latest(n_assets=3000, n_dates=2500, n=50):
+    """Compare picking the latest row per symbol and its top ``n``."""
+    factor = make_factor(n_assets, n_dates)
+    # Some symbols stop trading before the end
+    factor.iloc[-100:, ::7] = np.nan
+    long = factor.stack().rename("momentum").to_frame().swaplevel().sort_index()
+
+    print(f"latest top {n}: {n_assets} assets x {n_dates} dates")
+    expected = timed(
+        "groupby.apply(latest row).head(n)",
+        lambda: long.groupby(level=0, group_keys=False)
+        .apply(lambda rows: rows.iloc[[-1]])
+        .sort_values("momentum", ascending=False, kind="stable")
+        .head(n),
+    )
+
+    def latest_top():
+        last = latest(factor)
+        return last[top(last[["value"]].T, n).iloc[0]]
+
+    actual = timed("latest + top", latest_top)
+    assert set(expected.index.get_level_values(0)) == set(actual.index)
+
+
+if __name__ == "__main__":
+    bench_rank()
+    bench_top()
+    bench_latest()
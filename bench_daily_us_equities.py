@@ -0,0 +1,397 @@
+# Benchmarks for the Quotemedia bundle ingest in daily_us_equities.py
+#
+# HOW TO USE:
+# python bench_daily_us_equities.py
+
+import asyncio
+import hashlib
+import os
+import tempfile
+import time
+from collections import Counter
+from io import BytesIO
+from zipfile import ZIP_DEFLATED, ZipFile
+
+import numpy as np
+import pandas as pd
+import aiohttp
+from aiohttp import web
+
+from daily_us_equities import (
+    TABLE_COLUMNS,
+    TABLE_RENAMES,
+    download_to_file,
+    fetch_and_download_tables_async,
+    fetch_download_link,
+    fetch_download_link_async,
+    load_data_table,
+    parse_pricing_and_vol,
+    pivot_pricing_and_vol,
+)
+
+
+def make_raw_data(n_symbols=2000, n_sessions=1000, seed=0):
+    """Build a synthetic table shaped like the parsed Quotemedia export."""
+    rng = np.random.default_rng(seed)
+    sessions = pd.bdate_range("2010-01-01", periods=n_sessions)
+
+    # Each symbol trades over a random sub-range of the sessions.
+    starts = rng.integers(0, n_sessions // 2, n_symbols)
+    ends = rng.integers(n_sessions // 2, n_sessions, n_symbols) + 1
+    lengths = ends - starts
+    symbols = np.repeat([f"S{i:05d}" for i in range(n_symbols)], lengths)
+    dates = sessions[np.concatenate([np.arange(s, e) for s, e in zip(starts, ends)])]
+
+    n = len(dates)
+    close = 100 * np.exp(rng.normal(0, 0.01, n).cumsum())
+    raw_data = pd.DataFrame(
+        {
+            "symbol": symbols,
+            "date": dates,
+            "open": close,
+            "high": close * 1.01,
+            "low": close * 0.99,
+            "close": close,
+            "volume": rng.integers(1_000, 1_000_000, n),
+            "ex_dividend": 0.0,
+            "split_ratio": 1.0,
+        }
+    )
+    return raw_data, sessions
+
+
+def bench_parse_pricing_and_vol(n_symbols=2000, n_sessions=1000):
+    """Compare ``pivot_pricing_and_vol`` with ``parse_pricing_and_vol``."""
+    raw_data, sessions = make_raw_data(n_symbols, n_sessions)
+    symbol_map = pd.Series(raw_data.symbol.unique())
+    raw_data = raw_data.set_index(["date", "symbol"])
+
+    timings = {}
+    results = {}
+    for parse in [parse_pricing_and_vol, pivot_pricing_and_vol]:
+        start = time.perf_counter()
+        results[parse.__name__] = list(parse(raw_data, sessions, symbol_map))
+        timings[parse.__name__] = time.perf_counter() - start
+
+    for (_, expected), (_, actual) in zip(*results.values()):
+        pd.testing.assert_frame_equal(
+            expected.astype(np.float64), actual, check_freq=False
+        )
+
+    print(f"parse_pricing_and_vol: {n_symbols} symbols x {n_sessions} sessions")
+    for name, seconds in timings.items():
+        print(f"  {name:<24}{seconds:8.3f}s")
+    speedup = timings["parse_pricing_and_vol"] / timings["pivot_pricing_and_vol"]
+    print(f"  speedup {speedup:.1f}x")
+
+
+def make_zip_file(raw_data):
+    """Write a table from ``make_raw_data`` as a Quandl style zip export."""
+    table = raw_data.rename(columns={v: k for k, v in TABLE_RENAMES.items()})
+    zip_file = BytesIO()
+    with ZipFile(zip_file, "w", ZIP_DEFLATED) as z:
+        z.writestr(
+            "QUOTEMEDIA_PRICES.csv",
+            table[TABLE_COLUMNS].to_csv(index=False, date_format="%Y-%m-%d"),
+        )
+    return zip_file
+
+
+def bench_load_data_table(n_symbols=4000, n_sessions=1000):
+    """Compare the pyarrow parse engine with the default one."""
+    raw_data, _ = make_raw_data(n_symbols, n_sessions)
+    zip_file = make_zip_file(raw_data)
+
+    timings = {}
+    results = {}
+    for engine in ["c", "pyarrow"]:
+        zip_file.seek(0)
+        start = time.perf_counter()
+        results[engine] = load_data_table(zip_file, engine=engine)
+        timings[engine] = time.perf_counter() - start
+
+    pd.testing.assert_frame_equal(results["c"], results["pyarrow"])
+
+    print(f"load_data_table: {len(raw_data):,} rows")
+    for engine, seconds in timings.items():
+        print(f"  {engine:<24}{seconds:8.3f}s")
+    print(f"  speedup {timings['c'] / timings['pyarrow']:.1f}x")
+
+
+class FakeDatalink:
+    """
+    A local stand-in for the Datalink datatable export API.
+
+    The first request for each table's export fails with a 503, the next
+    ``polls`` report it as still being created, and later ones as fresh with
+    a link to its zip file, served by the same server. Each export response
+    is delayed by ``delay`` seconds.
+    """
+
+    def __init__(self, tables, polls=2, delay=0.0):
+        self.tables = tables
+        self.polls = polls
+        self.delay = delay
+        self.requests = Counter()
+        self.app = web.Application()
+        self.app.router.add_get("/api/v3/datatables/{vendor}/{table}", self.export)
+        self.app.router.add_get("/files/{table}.zip", self.file)
+        self.runner = web.AppRunner(self.app)
+        self.url = None
+
+    async def start(self):
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        port = self.runner.addresses[0][1]
+        self.url = f"http://127.0.0.1:{port}"
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+    def table_url(self, table):
+        return f"{self.url}/api/v3/datatables/QUOTEMEDIA/{table}?qopts.export=true"
+
+    async def export(self, request):
+        table = request.match_info["table"]
+        self.requests[table] += 1
+        await asyncio.sleep(self.delay)
+        if self.requests[table] == 1:
+            raise web.HTTPServiceUnavailable()
+        if self.requests[table] <= 1 + self.polls or table not in self.tables:
+            file = {"status": "creating", "link": None}
+        else:
+            file = {"status": "fresh", "link": f"{self.url}/files/{table}.zip"}
+        return web.json_response({"datatable_bulk_download": {"file": file}})
+
+    async def file(self, request):
+        return web.Response(body=self.tables[request.match_info["table"]])
+
+
+async def bench_fetch_and_download_tables(n_symbols=500, n_sessions=500):
+    """
+    Poll and download two tables at once from a ``FakeDatalink``, and check
+    that polling, blocking or not, gives up at the deadline on a table that
+    never becomes fresh and on a server slower than the deadline.
+    """
+    tables = {
+        table: make_zip_file(make_raw_data(n_symbols, n_sessions, seed)[0]).getvalue()
+        for seed, table in enumerate(["PRICES", "ACTIONS"])
+    }
+    server = FakeDatalink(tables)
+    await server.start()
+    try:
+        with tempfile.TemporaryDirectory() as download_dir:
+            start = time.perf_counter()
+            paths = await fetch_and_download_tables_async(
+                [server.table_url(table) for table in tables], download_dir, 60
+            )
+            seconds = time.perf_counter() - start
+            for path, (table, data) in zip(paths, tables.items()):
+                assert os.path.basename(path) == f"QUOTEMEDIA_{table}.zip"
+                with open(path, "rb") as f:
+                    assert f.read() == data
+
+        async with aiohttp.ClientSession() as session:
+            # The bundle polls with the blocking fetcher, which must give up
+            # at the same deadline
+            pollers = [
+                lambda url, deadline: fetch_download_link_async(
+                    session, url, deadline, 0.1, 0.2
+                ),
+                lambda url, deadline: asyncio.to_thread(
+                    fetch_download_link, url, 100, 0.1, 0.2, deadline
+                ),
+            ]
+            cases = [(1, 0.0, "MISSING"), (0.5, 5.0, "PRICES"), (0, 5.0, "PRICES")]
+            for poll in pollers:
+                for deadline, delay, table in cases:
+                    server.delay = delay
+                    start = time.perf_counter()
+                    try:
+                        await poll(server.table_url(table), deadline)
+                    except TimeoutError:
+                        pass
+                    else:
+                        raise AssertionError("Polling did not give up at the deadline")
+                    assert time.perf_counter() - start < deadline + 0.5
+    finally:
+        await server.stop()
+
+    print(f"fetch_and_download_tables_async: {len(tables)} tables")
+    print(f"  poll + download           {seconds:8.3f}s")
+    print(f"  export requests           {sum(server.requests.values()):8d}")
+
+
+class FakeFileServer:
+    """
+    A local stand-in for the host of a bulk download, such as S3.
+
+    Serves ``data`` with an MD5 ETag and honours ``Range`` and ``If-Range``,
+    answering 416 for a range past the end. The first ``drops`` responses
+    close the connection halfway through the body, and the next ``stalls``
+    stop sending halfway through for ``stall`` seconds, or until the server
+    is stopped.
+    """
+
+    def __init__(self, data, drops=0, stalls=0, stall=5.0):
+        self.data = data
+        self.etag = f'"{hashlib.md5(data).hexdigest()}"'
+        self.drops = drops
+        self.stalls = stalls
+        self.stall = stall
+        self.ranges = []
+        self.stopped = asyncio.Event()
+        self.app = web.Application()
+        self.app.router.add_get("/{name}", self.file)
+        self.runner = web.AppRunner(self.app)
+        self.url = None
+
+    async def start(self):
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        port = self.runner.addresses[0][1]
+        self.url = f"http://127.0.0.1:{port}/{{}}"
+
+    async def stop(self):
+        self.stopped.set()
+        await self.runner.cleanup()
+
+    async def file(self, request):
+        range_header = request.headers.get("Range")
+        self.ranges.append(range_header)
+
+        offset = 0
+        if range_header is not None and request.headers.get("If-Range") in (
+            None,
+            self.etag,
+        ):
+            offset = int(range_header.removeprefix("bytes=").rstrip("-"))
+            if offset >= len(self.data):
+                return web.Response(
+                    status=416,
+                    headers={"Content-Range": f"bytes */{len(self.data)}"},
+                )
+
+        body = self.data[offset:]
+        resp = web.StreamResponse(status=206 if offset else 200)
+        resp.headers["ETag"] = self.etag
+        resp.headers["Accept-Ranges"] = "bytes"
+        if offset:
+            resp.headers["Content-Range"] = (
+                f"bytes {offset}-{len(self.data) - 1}/{len(self.data)}"
+            )
+        resp.content_length = len(body)
+        await resp.prepare(request)
+
+        if self.drops or self.stalls:
+            await resp.write(body[: len(body) // 2])
+            if self.drops:
+                self.drops -= 1
+                request.transport.close()
+                return resp
+            self.stalls -= 1
+            try:
+                await asyncio.wait_for(self.stopped.wait(), self.stall)
+            except asyncio.TimeoutError:
+                pass
+            return resp
+
+        await resp.write(body)
+        await resp.write_eof()
+        return resp
+
+
+async def bench_download_to_file(n_bytes=8 * 1024 * 1024):
+    """
+    Download a file from a ``FakeFileServer`` that drops or stalls the
+    transfer halfway, and check that the download resumes from the bytes on
+    disk to the same file and MD5. Also checks that a finished partial file
+    is recognised by its 416, that a partial file of another version is
+    replaced, and that a checksum mismatch is raised.
+    """
+    data = np.random.default_rng(0).bytes(n_bytes)
+    md5 = hashlib.md5(data).hexdigest()
+
+    def read(path):
+        with open(path, "rb") as f:
+            return f.read()
+
+    async def download(server, path, **kwargs):
+        return await asyncio.to_thread(
+            download_to_file,
+            server.url.format(os.path.basename(path)),
+            path,
+            1024 * 1024,
+            **kwargs,
+        )
+
+    timings = {}
+    with tempfile.TemporaryDirectory() as download_dir:
+        cases = [
+            ("dropped", dict(drops=1), {}),
+            ("stalled", dict(stalls=1, stall=60.0), dict(timeout=(1, 0.5))),
+        ]
+        for name, server_kwargs, download_kwargs in cases:
+            server = FakeFileServer(data, **server_kwargs)
+            await server.start()
+            try:
+                path = os.path.join(download_dir, f"{name}.zip")
+                start = time.perf_counter()
+                assert await download(server, path, **download_kwargs) == path
+                timings[name] = time.perf_counter() - start
+                # Resumed after the read timeout, not when the server resumed
+                assert timings[name] < 10
+            finally:
+                await server.stop()
+            assert read(path) == data
+            assert hashlib.md5(read(path)).hexdigest() == md5
+            assert not os.path.exists(f"{path}.part")
+            # The second request resumes from the bytes written by the first
+            offset = int(server.ranges[1].removeprefix("bytes=").rstrip("-"))
+            assert server.ranges[0] is None and 0 < offset < n_bytes, server.ranges
+
+        server = FakeFileServer(data)
+        await server.start()
+        try:
+            # A previous run wrote every byte but stopped before the rename
+            path = os.path.join(download_dir, "finished.zip")
+            with open(f"{path}.part", "wb") as f:
+                f.write(data)
+            with open(f"{path}.part.etag", "w") as f:
+                f.write(server.etag)
+            await download(server, path)
+            assert read(path) == data and server.ranges == [f"bytes={n_bytes}-"]
+
+            # The file changed since the partial download, so it starts over
+            server.ranges.clear()
+            path = os.path.join(download_dir, "changed.zip")
+            with open(f"{path}.part", "wb") as f:
+                f.write(data[::-1][: n_bytes // 2])
+            with open(f"{path}.part.etag", "w") as f:
+                f.write('"stale"')
+            await download(server, path)
+            assert read(path) == data and len(server.ranges) == 1
+
+            path = os.path.join(download_dir, "corrupt.zip")
+            try:
+                await download(server, path, md5="0" * 32)
+            except ValueError:
+                pass
+            else:
+                raise AssertionError("A checksum mismatch was not raised")
+            assert not os.path.exists(path) and not os.path.exists(f"{path}.part")
+        finally:
+            await server.stop()
+
+    print(f"download_to_file: {n_bytes:,} bytes")
+    for name, seconds in timings.items():
+        print(f"  {name + ' and resumed':<26}{seconds:8.3f}s")
+
+
+if __name__ == "__main__":
+    bench_parse_pricing_and_vol()
+    bench_load_data_table()
+    asyncio.run(bench_fetch_and_download_tables())
+    asyncio.run(bench_download_to_file())
@@ -0,0 +1,165 @@
+# Benchmarks for the factor cache in factor_cache.py, on a synthetic bundle
+#
+# HOW TO USE:
+# python bench_factor_cache.py
+
+import os
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from bench_momentum_backtest import SYNTHETIC_END, SYNTHETIC_START, synthetic_bundle
+from factor_cache import FactorCache, factor_key
+
+
+def momentum_terms():
+    """The notebook's factors, as passed to ``FactorCache.dataset``."""
+    from zipline.pipeline.data import USEquityPricing
+    from zipline.pipeline.factors import AverageDollarVolume, CustomFactor, Returns
+
+    class MomentumFactor(CustomFactor):
+        inputs = [USEquityPricing.close, Returns(window_length=126)]
+        window_length = 252
+
+        def compute(self, today, assets, out, prices, returns):
+            out[:] = (
+                (prices[-21] - prices[-252]) / prices[-252]
+                - (prices[-1] - prices[-21]) / prices[-21]
+            ) / np.nanstd(returns, axis=0)
+
+    return dict(
+        momentum=MomentumFactor(),
+        dollar_volume=AverageDollarVolume(window_length=21),
+    )
+
+
+def check_run_algorithm(cache, Factors, terms, bundle, start, end):
+    """
+    Run an algorithm with the cached columns served through ``custom_loader``
+    and check that its pipeline output equals computing the factors.
+    """
+    from zipline import run_algorithm
+    from zipline.api import attach_pipeline, pipeline_output
+    from zipline.pipeline import Pipeline
+
+    outputs = []
+
+    def initialize(context):
+        attach_pipeline(Pipeline(terms), "computed")
+        attach_pipeline(
+            Pipeline(
+                {name: getattr(Factors, name).latest for name in terms},
+            ),
+            "cached",
+        )
+
+    def before_trading_start(context, data):
+        outputs.append((pipeline_output("computed"), pipeline_output("cached")))
+
+    run_algorithm(
+        start=pd.Timestamp(start),
+        end=pd.Timestamp(end),
+        initialize=initialize,
+        before_trading_start=before_trading_start,
+        capital_base=100_000,
+        bundle=bundle,
+        custom_loader=cache.loaders,
+    )
+    for computed, cached in outputs:
+        assert cached.notna().any().all()
+        pd.testing.assert_frame_equal(cached, computed, check_exact=False, rtol=1e-9)
+    return len(outputs)
+
+
+def register_synthetic_bundle(seed):
+    """Register ``synthetic_bundle`` as ``"synthetic"`` on its sessions."""
+    from zipline.data import bundles
+
+    bundles.register(
+        "synthetic",
+        synthetic_bundle(seed=seed),
+        "XNYS",
+        pd.Timestamp(SYNTHETIC_START),
+        pd.Timestamp(SYNTHETIC_END),
+    )
+
+
+def bench_factor_cache(start="2019-10-01", end="2020-12-31"):
+    """
+    Time filling the factor cache of a synthetic bundle, reading it back,
+    and computing the same factors in a pipeline. Checks that a reopened
+    cache serves the stored values without recomputing them, that the
+    cached columns equal the factors in a pipeline and in ``run_algorithm``,
+    and that re-ingesting the bundle replaces the cache.
+    """
+    from zipline.data import bundles
+
+    with tempfile.TemporaryDirectory() as root:
+        os.environ["ZIPLINE_ROOT"] = root
+        cache_dir = Path(root, "factor_cache")
+        try:
+            register_synthetic_bundle(seed=1)
+            bundles.ingest("synthetic")
+            terms = momentum_terms()
+            paths = [Path(f"{factor_key(term)}.npy") for term in terms.values()]
+
+            # Miss: the factors are computed over every session and stored
+            timer = time.perf_counter()
+            cache = FactorCache("synthetic", cache_dir)
+            Factors = cache.dataset(**terms)
+            miss_seconds = time.perf_counter() - timer
+            first_dir = cache.cache_dir
+            assert cache.computed == {factor_key(term) for term in terms.values()}
+            stored = {path: (first_dir / path).stat().st_mtime_ns for path in paths}
+
+            timer = time.perf_counter()
+            cache.check(Factors, start, end, **terms)
+            check_seconds = time.perf_counter() - timer
+
+            # Hit: a new cache of the same ingestion reads the stored values
+            timer = time.perf_counter()
+            cache = FactorCache("synthetic", cache_dir)
+            Factors = cache.dataset(**terms)
+            hit_seconds = time.perf_counter() - timer
+            assert cache.cache_dir == first_dir and not cache.computed
+            assert {
+                path: (first_dir / path).stat().st_mtime_ns for path in paths
+            } == stored, "Cached factors were recomputed."
+            cache.check(Factors, start, end, **terms)
+
+            timer = time.perf_counter()
+            sessions = check_run_algorithm(
+                cache, Factors, terms, "synthetic", start, end
+            )
+            algorithm_seconds = time.perf_counter() - timer
+            old_values = cache.values(factor_key(terms["momentum"])).copy()
+
+            # Invalidation: re-ingesting other prices starts a new cache,
+            # deleting the old one, and the factors follow the new prices
+            bundles.unregister("synthetic")
+            register_synthetic_bundle(seed=2)
+            bundles.ingest("synthetic")
+            cache = FactorCache("synthetic", cache_dir)
+            assert cache.cache_dir != first_dir and not first_dir.exists()
+            assert not any((cache.cache_dir / path).exists() for path in paths)
+            Factors = cache.dataset(**terms)
+            cache.check(Factors, start, end, **terms)
+            new_values = cache.values(factor_key(terms["momentum"]))
+            assert not np.allclose(new_values, old_values, equal_nan=True)
+        finally:
+            bundles.unregister("synthetic")
+            del os.environ["ZIPLINE_ROOT"]
+
+    print(f"factor cache: synthetic bundle, {len(cache.sessions)} sessions")
+    print(f"  miss (compute and store)   {miss_seconds:8.4f}s")
+    print(f"  hit (reopen and map)       {hit_seconds:8.4f}s")
+    print(f"  check against pipeline     {check_seconds:8.4f}s")
+    print(f"  run_algorithm              {algorithm_seconds:8.4f}s")
+    print(f"  sessions compared          {sessions:8d}")
+
+
+if __name__ == "__main__":
+    bench_factor_cache()
@@ -0,0 +1,80 @@
+# Benchmarks for the FX adjusted returns in fx_returns.py
+#
+# HOW TO USE:
+# python bench_fx_returns.py
+
+import time
+
+import numpy as np
+import pandas as pd
+
+from fx_returns import RISK_FREE_RATE, FxAdjustedReturns
+
+
+def make_prices(n_assets=500, n_currencies=8, n_sessions=1250, seed=0):
+    """Build asset and FX closes on overlapping calendars, with late starts."""
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range("2019-01-01", periods=n_sessions)
+    prices = pd.DataFrame(
+        100 * np.exp(rng.normal(0, 0.015, (n_sessions, n_assets)).cumsum(axis=0)),
+        index=dates,
+        columns=[f"S{i:04d}" for i in range(n_assets)],
+    )
+    starts = rng.integers(0, n_sessions // 2, n_assets)
+    prices = prices.mask(np.arange(n_sessions)[:, None] < starts)
+
+    # FX trades on a slightly different calendar
+    fx_dates = dates[rng.random(n_sessions) > 0.03]
+    fx = pd.DataFrame(
+        np.exp(rng.normal(0, 0.005, (len(fx_dates), n_currencies)).cumsum(axis=0)),
+        index=fx_dates,
+        columns=[f"C{i}" for i in range(n_currencies)],
+    )
+    return prices, fx
+
+
+def pair_stats(prices, fx):
+    """The statistics of each pair computed as in nzd_adjusted_returns.py."""
+    sharpe = pd.DataFrame(index=prices.columns, columns=fx.columns, dtype=float)
+    total = sharpe.copy()
+    correlation = sharpe.copy()
+    for asset in prices.columns:
+        for currency in fx.columns:
+            df = pd.merge(
+                prices[asset], fx[currency], left_index=True, right_index=True
+            )
+            fx_adj_close = df[asset] * df[currency]
+            asset_return = df[asset].pct_change(fill_method=None)
+            fx_return = df[currency].pct_change(fill_method=None)
+            fx_adj_return = fx_adj_close.pct_change(fill_method=None)
+            sharpe.loc[asset, currency] = (
+                fx_adj_return.mean() - RISK_FREE_RATE
+            ) / fx_adj_return.std()
+            total.loc[asset, currency] = (1 + fx_adj_return).prod() - 1
+            correlation.loc[asset, currency] = asset_return.corr(fx_return)
+    return sharpe, total, correlation
+
+
+def bench_fx_returns(n_assets=500, n_currencies=8, n_sessions=1250):
+    """Check ``FxAdjustedReturns`` against the per pair pandas version."""
+    prices, fx = make_prices(n_assets, n_currencies, n_sessions)
+
+    start = time.perf_counter()
+    expected = pair_stats(prices, fx)
+    pandas_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    adjusted = FxAdjustedReturns(prices, fx)
+    actual = adjusted.sharpe(), adjusted.total_returns(), adjusted.fx_correlation()
+    batched_seconds = time.perf_counter() - start
+
+    for e, a in zip(expected, actual):
+        pd.testing.assert_frame_equal(e, a, rtol=1e-8)
+
+    print(f"FX adjusted stats: {n_assets} assets x {n_currencies} currencies")
+    print(f"  per pair pandas           {pandas_seconds:8.3f}s")
+    print(f"  FxAdjustedReturns         {batched_seconds:8.3f}s")
+
+
+if __name__ == "__main__":
+    bench_fx_returns()
@@ -0,0 +1,125 @@
+# Benchmarks for the vectorized momentum factor in momentum.py
+#
+# HOW TO USE:
+# python bench_momentum.py
+
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from momentum import MomentumScorer, momentum, momentum_factor, momentum_long
+
+
+def make_prices(n_symbols=500, n_sessions=1500, seed=0):
+    """Build a long (symbol, date) frame of closes like the notebooks load."""
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range("2015-01-01", periods=n_sessions, name="date")
+    close = 100 * np.exp(rng.normal(0, 0.02, (n_sessions, n_symbols)).cumsum(axis=0))
+    close = pd.DataFrame(
+        close, index=dates, columns=[f"S{i:04d}" for i in range(n_symbols)]
+    )
+
+    # Stagger the first trading day of each symbol
+    starts = rng.integers(0, n_sessions // 2, n_symbols)
+    for column, start in zip(close.columns, starts):
+        close.iloc[:start, close.columns.get_loc(column)] = np.nan
+
+    prices = close.rename_axis(columns="symbol").stack().rename("close").to_frame()
+    return prices.reorder_levels(["symbol", "date"]).sort_index()
+
+
+def rolling_momentum(prices):
+    """The notebooks' rolling apply of ``momentum`` per symbol."""
+    factor = (
+        prices.groupby("symbol", group_keys=False).rolling(252).close.apply(momentum)
+    )
+    factor.index = factor.index.droplevel(0)
+    return factor.reindex(prices.index)
+
+
+def bench_momentum(n_symbols=20, n_sessions=800, universe=(3000, 2500)):
+    """
+    Validate ``momentum_long`` against the rolling apply, also with dates
+    missing for some symbols, and time both.
+    """
+    prices = make_prices(n_symbols, n_sessions)
+
+    start = time.perf_counter()
+    expected = rolling_momentum(prices)
+    rolling_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    actual = momentum_long(prices)
+    vectorized_seconds = time.perf_counter() - start
+
+    pd.testing.assert_series_equal(expected, actual, check_names=False, rtol=1e-9)
+
+    # Drop a few rows of half the symbols, so their windows span the gaps
+    rng = np.random.default_rng(1)
+    symbols = prices.index.get_level_values("symbol")
+    gapped = symbols.isin(symbols.unique()[::2]) & (rng.random(len(prices)) < 0.02)
+    prices = prices[~gapped]
+    pd.testing.assert_series_equal(
+        rolling_momentum(prices), momentum_long(prices), check_names=False, rtol=1e-9
+    )
+
+    print(f"momentum: {n_symbols} symbols x {n_sessions} sessions")
+    print(f"  rolling().apply(momentum) {rolling_seconds:8.3f}s")
+    print(f"  momentum_long             {vectorized_seconds:8.3f}s")
+
+    n_symbols, n_sessions = universe
+    close = make_prices(n_symbols, n_sessions).close.unstack(level=0)
+    start = time.perf_counter()
+    momentum_factor(close)
+    print(f"momentum_factor: {n_symbols} symbols x {n_sessions} sessions")
+    print(f"  momentum_factor           {time.perf_counter() - start:8.3f}s")
+
+
+def bench_momentum_scorer(n_symbols=3000, n_sessions=600):
+    """
+    Check a ``MomentumScorer`` fed one day at a time against
+    ``momentum_factor``, across a save and load and with zero closes, and
+    time a daily update.
+    """
+    close = make_prices(n_symbols, n_sessions).close.unstack(level=0).sort_index()
+    # Zero closes, one leaving the vol window and one inside it, whose next
+    # returns are infinite
+    close.iloc[-130, 0] = 0.0
+    close.iloc[-50, 1] = 0.0
+    close.iloc[-50, 2] = 0.0
+    close.iloc[-49, 2] = 0.0
+    expected = momentum_factor(close)
+
+    scorer = MomentumScorer.from_close(close.iloc[:-2])
+    scores = scorer.update(close.iloc[-2])
+    pd.testing.assert_series_equal(
+        scores.momentum.sort_index(),
+        expected.iloc[-2].dropna(),
+        check_names=False,
+        rtol=1e-9,
+    )
+
+    path = os.path.join(tempfile.mkdtemp(), "momentum.npz")
+    scorer.save(path)
+    scorer = MomentumScorer.load(path)
+
+    start = time.perf_counter()
+    scores = scorer.update(close.iloc[-1])
+    seconds = time.perf_counter() - start
+    pd.testing.assert_series_equal(
+        scores.momentum.sort_index(),
+        expected.iloc[-1].dropna(),
+        check_names=False,
+        rtol=1e-9,
+    )
+
+    print(f"MomentumScorer.update: {n_symbols} symbols")
+    print(f"  one day                   {seconds:8.3f}s")
+
+
+if __name__ == "__main__":
+    bench_momentum()
+    bench_momentum_scorer()
@@ -0,0 +1,424 @@
+# Benchmarks for the vectorized momentum backtest in momentum_backtest.py
+#
+# HOW TO USE:
+# python bench_momentum_backtest.py
+#
+# This also cross-checks the backtest against run_algorithm on a synthetic
+# bundle. To cross-check on an ingested bundle too:
+# python bench_momentum_backtest.py quotemedia 2020-01-01 2022-12-31
+
+import math
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from cross_section import top
+from momentum_backtest import (
+    CAPITAL_BASE,
+    COST_PER_SHARE,
+    DOLLAR_VOLUME,
+    MIN_TRADE_COST,
+    N_LONGS,
+    PRICE_IMPACT,
+    VOLUME_LIMIT,
+    average_dollar_volume,
+    backtest,
+    load_bundle_arrays,
+    momentum_factor,
+    pipeline_assets,
+    rebalance_days,
+    sweep,
+    target_weights,
+)
+
+
+SYNTHETIC_START = "2018-01-02"
+SYNTHETIC_END = "2020-12-31"
+
+
+def make_market(n_assets=3000, n_sessions=1000, seed=0, log_dollar_volume=17):
+    """
+    Build closes and volumes with late listings, delistings and dollar
+    volumes unrelated to the price level, lognormal around
+    ``log_dollar_volume``.
+    """
+    rng = np.random.default_rng(seed)
+    index = pd.bdate_range("2019-01-01", periods=n_sessions)
+    columns = [f"S{i:04d}" for i in range(n_assets)]
+    returns = rng.normal(0.0003, 0.02, (n_sessions, n_assets))
+    close = pd.DataFrame(50 * np.exp(np.cumsum(returns, axis=0)), index, columns)
+    for i in range(0, n_assets, 50):
+        close.iloc[: rng.integers(0, n_sessions // 2), i] = np.nan
+    for i in range(7, n_assets, 60):
+        close.iloc[rng.integers(n_sessions // 3, n_sessions) :, i] = np.nan
+    dollars = rng.lognormal(log_dollar_volume, 1, n_assets) * rng.lognormal(0, 0.3, close.shape)
+    volume = (dollars / close).round()
+    return close, volume
+
+
+def reference_backtest(close, volume, weights, rebalance):
+    """
+    The same strategy as ``backtest``, one Python object per order and one
+    row at a time, following our reading of how Zipline's blotter,
+    ``VolumeShareSlippage`` and ``PerShare`` process them.
+    """
+    close = close.to_numpy()
+    volume = volume.to_numpy()
+    weights = weights.to_numpy()
+    valid = np.isfinite(close)
+    first = np.where(valid.any(axis=0), valid.argmax(axis=0), len(close))
+    last = len(close) - 1 - valid[::-1].argmax(axis=0)
+    last[~valid.any(axis=0)] = -1
+
+    cash = CAPITAL_BASE
+    shares = {}
+    prices = {}
+    orders = {}
+    values = []
+    for t in range(len(close)):
+        for i in list(shares):
+            if t == last[i] + 1:
+                cash += shares.pop(i) * prices[i]
+                orders.pop(i, None)
+
+        for i, order in list(orders.items()):
+            price, bar_volume = close[t, i], volume[t, i]
+            if not bar_volume > 0 or math.isnan(price):
+                continue
+            amount = int(min(VOLUME_LIMIT * bar_volume, abs(order["open"])))
+            if amount < 1:
+                continue
+            share = min(amount / bar_volume, VOLUME_LIMIT)
+            direction = math.copysign(1, order["open"])
+            fill_price = price + share**2 * direction * PRICE_IMPACT * price
+            amount *= direction
+
+            additional = abs(amount * COST_PER_SHARE)
+            if order["commission"] == 0:
+                fee = max(MIN_TRADE_COST, additional)
+            else:
+                total = abs(order["filled"] * COST_PER_SHARE) + additional
+                fee = 0 if total < MIN_TRADE_COST else total - order["commission"]
+            order["filled"] += amount
+            order["open"] -= amount
+            order["commission"] += fee
+            if order["open"] == 0:
+                del orders[i]
+
+            shares[i] = shares.get(i, 0) + amount
+            cash -= amount * fill_price + fee
+
+        for i in np.flatnonzero(valid[t]):
+            prices[i] = close[t, i]
+        portfolio_value = cash + sum(n * prices[i] for i, n in shares.items())
+
+        if rebalance[t]:
+            targets = set(np.flatnonzero(weights[t])) | set(shares)
+            for i in sorted(targets):
+                if not first[i] <= t <= last[i] or i in orders:
+                    continue
+                target = weights[t, i] * portfolio_value / prices[i]
+                amount = target - shares.get(i, 0)
+                if abs(amount - round(amount)) < 1e-4:
+                    amount = round(amount)
+                amount = int(amount)
+                if amount != 0:
+                    orders[i] = {"open": amount, "filled": 0, "commission": 0}
+        values.append(portfolio_value)
+    return np.array(values)
+
+
+def compare_with_zipline(
+    bundle, start, end, n_longs=N_LONGS, universe=DOLLAR_VOLUME
+):
+    """
+    Run the notebook's algorithm with ``run_algorithm`` and the vectorized
+    backtest on the same bundle, and print how far their portfolio values
+    drift apart. Zipline trades unadjusted prices, so splits and dividends
+    add differences the vectorized backtest, on adjusted prices, doesn't
+    model.
+
+    Returns
+    -------
+    difference : pd.Series
+        The relative difference of the portfolio values by session.
+    """
+    from zipline import run_algorithm
+    from zipline.api import (
+        attach_pipeline,
+        calendars,
+        date_rules,
+        get_open_orders,
+        order_target_percent,
+        pipeline_output,
+        schedule_function,
+        set_commission,
+        set_slippage,
+        time_rules,
+    )
+    from zipline.finance import commission, slippage
+    from zipline.pipeline import Pipeline
+    from zipline.pipeline.data import USEquityPricing
+    from zipline.pipeline.factors import AverageDollarVolume, CustomFactor, Returns
+
+    class MomentumFactor(CustomFactor):
+        inputs = [USEquityPricing.close, Returns(window_length=126)]
+        window_length = 252
+
+        def compute(self, today, assets, out, prices, returns):
+            out[:] = (
+                (prices[-21] - prices[-252]) / prices[-252]
+                - (prices[-1] - prices[-21]) / prices[-21]
+            ) / np.nanstd(returns, axis=0)
+
+    def initialize(context):
+        momentum = MomentumFactor()
+        pipeline = Pipeline(
+            columns={
+                "longs": momentum.top(n_longs),
+                "shorts": momentum.bottom(n_longs),
+            },
+            screen=AverageDollarVolume(window_length=21).top(universe),
+        )
+        attach_pipeline(pipeline, "factor_pipeline")
+        schedule_function(
+            rebalance,
+            date_rules.week_start(),
+            time_rules.market_open(),
+            calendar=calendars.US_EQUITIES,
+        )
+        set_commission(
+            us_equities=commission.PerShare(
+                cost=COST_PER_SHARE, min_trade_cost=MIN_TRADE_COST
+            )
+        )
+        set_slippage(
+            us_equities=slippage.VolumeShareSlippage(
+                volume_limit=VOLUME_LIMIT, price_impact=PRICE_IMPACT
+            )
+        )
+
+    def before_trading_start(context, data):
+        context.factor_data = pipeline_output("factor_pipeline")
+
+    def rebalance(context, data):
+        factor_data = context.factor_data
+        longs = factor_data.index[factor_data.longs]
+        shorts = factor_data.index[factor_data.shorts]
+        divest = set(context.portfolio.positions) - set(longs.union(shorts))
+        targets = ((divest, 0), (longs, 1 / n_longs), (shorts, -1 / n_longs))
+        for assets, target in targets:
+            for asset in assets:
+                if data.can_trade(asset) and not get_open_orders(asset):
+                    order_target_percent(asset, target)
+
+    timer = time.perf_counter()
+    perf = run_algorithm(
+        start=pd.Timestamp(start),
+        end=pd.Timestamp(end),
+        initialize=initialize,
+        before_trading_start=before_trading_start,
+        capital_base=CAPITAL_BASE,
+        bundle=bundle,
+    )
+    zipline_seconds = time.perf_counter() - timer
+
+    timer = time.perf_counter()
+    warm_up = pd.Timestamp(start) - pd.DateOffset(years=2)
+    close, volume = load_bundle_arrays(bundle, warm_up, end)
+    load_seconds = time.perf_counter() - timer
+
+    timer = time.perf_counter()
+    assets = pipeline_assets(close)
+    screen = top(average_dollar_volume(close, volume).where(assets), universe)
+    factor = momentum_factor(close).where(assets)
+    weights = target_weights(factor, screen, n_longs, n_longs)
+    trading = close.index >= pd.Timestamp(start)
+    vectorized, _ = backtest(
+        close[trading],
+        volume[trading],
+        weights[trading],
+        rebalance_days(close.index)[trading],
+    )
+    vectorized_seconds = time.perf_counter() - timer
+
+    zipline_value = perf.portfolio_value.to_numpy()
+    difference = pd.Series(
+        np.abs(vectorized.portfolio_value.to_numpy() / zipline_value - 1),
+        index=vectorized.index,
+    )
+    print(f"zipline cross-check: {bundle} {start} to {end}")
+    print(f"  run_algorithm              {zipline_seconds:8.4f}s")
+    print(f"  load_bundle_arrays         {load_seconds:8.4f}s")
+    print(f"  vectorized backtest        {vectorized_seconds:8.4f}s")
+    print(f"  max value difference       {difference.max():8.4%}")
+    print(f"  final value difference     {difference.iloc[-1]:8.4%}")
+    return difference
+
+
+def synthetic_bundle(
+    n_assets=120,
+    start=SYNTHETIC_START,
+    end=SYNTHETIC_END,
+    seed=0,
+    log_dollar_volume=15,
+):
+    """
+    A bundle ingest function writing the closes and volumes of
+    ``make_market`` on the sessions from ``start`` to ``end``, each asset
+    from its first bar to its last, without splits or dividends. Dollar
+    volumes are low enough that the volume limit splits orders over several
+    sessions.
+    """
+
+    def ingest(
+        environ,
+        asset_db_writer,
+        minute_bar_writer,
+        daily_bar_writer,
+        adjustment_writer,
+        calendar,
+        start_session,
+        end_session,
+        cache,
+        show_progress,
+        output_dir,
+    ):
+        sessions = calendar.sessions_in_range(start, end)
+        close, volume = make_market(n_assets, len(sessions), seed, log_dollar_volume)
+        close.index = volume.index = sessions
+        # Delist more assets over the last year, so some are held when their
+        # positions are auto closed
+        rng = np.random.default_rng(seed)
+        for i in range(3, n_assets, 10):
+            close.iloc[len(sessions) - rng.integers(1, 252) :, i] = np.nan
+        listed = close.notna()
+        first = listed.idxmax()
+        last = listed[::-1].idxmax()
+        asset_db_writer.write(
+            equities=pd.DataFrame(
+                {
+                    "symbol": close.columns,
+                    "start_date": first.to_numpy(),
+                    "end_date": last.to_numpy(),
+                    "auto_close_date": (last + pd.Timedelta(days=1)).to_numpy(),
+                    "exchange": "SYNTHETIC",
+                }
+            ),
+            exchanges=pd.DataFrame(
+                {"exchange": ["SYNTHETIC"], "country_code": ["US"]}
+            ),
+        )
+        daily_bar_writer.write(
+            (
+                sid,
+                pd.DataFrame(
+                    {
+                        "open": close[symbol],
+                        "high": close[symbol],
+                        "low": close[symbol],
+                        "close": close[symbol],
+                        "volume": volume[symbol],
+                    }
+                ).loc[first[symbol] : last[symbol]],
+            )
+            for sid, symbol in enumerate(close.columns)
+        )
+        adjustment_writer.write()
+
+    return ingest
+
+
+def check_synthetic_bundle(start="2019-10-01", end="2020-12-31", rtol=1e-9):
+    """
+    Ingest ``synthetic_bundle`` into a temporary Zipline root and check the
+    vectorized backtest's portfolio values against ``run_algorithm`` within
+    ``rtol`` on every session.
+
+    Both read the same bars, without adjustments, so they agree to rounding.
+    The backtest starts mid-week, trades longs and shorts whose orders fill
+    over several sessions, and holds a short through its auto close.
+    """
+    from zipline.data import bundles
+
+    with tempfile.TemporaryDirectory() as root:
+        os.environ["ZIPLINE_ROOT"] = root
+        try:
+            bundles.register(
+                "synthetic",
+                synthetic_bundle(seed=1),
+                "XNYS",
+                pd.Timestamp(SYNTHETIC_START),
+                pd.Timestamp(SYNTHETIC_END),
+            )
+            bundles.ingest("synthetic")
+            difference = compare_with_zipline(
+                "synthetic", start, end, n_longs=10, universe=60
+            )
+        finally:
+            bundles.unregister("synthetic")
+            del os.environ["ZIPLINE_ROOT"]
+    assert difference.max() < rtol, f"Values differ from {difference.idxmax()}"
+
+
+def bench_momentum_backtest(n_assets=3000, n_sessions=1000, warm_up=252):
+    """
+    Time one backtest and a sweep of variants, checking the portfolio values
+    against ``reference_backtest``.
+    """
+    close, volume = make_market(n_assets, n_sessions)
+    trading = slice(close.index[warm_up], None)
+
+    start = time.perf_counter()
+    assets = pipeline_assets(close)
+    factor = momentum_factor(close).where(assets)
+    screen = top(average_dollar_volume(close, volume).where(assets), DOLLAR_VOLUME)
+    factor_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    weights = target_weights(factor, screen)
+    weights_seconds = time.perf_counter() - start
+
+    rebalance = rebalance_days(close.index)[warm_up:]
+    args = close[trading], volume[trading], weights[trading], rebalance
+    backtest(*args)
+    start = time.perf_counter()
+    perf, _ = backtest(*args)
+    backtest_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    expected = reference_backtest(*args)
+    reference_seconds = time.perf_counter() - start
+    np.testing.assert_allclose(perf.portfolio_value, expected, rtol=1e-9)
+    assert (perf.commission > 0).any() and (perf.short_value < 0).any()
+
+    start = time.perf_counter()
+    results = sweep(
+        close,
+        volume,
+        n_longs=[10, 25, 50, 100],
+        long_windows=[126, 252],
+        short_windows=[5, 21],
+        frequencies=["daily", "week_start", "month_start"],
+        start=close.index[warm_up],
+    )
+    sweep_seconds = time.perf_counter() - start
+
+    print(f"momentum backtest: {n_assets} assets, {n_sessions} sessions")
+    print(f"  factor + screen            {factor_seconds:8.4f}s")
+    print(f"  target_weights             {weights_seconds:8.4f}s")
+    print(f"  backtest                   {backtest_seconds:8.4f}s")
+    print(f"  reference backtest         {reference_seconds:8.4f}s")
+    print(f"  sweep of {len(results)} variants      {sweep_seconds:8.4f}s")
+    print(f"  variants per minute        {len(results) * 60 / sweep_seconds:8.0f}")
+
+
+if __name__ == "__main__":
+    bench_momentum_backtest()
+    check_synthetic_bundle()
+    if len(sys.argv) == 4:
+        compare_with_zipline(*sys.argv[1:])
@@ -0,0 +1,312 @@
+# Benchmarks for the order pipeline in order_pipeline.py, against a FakeTWS
+#
+# HOW TO USE:
+# python bench_order_pipeline.py
+
+import heapq
+import itertools
+import threading
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+from ibapi.wrapper import EWrapper
+
+from ib_book import PositionBook
+from order_pipeline import ORDER_RATE, OrderPipeline
+
+
+class FakeTWS:
+    """
+    A local stand-in for the ``EClient`` side of a TWS connection, to run
+    a wrapper without an account.
+
+    Requests are answered by calling the wrapper's callbacks from the
+    thread running ``run``, as ``EClient.run`` does with the messages read
+    from the socket. Market orders fill at ``prices`` after ``fill_delay``
+    seconds and update the positions and the ``TotalCashValue`` reported to
+    later ``reqPositions`` and ``reqAccountSummary``. Orders for the
+    ``rejected`` symbols get only an error 201, as TWS sends for an order
+    it refuses.
+    """
+
+    def __init__(
+        self,
+        wrapper,
+        positions=None,
+        prices=None,
+        account="DU0000000",
+        next_order_id=1,
+        fill_delay=0.0,
+        cash=0.0,
+        rejected=(),
+    ):
+        self.wrapper = wrapper
+        self.holdings = dict(positions or {})
+        self.prices = dict(prices or {})
+        self.account = account
+        self.next_order_id = next_order_id
+        self.fill_delay = fill_delay
+        self.cash = cash
+        self.rejected = set(rejected)
+        self.placed = []
+        self.connected = False
+        # Callbacks due, as (due time, sequence, callback, args)
+        self.pending = []
+        self.sequence = itertools.count()
+        self.wakeup = threading.Condition()
+
+    def send(self, delay, callback, *args):
+        with self.wakeup:
+            due = time.monotonic() + delay
+            heapq.heappush(self.pending, (due, next(self.sequence), callback, args))
+            self.wakeup.notify()
+
+    def connect(self, host="127.0.0.1", port=7497, clientId=0):
+        self.connected = True
+        self.send(0, self.wrapper.nextValidId, self.next_order_id)
+
+    def isConnected(self):
+        return self.connected
+
+    def disconnect(self):
+        with self.wakeup:
+            self.connected = False
+            self.wakeup.notify()
+
+    def run(self):
+        while True:
+            with self.wakeup:
+                while True:
+                    if not self.connected:
+                        return
+                    wait = None
+                    if self.pending:
+                        wait = self.pending[0][0] - time.monotonic()
+                        if wait <= 0:
+                            _, _, callback, args = heapq.heappop(self.pending)
+                            break
+                    self.wakeup.wait(wait)
+            callback(*args)
+
+    def reqPositions(self):
+        for symbol, (position, avg_cost) in list(self.holdings.items()):
+            contract = SimpleNamespace(symbol=symbol, secType="STK", currency="USD")
+            self.send(
+                0, self.wrapper.position, self.account, contract, position, avg_cost
+            )
+        self.send(0, self.wrapper.positionEnd)
+
+    def reqAccountSummary(self, reqId, groupName, tags):
+        values = {"TotalCashValue": self.cash}
+        for tag in tags.split(","):
+            if tag in values:
+                self.send(
+                    0,
+                    self.wrapper.accountSummary,
+                    reqId,
+                    self.account,
+                    tag,
+                    str(values[tag]),
+                    "USD",
+                )
+        self.send(0, self.wrapper.accountSummaryEnd, reqId)
+
+    def cancelAccountSummary(self, reqId):
+        pass
+
+    def placeOrder(self, orderId, contract, order):
+        self.placed.append((time.monotonic(), orderId, contract.symbol, order))
+        if contract.symbol in self.rejected:
+            self.send(
+                0,
+                self.wrapper.error,
+                orderId,
+                201,
+                "Order rejected - reason:The contract is not available for trading",
+            )
+            return
+        quantity = order.totalQuantity
+        price = self.prices.get(contract.symbol, 100.0)
+        self.send(0, self.order_status, orderId, "Submitted", 0.0, quantity, 0.0)
+        self.send(
+            self.fill_delay,
+            self.fill,
+            orderId,
+            contract.symbol,
+            order.action,
+            quantity,
+            price,
+        )
+
+    def fill(self, order_id, symbol, action, quantity, price):
+        signed = quantity if action == "BUY" else -quantity
+        position, avg_cost = self.holdings.get(symbol, (0.0, 0.0))
+        if position >= 0 and signed > 0:
+            avg_cost = (position * avg_cost + signed * price) / (position + signed)
+        self.holdings[symbol] = (position + signed, avg_cost)
+        self.cash -= signed * price
+        self.order_status(order_id, "Filled", quantity, 0.0, price)
+
+    def order_status(self, order_id, status, filled, remaining, avg_fill_price):
+        self.wrapper.orderStatus(
+            order_id, status, filled, remaining, avg_fill_price, 0, 0, 0.0, 0, "", 0.0
+        )
+
+
+class Wrapper(EWrapper):
+    def __init__(self):
+        EWrapper.__init__(self)
+        self.book = PositionBook()
+
+    def orderStatus(
+        self,
+        orderId,
+        status,
+        filled,
+        remaining,
+        avgFillPrice,
+        permId,
+        parentId,
+        lastFillPrice,
+        clientId,
+        whyHeld,
+        mktCapPrice,
+    ):
+        self.book.on_order_status(orderId, status, filled, remaining, avgFillPrice)
+
+    def error(self, reqId, errorCode, errorString):
+        self.book.on_error(reqId, errorCode, errorString)
+
+
+def make_rebalance(n_names=500, seed=0):
+    """Build holdings, prices and a ``df_change`` trading every name."""
+    rng = np.random.default_rng(seed)
+    symbols = [f"S{i:04d}" for i in range(n_names)]
+    prices = pd.Series(rng.uniform(10, 200, n_names), index=symbols)
+    held = pd.Series(rng.integers(1, 100, n_names // 2), index=symbols[::2])
+    target = pd.Series(rng.integers(1, 100, n_names), index=symbols)
+    change = target - held.reindex(symbols).fillna(0)
+    change[change == 0] = 1
+    df_change = pd.DataFrame(
+        {
+            "buy": change.clip(lower=0),
+            "sell": (-change).clip(lower=0),
+            "last_price": prices,
+        }
+    )
+    holdings = {symbol: (float(n), prices[symbol]) for symbol, n in held.items()}
+    return df_change, holdings, prices.to_dict()
+
+
+def bench_order_pipeline(n_names=500, fill_delay=0.5):
+    """
+    Time a rebalance of ``n_names`` orders filling after ``fill_delay``
+    seconds, checking the pace and that sells go first within the cash.
+    """
+    df_change, holdings, prices = make_rebalance(n_names)
+    wrapper = Wrapper()
+    tws = FakeTWS(wrapper, positions=holdings, prices=prices, fill_delay=fill_delay)
+    tws.connect()
+    threading.Thread(target=tws.run, daemon=True).start()
+
+    # Enough cash for the buys only once the sells have filled
+    cost = (df_change.buy * df_change.last_price).sum()
+    proceeds = (df_change.sell * df_change.last_price).sum()
+    cash = cost - proceeds / 2
+
+    start = time.perf_counter()
+    report = OrderPipeline(tws, wrapper.book, 1).rebalance(df_change, cash)
+    seconds = time.perf_counter() - start
+    tws.disconnect()
+
+    placed = np.array([placed[0] for placed in tws.placed])
+    busiest = max(np.sum((placed >= t) & (placed < t + 1)) for t in placed)
+    assert busiest <= 50
+    actions = [placed[3].action for placed in tws.placed]
+    assert "SELL" not in actions[actions.index("BUY") :]
+    assert (report.Status == "Filled").all()
+    spent = (report.Filled * report["Avg fill price"])[report.Action == "BUY"].sum()
+    assert spent <= cash + proceeds + 1e-6
+
+    print(f"order pipeline: {len(report)} orders, fills after {fill_delay}s")
+    print(f"  rebalance                  {seconds:8.4f}s")
+    print(f"  at {ORDER_RATE} orders/s             {len(report) / ORDER_RATE:8.4f}s")
+    print(f"  busiest second             {busiest:8d} orders")
+    print(f"  mean fill latency          {report.Latency.mean():8.4f}s")
+    print(f"  max fill latency           {report.Latency.max():8.4f}s")
+
+
+def check_timeout(timeout=2.0):
+    """
+    Check that a rebalance whose sells never fill gives up on the buys
+    waiting for their cash after ``timeout``, and skips a buy without a
+    price.
+    """
+    wrapper = Wrapper()
+    tws = FakeTWS(
+        wrapper,
+        positions={"OLD": (10.0, 50.0)},
+        prices={"OLD": 50.0, "NEW": 100.0, "GAP": 20.0},
+        fill_delay=1e6,
+    )
+    tws.connect()
+    threading.Thread(target=tws.run, daemon=True).start()
+    df_change = pd.DataFrame(
+        {"buy": [0, 3, 2], "sell": [10, 0, 0], "last_price": [50.0, 100.0, np.nan]},
+        index=["OLD", "NEW", "GAP"],
+    )
+
+    start = time.perf_counter()
+    report = OrderPipeline(tws, wrapper.book, 1).rebalance(df_change, 0.0, timeout)
+    seconds = time.perf_counter() - start
+    tws.disconnect()
+
+    assert seconds < timeout + 1
+    skipped = report[report.Status == "NotSubmitted"]
+    assert skipped.Symbol.tolist() == ["NEW", "GAP"]
+    assert skipped.Quantity.tolist() == [3, 2]
+    print(f"  gave up after              {seconds:8.4f}s")
+
+
+def check_rejected():
+    """
+    Check that a rebalance whose sell TWS rejects with only an error, and
+    no ``orderStatus``, returns once the other orders fill rather than
+    waiting for its default timeout.
+    """
+    wrapper = Wrapper()
+    tws = FakeTWS(
+        wrapper,
+        positions={"OLD": (10.0, 50.0), "HALT": (5.0, 20.0)},
+        prices={"OLD": 50.0, "HALT": 20.0, "NEW": 100.0},
+        rejected={"HALT"},
+        fill_delay=0.1,
+    )
+    tws.connect()
+    threading.Thread(target=tws.run, daemon=True).start()
+    df_change = pd.DataFrame(
+        {"buy": [0, 0, 6], "sell": [10, 5, 0], "last_price": [50.0, 20.0, 100.0]},
+        index=["OLD", "HALT", "NEW"],
+    )
+
+    start = time.perf_counter()
+    report = OrderPipeline(tws, wrapper.book, 1).rebalance(df_change, 100.0)
+    seconds = time.perf_counter() - start
+    tws.disconnect()
+
+    assert seconds < 5
+    assert report.set_index("Symbol").Status.to_dict() == {
+        "OLD": "Filled",
+        "HALT": "Rejected",
+        "NEW": "Filled",
+    }
+    assert report.Error.notna().sum() == 1
+    print(f"  rejected sell, returned in {seconds:8.4f}s")
+
+
+if __name__ == "__main__":
+    bench_order_pipeline()
+    check_timeout()
+    check_rejected()
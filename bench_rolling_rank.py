@@ -0,0 +1,67 @@
+# Benchmarks for the rolling rank and z-score kernels in rolling_rank.py
+#
+# HOW TO USE:
+# python bench_rolling_rank.py
+
+import time
+
+import numpy as np
+import pandas as pd
+
+from rolling_rank import rolling_rank, rolling_zscore
+
+
+def make_closes(n_sessions=2500, n_symbols=200, seed=0):
+    """Build closes rounded to the cent, so windows hold ties, with gaps."""
+    rng = np.random.default_rng(seed)
+    closes = np.round(
+        50 * np.exp(rng.normal(0, 0.01, (n_sessions, n_symbols)).cumsum(axis=0)), 2
+    )
+    closes[rng.random(closes.shape) < 0.01] = np.nan
+    return pd.DataFrame(closes)
+
+
+def bench_rolling_rank(n_sessions=2500, n_symbols=200, windows=(22, 66, 252)):
+    """Check ``rolling_rank`` and ``rolling_zscore`` against pandas and time them."""
+    closes = make_closes(n_sessions, n_symbols)
+    values = closes.to_numpy()
+    # Compile the kernels before timing them
+    rolling_rank(values[:10], 2, pct=True)
+    rolling_zscore(values[:10], 2)
+
+    print(f"rolling rank(pct=True): {n_symbols} columns x {n_sessions} rows")
+    for window in windows:
+        start = time.perf_counter()
+        expected = closes.rolling(window).rank(pct=True).to_numpy()
+        pandas_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        actual = rolling_rank(values, window, pct=True)
+        kernel_seconds = time.perf_counter() - start
+
+        np.testing.assert_array_equal(expected, actual)
+        print(
+            f"  window {window:<4} pandas {pandas_seconds:8.3f}s"
+            f"  rolling_rank {kernel_seconds:8.3f}s"
+        )
+
+    print(f"rolling z-score: {n_symbols} columns x {n_sessions} rows")
+    for window in windows:
+        start = time.perf_counter()
+        roll = closes.rolling(window)
+        expected = ((closes - roll.mean()) / roll.std()).to_numpy()
+        pandas_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        actual = rolling_zscore(values, window)
+        kernel_seconds = time.perf_counter() - start
+
+        np.testing.assert_allclose(expected, actual, rtol=1e-9, atol=1e-8)
+        print(
+            f"  window {window:<4} pandas {pandas_seconds:8.3f}s"
+            f"  rolling_zscore {kernel_seconds:8.3f}s"
+        )
+
+
+if __name__ == "__main__":
+    bench_rolling_rank()
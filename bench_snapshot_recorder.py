@@ -0,0 +1,155 @@
+# Benchmarks for the snapshot recorder in snapshot_recorder.py
+#
+# HOW TO USE:
+# python bench_snapshot_recorder.py
+
+import time
+
+import numpy as np
+import pandas as pd
+
+from snapshot_recorder import SnapshotRecorder
+
+
+class Asset:
+    """Stands in for a Zipline ``Equity``, hashed by identity."""
+
+    def __init__(self, symbol):
+        self.symbol = symbol
+
+
+def make_snapshots(n_assets=3000, n_sessions=1500, n_screened=500, seed=0):
+    """
+    Build the sessions of a backtest and the ranking and price recorded at
+    the open of each week's first session, when it rebalances.
+    """
+    rng = np.random.default_rng(seed)
+    universe = [Asset(f"S{i:04d}") for i in range(n_assets)]
+    sessions = pd.bdate_range("2018-01-01", periods=n_sessions, tz="UTC")
+    week = sessions.tz_convert(None).to_period("W")
+    week_starts = sessions[np.r_[True, week[1:] != week[:-1]]]
+    rebalances = {}
+    for date in week_starts:
+        screened = np.sort(rng.choice(n_assets, n_screened, replace=False))
+        assets = [universe[i] for i in screened]
+        ranking = pd.Series(rng.permutation(n_screened) + 1.0, index=assets)
+        price = pd.Series(rng.uniform(10, 200, n_screened), index=assets)
+        rebalances[date] = ranking, price
+    return sessions, rebalances
+
+
+def record_perf(sessions, rebalances):
+    """
+    The ``factor_data`` and ``prices`` columns of ``perf`` when the
+    rebalances ``record`` them, Zipline carrying each value forward to the
+    later sessions until it is recorded again.
+    """
+    factor_data, prices = [], []
+    recorded = np.nan, np.nan
+    for date in sessions:
+        recorded = rebalances.get(date, recorded)
+        factor_data.append(recorded[0])
+        prices.append(recorded[1])
+    # perf is indexed by the session closes
+    index = sessions + pd.Timedelta(hours=21)
+    return pd.DataFrame(
+        {
+            "factor_data": pd.Series(factor_data, index, dtype=object),
+            "prices": pd.Series(prices, index, dtype=object),
+        }
+    )
+
+
+def notebook_inputs(perf):
+    """The alphalens inputs as the notebook builds them from ``perf``."""
+    prices = pd.concat(
+        [df.to_frame(d) for d, df in perf.prices.dropna().items()], axis=1
+    ).T
+    prices.columns = [col.symbol for col in prices.columns]
+    prices.index = prices.index.normalize()
+    factor_data = pd.concat(
+        [df.to_frame(d) for d, df in perf.factor_data.dropna().items()], axis=1
+    ).T
+    factor_data.columns = [col.symbol for col in factor_data.columns]
+    factor_data.index = factor_data.index.normalize()
+    factor_data = factor_data.stack()
+    factor_data.index.names = ["date", "asset"]
+    return factor_data, prices
+
+
+def bench_snapshot_recorder(n_assets=3000, n_sessions=1500):
+    """
+    Time recording and exporting the snapshots of every session against
+    building the alphalens inputs from ``record``-ed Series as the notebook
+    does.
+    """
+    sessions, rebalances = make_snapshots(n_assets, n_sessions)
+
+    recorder = SnapshotRecorder()
+    start = time.perf_counter()
+    for date in sessions:
+        # before_trading_start, then the rebalance at the open
+        recorder.record(date + pd.Timedelta(hours=13, minutes=45))
+        if date in rebalances:
+            ranking, price = rebalances[date]
+            recorder.record(
+                date + pd.Timedelta(hours=14, minutes=31), factor=ranking, price=price
+            )
+    record_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    factor, prices = recorder.alphalens_inputs()
+    export_seconds = time.perf_counter() - start
+
+    perf = record_perf(sessions, rebalances)
+    start = time.perf_counter()
+    expected_factor, expected_prices = notebook_inputs(perf)
+    notebook_seconds = time.perf_counter() - start
+
+    expected_factor.index = expected_factor.index.set_levels(
+        expected_factor.index.levels[0].tz_convert(None), level=0
+    )
+    expected_prices.index = expected_prices.index.tz_convert(None)
+    pd.testing.assert_series_equal(
+        factor.sort_index(), expected_factor.sort_index(), check_names=False
+    )
+    pd.testing.assert_frame_equal(
+        prices.sort_index(axis=1),
+        expected_prices.sort_index(axis=1).astype(np.float64),
+        check_freq=False,
+    )
+
+    print(f"alphalens inputs: {n_sessions} sessions of 500 of {n_assets} assets")
+    print(f"  record (whole backtest)    {record_seconds:8.4f}s")
+    print(f"  alphalens_inputs           {export_seconds:8.4f}s")
+    print(f"  concat + stack             {notebook_seconds:8.4f}s")
+
+
+def check_shared_symbols():
+    """
+    Export assets sharing a symbol, such as a re-listed ticker, each under
+    the symbol as the notebook's stack does.
+    """
+    delisted, relisted, other = Asset("XYZ"), Asset("XYZ"), Asset("ABC")
+    dates = pd.to_datetime(["2020-01-06", "2020-01-08"])
+
+    recorder = SnapshotRecorder()
+    recorder.record(dates[0], factor=pd.Series([1.0, 2.0], index=[delisted, other]))
+    recorder.record(dates[1], factor=pd.Series([2.0, 1.0], index=[relisted, other]))
+    factor = recorder.to_long("factor")
+
+    expected = pd.Series(
+        [1.0, 2.0, 1.0, 2.0],
+        index=pd.MultiIndex.from_arrays(
+            [dates[[0, 0, 1, 1]], ["XYZ", "ABC", "ABC", "XYZ"]],
+            names=["date", "asset"],
+        ),
+        name="factor",
+    )
+    pd.testing.assert_series_equal(factor.sort_index(), expected.sort_index())
+    print("shared symbols: ok")
+
+
+if __name__ == "__main__":
+    check_shared_symbols()
+    bench_snapshot_recorder()
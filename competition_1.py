@@ -12,16 +12,17 @@
 
 import pandas as pd
 import numpy as np
-import time
+import os
 import threading
 
 from openbb_terminal.sdk import openbb
 import riskfolio as rp
+from risk_model import EwmaCovariance
+from ib_book import PositionBook
+from order_pipeline import OrderPipeline
 
 from ibapi.client import EClient
 from ibapi.wrapper import EWrapper
-from ibapi.contract import Contract
-from ibapi.order import *
 
 from zipline.api import order_target_percent
 # https://zipline.ml4trading.io/api-reference.html#zipline.api.order_target_percent
@@ -58,27 +59,37 @@ returns = data.pct_change()[1:]
 
 returns.dropna(how="any", axis=1, inplace=True)
 
-port = rp.Portfolio(returns=returns)
-
-method_mu = "hist"
-
-method_cov = "hist"
-
-port.assets_stats(method_mu=method_mu, method_cov=method_cov, d=0.94)
+# EWMA (d=0.94) risk model, updated with the bars since the last run and
+# re-solved from yesterday's weights. A new universe rebuilds it from the
+# full history.
+risk_model_file = "risk_model.npz"
+risk_model = EwmaCovariance.load(risk_model_file) if os.path.exists(risk_model_file) else None
+if risk_model is None or not risk_model.assets.equals(returns.columns):
+    risk_model = EwmaCovariance(returns.columns, decay=0.94)
+risk_model.update(returns if risk_model.last_date is None else returns[returns.index > risk_model.last_date])
 
+port = rp.Portfolio(returns=returns)
+port.mu = returns.mean().to_frame().T
+port.cov = risk_model.covariance_frame()
 port.lowerret = 0.00008
-w_rp_c = port.rp_optimization(
-    model="Classic",
-    rm="MV",
-    hist=True,
-    rf=0.05,
-    b=None
-)
+
+# The native solver has no minimum return, so solve with riskfolio on the
+# same covariance when its weights fall short of port.lowerret
+w_rp_c = risk_model.risk_parity().to_frame()
+if returns.mean() @ w_rp_c.weights < port.lowerret:
+    w_rp_c = port.rp_optimization(
+        model="Classic",
+        rm="MV",
+        hist=True,
+        rf=0.05,
+        b=None
+    )
+risk_model.save(risk_model_file)
 
 ax = rp.plot_risk_con(
     w_rp_c,
-    cov=port.cov,
-    returns=port.returns,
+    cov=risk_model.covariance_frame(),
+    returns=returns,
     rm="MV",
     rf=0.05
 )
@@ -99,46 +110,42 @@ w_rp_c["shares"] = (w_rp_c.invest_amt / w_rp_c.last_price).astype(int)
 class IBapi(EWrapper, EClient):
     def __init__(self):
         EClient.__init__(self, self)
-        self.pos_df = pd.DataFrame(columns=['Account', 'Symbol', 'SecType',
-                                            'Currency', 'Position', 'Avg cost'])    
-        
+        # Positions by symbol and orders by id, updated by the callbacks below
+        self.book = PositionBook()
+        self.connected_event = threading.Event()
+
     def nextValidId(self, orderId):
         super().nextValidId(orderId)
         self.nextOrderId = orderId
+        self.connected_event.set()
         
     def position(self, account, contract, position, avgCost):
         super().position(account, contract, position, avgCost)
-        # self.contract = contract
-        dictionary = {"Account":account, "Symbol": contract.symbol, "SecType": contract.secType,
-                        "Currency": contract.currency, "Position": position, "Avg cost": avgCost}
-        if self.pos_df["Symbol"].str.contains(contract.symbol).any():
-            self.pos_df.loc[self.pos_df["Symbol"]==contract.symbol,"Position"] = position
-            self.pos_df.loc[self.pos_df["Symbol"]==contract.symbol,"Avg cost"] = avgCost
-        else:
-            self.pos_df = pd.concat([self.pos_df,pd.DataFrame(dictionary, index=[0])], ignore_index=True)
+        self.book.on_position(account, contract, position, avgCost)
+
+    def positionEnd(self):
+        super().positionEnd()
+        self.book.on_position_end()
+
+    def accountSummary(self, reqId, account, tag, value, currency):
+        super().accountSummary(reqId, account, tag, value, currency)
+        self.book.on_account_summary(tag, value)
+
+    def accountSummaryEnd(self, reqId):
+        super().accountSummaryEnd(reqId)
+        self.book.on_account_summary_end()
+
+    def orderStatus(self, orderId, status, filled, remaining, avgFillPrice, permId,
+                    parentId, lastFillPrice, clientId, whyHeld, mktCapPrice):
+        super().orderStatus(orderId, status, filled, remaining, avgFillPrice, permId,
+                            parentId, lastFillPrice, clientId, whyHeld, mktCapPrice)
+        self.book.on_order_status(orderId, status, filled, remaining, avgFillPrice)
+
+    def error(self, reqId, errorCode, errorString):
+        super().error(reqId, errorCode, errorString)
+        # Rejected orders may get no orderStatus, so the book marks them done
+        self.book.on_error(reqId, errorCode, errorString)
             
-def stock_contract(symbol, secType="STK", exchange="SMART", currency="USD"):
-    contract = Contract()
-    contract.symbol = symbol
-    contract.secType = secType
-    contract.exchange = exchange
-    contract.currency = currency
-
-    return contract
-
-def submit_order(contract, direction, qty=100, orderType="MKT", transmit=True):
-    order = Order()
-    order.action = direction
-    order.totalQuantity = qty
-    order.orderType = orderType
-    order.transmit = transmit
-    order.eTradeOnly = ""
-    order.firmQuoteOnly = ""
-    # submit order
-    app.placeOrder(app.nextOrderId, contract, order)
-    app.nextOrderId += 1
-
-    
 def run_loop():
     app.run()
 
@@ -149,19 +156,18 @@ app.nextOrderId = None
 api_thread = threading.Thread(target=run_loop, daemon=True)
 api_thread.start()
 
-while True:
-    if isinstance(app.nextOrderId, int):
-        print("Connected")
-        break
-    else:
-        print("Waiting")
-        time.sleep(1)
+if not app.connected_event.wait(timeout=30):
+    raise RuntimeError("Timed out waiting for nextValidId")
+print("Connected")
         
 
 
+# Wait for positionEnd rather than sleeping, then diff against one snapshot
+app.book.request_positions()
 app.reqPositions()
-time.sleep(1)
-pos_df = app.pos_df
+if not app.book.wait_for_positions(timeout=30):
+    raise RuntimeError("Timed out waiting for positions")
+pos_df = app.book.snapshot()
 
 
 df_change = (pd.merge(w_rp_c, pos_df.set_index('Symbol'),left_index=True,right_index=True, how="outer")
@@ -172,22 +178,23 @@ df_change = (pd.merge(w_rp_c, pos_df.set_index('Symbol'),left_index=True,right_i
 
 )
 
-df_buy = df_change[df_change.buy > 0]
-df_sell = df_change[df_change.sell > 0]
-
-for row in df_sell.itertuples():
-    contract = stock_contract(row.Index)
-    submit_order(contract, direction="SELL", qty=row.sell)
-
-for row in df_buy.itertuples():
-    contract = stock_contract(row.Index)
-    submit_order(contract, direction="BUY", qty=row.buy)
+# Sells first, then buys as the cash from the sells comes in, paced under
+# the TWS message limit. Buys start from the cash in the account, the sells
+# adding their proceeds as they fill.
+app.book.request_account_summary()
+app.reqAccountSummary(9001, "All", "TotalCashValue")
+if not app.book.wait_for_account_summary(timeout=30):
+    raise RuntimeError("Timed out waiting for the account summary")
+app.cancelAccountSummary(9001)
+cash = float(app.book.account["TotalCashValue"])
+pipeline = OrderPipeline(app, app.book, app.nextOrderId)
+report = pipeline.rebalance(df_change, cash=cash, timeout=300)
+app.nextOrderId = pipeline.next_order_id
+print(report[["Symbol", "Action", "Quantity", "Status", "Latency"]])
+print(report.Latency.describe())
 
 # order_target_percent(self, asset, target, limit_price=None, stop_price=None, style=None)
 
-# for row in w_rp_c.itertuples():
-#     contract = stock_contract(row.Index)
-#     submit_order(contract, direction="BUY", qty=row.shares)
 
 
 app.disconnect()
@@ -10,13 +10,21 @@
 # 2. Run the app: streamlit run crack.py
 
 # Import libraries
+import threading
 import pandas as pd
 import numpy as np
 import streamlit as st
 import plotly.graph_objects as go
+from cachetools import TTLCache
+from concurrent.futures import ThreadPoolExecutor
 from openbb_terminal.sdk import openbb
 from datetime import datetime, timedelta
 
+# Fetched series are kept for an hour, and the least recently used tickers
+# are dropped beyond this many
+CACHE_TTL = 60 * 60
+CACHE_MAX_SERIES = 64
+
 
 # Function to fetch data from OpenBB
 def fetch_data_from_openbb(ticker, start_date, end_date, expiry=None):
@@ -26,6 +34,77 @@ def fetch_data_from_openbb(ticker, start_date, end_date, expiry=None):
     return data[ticker]
 
 
+# Function to fetch a refiner's prices from OpenBB
+def fetch_stock_from_openbb(ticker, start_date, end_date):
+    return openbb.stocks.load(ticker, start_date=start_date, end_date=end_date)[
+        "Adj Close"
+    ]
+
+
+class SeriesCache:
+    """
+    Price series memoized by ticker and date range.
+
+    Each ticker keeps the series for the widest range fetched so far, so a
+    request inside it is sliced from memory and a wider request only fetches
+    the missing days at either edge. Series expire after ``ttl`` seconds and
+    the least recently used are evicted beyond ``maxsize`` tickers.
+    """
+
+    def __init__(self, fetch, maxsize=CACHE_MAX_SERIES, ttl=CACHE_TTL):
+        self.fetch = fetch
+        self.series = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.lock = threading.Lock()
+
+    def get(self, ticker, start_date, end_date):
+        start, end = pd.Timestamp(start_date), pd.Timestamp(end_date)
+        with self.lock:
+            cached = self.series.get(ticker)
+
+        if cached is None:
+            first, last = start, end
+            pieces = [self.fetch(ticker, f"{start:%Y-%m-%d}", f"{end:%Y-%m-%d}")]
+        else:
+            first, last, series = cached
+            pieces = [series]
+            # Fetch only the days outside the range already held
+            if start < first:
+                pieces.insert(
+                    0, self.fetch(ticker, f"{start:%Y-%m-%d}", f"{first:%Y-%m-%d}")
+                )
+            if end > last:
+                pieces.append(
+                    self.fetch(ticker, f"{last:%Y-%m-%d}", f"{end:%Y-%m-%d}")
+                )
+            first, last = min(first, start), max(last, end)
+
+        if cached is None or len(pieces) > 1:
+            series = pd.concat(pieces)
+            series = series[~series.index.duplicated(keep="last")].sort_index()
+            with self.lock:
+                self.series[ticker] = (first, last, series)
+
+        return series[start:end]
+
+
+# Keep the caches across the reruns of this script on every interaction
+@st.cache_resource
+def get_caches():
+    return SeriesCache(fetch_data_from_openbb), SeriesCache(fetch_stock_from_openbb)
+
+
+def load_legs(futures, stock, start_date, end_date):
+    """Fetch all the futures legs and the refiner concurrently."""
+    futures_cache, stock_cache = get_caches()
+    with ThreadPoolExecutor(max_workers=len(futures) + 1) as pool:
+        legs = [
+            pool.submit(futures_cache.get, ticker, start_date, end_date)
+            for ticker in futures
+        ]
+        refiner = pool.submit(stock_cache.get, stock, start_date, end_date)
+        return [leg.result() for leg in legs], refiner.result()
+
+
 # Streamlit App
 st.title("Modeling the Crack Spread x Refiner Trade")
 
@@ -59,24 +138,19 @@ number3 = col3_2.number_input("Contracts:", 3)
 
 ticker4 = st.text_input("Enter refiner symbol:", "PSX")
 
-# Submit button
+# Submit button. Once submitted, later changes to the inputs redraw the
+# charts from the cached series.
 if st.button("Submit"):
+    st.session_state.submitted = True
+
+if st.session_state.get("submitted"):
     # Fetch data based on tickers
-    data1 = fetch_data_from_openbb(
-        ticker1, start_date=start_date_str, end_date=end_date_str
-    )
-    data2 = fetch_data_from_openbb(
-        ticker2, start_date=start_date_str, end_date=end_date_str
-    )
-    data3 = fetch_data_from_openbb(
-        ticker3, start_date=start_date_str, end_date=end_date_str
+    (data1, data2, data3), refiner = load_legs(
+        [ticker1, ticker2, ticker3], ticker4, start_date_str, end_date_str
     )
     crack = number1 * data1 + number2 * data2 - number3 * data3
     crack_ret = np.log(crack / crack.shift(1))
 
-    refiner = openbb.stocks.load(
-        ticker4, start_date=start_date_str, end_date=end_date_str
-    )["Adj Close"]
     refiner_ret = np.log(refiner / refiner.shift(1))
 
     # Calculate the spread
@@ -0,0 +1,332 @@
+# Parameter sweep for the crack spread x refiner z-score strategy
+# -----------------------------
+# Runs the strategy of 03_refiner_crack_spread_backtest.ipynb over grids of
+# rolling windows, long and short entry and exit thresholds and refiner
+# symbols, and tabulates the Sharpe ratio, maximum drawdown and trade count
+# of every combination.
+#
+# The crack spread and the rolling ranks are computed once per (refiner,
+# window). The z-scores and refiner returns are then placed in shared memory
+# and the threshold grid is fanned out across a process pool, each worker
+# simulating a chunk of threshold combinations at once.
+#
+# bench_crack_sweep.py checks the positions, trades and statistics against
+# the notebook's signals and vectorbt's handling of them.
+
+# HOW TO USE:
+# python crack_sweep.py
+
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+import multiprocessing
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from rolling_rank import rolling_rank, rolling_zscore
+
+CRUDE = "CL=F"
+GASOLINE = "RB=F"
+HEATING_OIL = "HO=F"
+
+WINDOWS = [22]
+LONG_ENTRIES = [-2]
+LONG_EXITS = [2]
+SHORT_ENTRIES = [1.7]
+SHORT_EXITS = [1.5]
+
+TRADING_DAYS = 252
+CHUNK_SIZE = 4096
+
+
+def crack_spread(prices):
+    """
+    The 3:2:1 crack spread in dollars per barrel: long two gasoline and one
+    heating oil contract, short three crude oil contracts.
+    """
+    return 42 * (2 * prices[GASOLINE] + prices[HEATING_OIL]) - 3 * prices[CRUDE]
+
+
+def rank_spread_zscore(crack, refiners, window):
+    """
+    The trading signal: the rolling z-score of the difference between the
+    rolling percentile ranks of each refiner and of the crack spread, as
+    ``rolling(window).rank(pct=True)`` and ``rolling(window).mean()`` and
+    ``std()`` compute it in the notebook.
+
+    Parameters
+    ----------
+    crack : pd.Series
+        The crack spread.
+    refiners : pd.DataFrame
+        Refiner closes with one column per symbol, on the same index.
+    window : int
+        Length of the rolling windows.
+
+    Returns
+    -------
+    zscore : pd.DataFrame
+        The z-scores, shaped like ``refiners``.
+    """
+    crack_rank = rolling_rank(crack.to_numpy(), window, pct=True)
+    refiner_rank = rolling_rank(refiners.to_numpy(), window, pct=True)
+    rank_spread = refiner_rank - crack_rank[:, None]
+    zscore = rolling_zscore(rank_spread, window)
+    return pd.DataFrame(zscore, index=refiners.index, columns=refiners.columns)
+
+
+def simulate(
+    zscore, returns, long_entry, long_exit, short_entry, short_exit, positions=False
+):
+    """
+    Trade one z-score series under many threshold combinations at once.
+
+    The signals follow the notebook. Long entries are the days the z-score
+    crosses below ``long_entry`` and long exits the days it crosses above
+    ``long_exit``, cleaned with ``vbt.signals.clean`` so that only the first
+    entry after an exit and the first exit after an entry remain, and an
+    entry and exit on the same day cancel. Shorts are the same with crossings
+    above ``short_entry`` and below ``short_exit``, cleaned on their own.
+
+    The position is then taken as ``vbt.Portfolio.from_signals`` takes it by
+    default: a long and a short entry on the same day cancel, an entry
+    opposite to the position reverses it, even on the day of an exit, and
+    otherwise an exit closes the position. Positions are taken at the close
+    and fully invested in the refiner, shorts being rebalanced daily.
+
+    Performance is accumulated while stepping through the days, so memory
+    only grows with the number of combinations.
+
+    Parameters
+    ----------
+    zscore : np.ndarray
+        The z-score for each day.
+    returns : np.ndarray
+        The refiner's simple return for each day.
+    long_entry, long_exit, short_entry, short_exit : np.ndarray
+        One threshold of each kind per combination.
+    positions : bool
+        Also return the days x combinations positions, 1 long, -1 short and
+        0 flat, held after each day's close.
+
+    Returns
+    -------
+    stats : dict of np.ndarray
+        ``sharpe``, ``max_drawdown``, ``trades`` and ``total_return`` per
+        combination, where a trade is a position opened, so a reversal
+        closes one and opens another, and ``positions`` if asked for.
+    """
+    n = len(long_entry)
+    position = np.zeros(n)
+    # Whether the cleaned long and short signals are between entry and exit
+    long_open = np.zeros(n, dtype=bool)
+    short_open = np.zeros(n, dtype=bool)
+    equity = np.ones(n)
+    peak = np.ones(n)
+    max_drawdown = np.zeros(n)
+    sum_returns = np.zeros(n)
+    sum_squares = np.zeros(n)
+    trades = np.zeros(n, dtype=np.int64)
+    held = np.zeros((len(zscore), n)) if positions else None
+
+    for t in range(1, len(zscore)):
+        # Earn today's return on the position held from yesterday's close
+        daily = position * returns[t]
+        equity *= 1 + daily
+        np.maximum(peak, equity, out=peak)
+        np.minimum(max_drawdown, equity / peak - 1, out=max_drawdown)
+        sum_returns += daily
+        sum_squares += daily**2
+
+        previous, current = zscore[t - 1], zscore[t]
+        long_in = (current < long_entry) & (previous >= long_entry)
+        long_out = (current > long_exit) & (previous <= long_exit)
+        short_in = (current > short_entry) & (previous <= short_entry)
+        short_out = (current < short_exit) & (previous >= short_exit)
+
+        # Clean each side's signals
+        long_entries = long_in & ~long_out & ~long_open
+        long_exits = long_out & ~long_in & long_open
+        long_open = (long_open | long_entries) & ~long_exits
+        short_entries = short_in & ~short_out & ~short_open
+        short_exits = short_out & ~short_in & short_open
+        short_open = (short_open | short_entries) & ~short_exits
+
+        # Trade them
+        long_entries, short_entries = (
+            long_entries & ~short_entries,
+            short_entries & ~long_entries,
+        )
+        previous_position = position.copy()
+        position[(position > 0) & long_exits | (position < 0) & short_exits] = 0
+        position[long_entries] = 1
+        position[short_entries] = -1
+        trades += (position != 0) & (position != previous_position)
+        if positions:
+            held[t] = position
+
+    days = len(zscore) - 1
+    mean = sum_returns / days
+    std = np.sqrt(np.maximum(sum_squares / days - mean**2, 0.0) * days / (days - 1))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sharpe = np.where(std > 0, mean / std * np.sqrt(TRADING_DAYS), np.nan)
+
+    stats = {
+        "sharpe": sharpe,
+        "max_drawdown": max_drawdown,
+        "trades": trades,
+        "total_return": equity - 1,
+    }
+    if positions:
+        stats["positions"] = held
+    return stats
+
+
+def to_shared(array):
+    """Copy an array into a new shared memory block."""
+    shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[:] = array
+    return shm
+
+
+# Shared arrays attached by each worker process
+_shared = {}
+
+
+def attach_shared(arrays):
+    """
+    Pool initializer: map the shared blocks described by ``arrays``, a dict
+    of name to (block name, shape, dtype), as numpy arrays.
+    """
+    for name, (shm_name, shape, dtype) in arrays.items():
+        shm = shared_memory.SharedMemory(name=shm_name)
+        # Keep the block open for the life of the worker
+        _shared[name] = (shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf))
+
+
+def simulate_shared(column, refiner, thresholds):
+    """Run ``simulate`` on one z-score column of the shared arrays."""
+    zscores = _shared["zscores"][1]
+    returns = _shared["returns"][1]
+    return simulate(zscores[:, column], returns[:, refiner], *thresholds.T)
+
+
+def sweep(
+    prices,
+    refiners,
+    windows=WINDOWS,
+    long_entries=LONG_ENTRIES,
+    long_exits=LONG_EXITS,
+    short_entries=SHORT_ENTRIES,
+    short_exits=SHORT_EXITS,
+    max_workers=None,
+    chunk_size=CHUNK_SIZE,
+):
+    """
+    Backtest every combination of the parameter grids.
+
+    Parameters
+    ----------
+    prices : pd.DataFrame
+        Daily closes of the crude, gasoline and heating oil futures and of
+        the refiners, one column per symbol, like ``data.get("Close")`` in
+        the notebook. Days missing any of the prices are dropped, as with
+        ``missing_index="drop"``.
+    refiners : list of str
+        The refiner symbols to trade.
+    windows : list of int
+        The rolling windows of the ranks and z-score.
+    long_entries, long_exits, short_entries, short_exits : list of float
+        The z-score thresholds.
+    max_workers : int, optional
+        Number of worker processes, by default one per CPU.
+    chunk_size : int
+        Number of threshold combinations simulated per task.
+
+    Returns
+    -------
+    results : pd.DataFrame
+        One row per combination with its parameters, ``sharpe``,
+        ``max_drawdown``, ``trades`` and ``total_return``.
+    """
+    prices = prices.dropna(subset=[CRUDE, GASOLINE, HEATING_OIL, *refiners])
+    crack = crack_spread(prices)
+    closes = prices[list(refiners)]
+    returns = closes.pct_change().fillna(0.0).to_numpy()
+
+    # Ranks and z-scores once per (refiner, window), as (window, refiner)
+    # ordered columns
+    zscores = np.hstack(
+        [rank_spread_zscore(crack, closes, window).to_numpy() for window in windows]
+    )
+
+    thresholds = np.array(
+        list(product(long_entries, long_exits, short_entries, short_exits)),
+        dtype=np.float64,
+    )
+    chunks = [
+        thresholds[i : i + chunk_size] for i in range(0, len(thresholds), chunk_size)
+    ]
+    pairs = list(product(range(len(windows)), range(len(refiners))))
+
+    blocks = {"zscores": to_shared(zscores), "returns": to_shared(returns)}
+    arrays = {
+        "zscores": (blocks["zscores"].name, zscores.shape, zscores.dtype),
+        "returns": (blocks["returns"].name, returns.shape, returns.dtype),
+    }
+    try:
+        # Spawn the workers: forking after the parallel numba kernels have
+        # started their thread pool leaves the interpreter hanging at exit
+        with ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=attach_shared,
+            initargs=(arrays,),
+        ) as pool:
+            futures = [
+                (
+                    w,
+                    r,
+                    chunk,
+                    pool.submit(simulate_shared, w * len(refiners) + r, r, chunk),
+                )
+                for w, r in pairs
+                for chunk in chunks
+            ]
+            frames = []
+            for w, r, chunk, future in futures:
+                frame = pd.DataFrame(
+                    chunk,
+                    columns=["long_entry", "long_exit", "short_entry", "short_exit"],
+                )
+                frame.insert(0, "window", windows[w])
+                frame.insert(0, "refiner", refiners[r])
+                frames.append(frame.assign(**future.result()))
+    finally:
+        for shm in blocks.values():
+            shm.close()
+            shm.unlink()
+
+    return pd.concat(frames, ignore_index=True)
+
+
+if __name__ == "__main__":
+    import yfinance as yf
+
+    refiners = ["VLO", "PSX", "MPC", "PBF", "DK"]
+    prices = yf.download(
+        [CRUDE, GASOLINE, HEATING_OIL, *refiners], start="2020", progress=False
+    )["Close"]
+
+    thresholds = [i / 10 for i in range(-35, 35, 5)]
+    results = sweep(
+        prices,
+        refiners,
+        windows=[10, 22, 44, 66],
+        long_entries=[t for t in thresholds if t < 0],
+        long_exits=thresholds,
+        short_entries=[t for t in thresholds if t > 0],
+        short_exits=thresholds,
+    )
+    print(results.sort_values("sharpe", ascending=False).head(20))
@@ -0,0 +1,169 @@
+import numpy as np
+import pandas as pd
+
+
+def rank(factor, ascending=True, method="average"):
+    """
+    Rank each date of a dates x assets factor across assets, like
+    ``factor.rank(axis=1)`` or ``groupby(level="date").rank()`` on a long
+    frame, with one sort of the whole array.
+
+    Parameters
+    ----------
+    factor : pd.DataFrame
+        Factor values indexed by date with one column per asset.
+    ascending : bool
+        Rank the smallest value 1 if True, the largest if False.
+    method : {"average", "min", "max", "first"}
+        How tied values are ranked, as in ``pd.DataFrame.rank``. ``"first"``
+        breaks ties by column order.
+
+    Returns
+    -------
+    ranks : pd.DataFrame
+        Ranks from 1, NaN where the factor is NaN.
+    """
+    values = factor.to_numpy(dtype=np.float64)
+    missing = np.isnan(values)
+    if not ascending:
+        values = -values
+
+    # NaNs sort last, so the ranks of the other values are unaffected. Only
+    # "first" depends on the order of ties, so the others skip the slower
+    # stable sort.
+    kind = "stable" if method == "first" else "quicksort"
+    order = np.argsort(values, axis=1, kind=kind)
+    ordered = np.take_along_axis(values, order, axis=1)
+    positions = np.broadcast_to(np.arange(values.shape[1]), values.shape)
+
+    if method == "first":
+        ordered_ranks = positions + 1.0
+    else:
+        starts = np.ones(values.shape, dtype=bool)
+        starts[:, 1:] = ordered[:, 1:] != ordered[:, :-1]
+        ends = np.ones(values.shape, dtype=bool)
+        ends[:, :-1] = starts[:, 1:]
+
+        first = np.maximum.accumulate(np.where(starts, positions, 0), axis=1)
+        last = np.where(ends, positions, values.shape[1] - 1)
+        last = np.minimum.accumulate(last[:, ::-1], axis=1)[:, ::-1]
+
+        if method == "average":
+            ordered_ranks = (first + last) / 2 + 1
+        elif method == "min":
+            ordered_ranks = first + 1.0
+        elif method == "max":
+            ordered_ranks = last + 1.0
+        else:
+            raise ValueError(f"Unknown rank method {method!r}.")
+
+    ranks = np.empty(values.shape)
+    np.put_along_axis(ranks, order, ordered_ranks, axis=1)
+    ranks[missing] = np.nan
+    return pd.DataFrame(ranks, index=factor.index, columns=factor.columns)
+
+
+def top(factor, n, ascending=False):
+    """
+    Mark the ``n`` largest values of each date of a dates x assets factor,
+    like Zipline's ``Factor.top(n)``.
+
+    Each date is partitioned with ``np.argpartition`` rather than sorted.
+    NaNs are never selected, so dates with fewer than ``n`` values select
+    them all. Ties at the cut-off are broken by column order, as by Zipline's
+    ordinal rank.
+
+    Parameters
+    ----------
+    factor : pd.DataFrame
+        Factor values indexed by date with one column per asset.
+    n : int
+        Number of assets to select per date.
+    ascending : bool
+        Select the ``n`` smallest values instead, like ``Factor.bottom(n)``.
+
+    Returns
+    -------
+    mask : pd.DataFrame
+        Boolean membership shaped like ``factor``.
+    """
+    values = factor.to_numpy(dtype=np.float64)
+    missing = np.isnan(values)
+    n = min(n, values.shape[1])
+    if n <= 0:
+        return pd.DataFrame(False, index=factor.index, columns=factor.columns)
+
+    # Order so that the selected values are the n smallest.
+    keys = values if ascending else -values
+    keys = np.where(missing, np.inf, keys)
+
+    nth = np.argpartition(keys, n - 1, axis=1)[:, n - 1 : n]
+    cutoff = np.take_along_axis(keys, nth, axis=1)
+
+    below = keys < cutoff
+    tied = keys == cutoff
+    tied &= np.cumsum(tied, axis=1) <= n - below.sum(axis=1, keepdims=True)
+
+    mask = (below | tied) & ~missing
+    return pd.DataFrame(mask, index=factor.index, columns=factor.columns)
+
+
+def bottom(factor, n):
+    """Mark the ``n`` smallest values of each date, see ``top``."""
+    return top(factor, n, ascending=True)
+
+
+def quantiles(factor, q):
+    """
+    Bucket each date of a dates x assets factor into ``q`` quantiles,
+    numbered 1 to ``q`` from the smallest values, like ``pd.qcut`` of each
+    date's ordinal ranks.
+
+    Buckets are cut on ordinal ranks, so they hold equal counts (up to
+    rounding) even when values are tied, with ties split by column order.
+    NaNs get no bucket.
+
+    Returns
+    -------
+    buckets : pd.DataFrame
+        The quantile of each value, NaN where the factor is NaN.
+    """
+    ranks = rank(factor, method="first").to_numpy()
+    missing = np.isnan(ranks)
+    counts = np.sum(~missing, axis=1, keepdims=True)
+
+    # pd.qcut puts rank r in bucket k when the k-th edge, at rank
+    # 1 + (count - 1) * k / q, is the first one at or above it. Integer
+    # arithmetic avoids rounding at the edges.
+    offsets = np.where(missing, 0, ranks - 1).astype(np.int64)
+    buckets = -(-offsets * q // np.maximum(counts - 1, 1))
+    buckets = np.maximum(buckets, 1).astype(np.float64)
+    buckets[missing] = np.nan
+    return pd.DataFrame(buckets, index=factor.index, columns=factor.columns)
+
+
+def latest(factor):
+    """
+    The last non-NaN value of each asset of a dates x assets factor, and the
+    date it was observed. Replaces selecting the row with the latest date per
+    symbol with ``groupby(...).apply``.
+
+    Returns
+    -------
+    latest : pd.DataFrame
+        ``value`` and ``date`` indexed by asset. Assets without values are
+        dropped.
+    """
+    values = factor.to_numpy(dtype=np.float64)
+    present = ~np.isnan(values)
+    rows = len(values) - 1 - np.argmax(present[::-1], axis=0)
+    columns = np.arange(values.shape[1])
+    has_value = present[rows, columns]
+
+    return pd.DataFrame(
+        {
+            "value": values[rows, columns][has_value],
+            "date": factor.index[rows[has_value]],
+        },
+        index=factor.columns[has_value],
+    )
@@ -1,14 +1,22 @@
+import asyncio
+import hashlib
+import os
+import random
+import re
+import tempfile
 import time
-from io import BytesIO
 from zipfile import ZipFile
 
+import aiohttp
 import numpy as np
 import pandas as pd
 import requests
+import click
 from click import progressbar
 from logbook import Logger
+from pyarrow import feather
 from six import iteritems
-from six.moves.urllib.parse import urlencode
+from six.moves.urllib.parse import urlencode, urlsplit
 
 log = Logger(__name__)
 
@@ -16,26 +24,60 @@ DATA_START_DATE = "2000-01-01"
 ONE_MEGABYTE = 1024 * 1024
 DATALINK_DATA_URL = "https://data.nasdaq.com/api/v3/datatables/QUOTEMEDIA/PRICES"
 MAX_DOWNLOAD_TRIES = 5
-
-
-def format_metadata_url(api_key):
+DOWNLOAD_LINK_BASE_DELAY = 2
+DOWNLOAD_LINK_MAX_DELAY = 60
+DOWNLOAD_LINK_DEADLINE = 15 * 60
+# Seconds to wait for a connection, and between bytes once connected, before
+# a request is abandoned. A stalled transfer then fails and can be resumed.
+DOWNLOAD_TIMEOUT = (10, 60)
+DOWNLOAD_FILE_NAME = "QUOTEMEDIA_PRICES.zip"
+STORE_FILE_NAME = "QUOTEMEDIA_PRICES.pkl"
+WATERMARKS_FILE_NAME = "watermarks.csv"
+# How far before the latest watermark the incremental fetch reaches for
+# symbols whose last rows lag behind, such as halted ones or late prints
+WATERMARK_OVERLAP = pd.Timedelta(days=30)
+TABLE_CACHE_MAX_BYTES = 10 * 1024 * ONE_MEGABYTE
+
+DATE_FORMAT = "%Y-%m-%d"
+TABLE_COLUMNS = [
+    "ticker",
+    "date",
+    "open",
+    "high",
+    "low",
+    "close",
+    "volume",
+    "dividend",
+    "split",
+]
+TABLE_RENAMES = {
+    "ticker": "symbol",
+    "dividend": "ex_dividend",
+    "split": "split_ratio",
+}
+# Roughly halves the memory of the parsed table. Prices are stored by the
+# daily bar writer to three decimals, so little is lost, though float32 loses
+# sub-cent precision above about 100,000. Volume is float32 rather than an
+# integer so blank or float formatted fields parse as NaN, as by default,
+# instead of failing the read; it is exact up to about 16 million shares.
+COMPACT_DTYPES = {
+    "ticker": "category",
+    "open": "float32",
+    "high": "float32",
+    "low": "float32",
+    "close": "float32",
+    "volume": "float32",
+    "dividend": "float32",
+    "split": "float32",
+}
+
+
+def format_metadata_url(api_key, start_date=DATA_START_DATE):
     """Build the query URL for Quandl WIKI Prices metadata."""
-    columns = ",".join(
-        [
-            "ticker",
-            "date",
-            "open",
-            "high",
-            "low",
-            "close",
-            "volume",
-            "dividend",
-            "split",
-        ]
-    )
+    columns = ",".join(TABLE_COLUMNS)
 
     query_params = [
-        ("date.gte", DATA_START_DATE),
+        ("date.gte", start_date),
         ("api_key", api_key),
         ("qopts.export", "true"),
         ("qopts.columns", columns),
@@ -43,97 +85,435 @@ def format_metadata_url(api_key):
     return f"{DATALINK_DATA_URL}?{urlencode(query_params)}"
 
 
-def fetch_download_link(table_url, max_download_tries=MAX_DOWNLOAD_TRIES):
+def backoff_delay(attempt, base_delay, max_delay):
+    """Exponential backoff with full jitter."""
+    return random.uniform(0, min(max_delay, base_delay * 2**attempt))
+
+
+def parse_download_link(payload):
+    """Return the link of a fresh bulk download, or None if it is not ready."""
+    file = payload["datatable_bulk_download"]["file"]
+    status = file["status"]
+    if status == "fresh":
+        link = file["link"]
+        log.info(f"Status is {status}. Returning download link: {link}")
+        return link
+
+    log.info(f"Status is {status}.")
+    return None
+
+
+def fetch_download_link(
+    table_url,
+    max_download_tries=MAX_DOWNLOAD_TRIES,
+    base_delay=DOWNLOAD_LINK_BASE_DELAY,
+    max_delay=DOWNLOAD_LINK_MAX_DELAY,
+    deadline=DOWNLOAD_LINK_DEADLINE,
+):
+    """
+    Blocking counterpart of ``fetch_download_link_async``, which gives up
+    after ``max_download_tries`` polls or ``deadline`` seconds, whichever
+    comes first.
+    """
     log.info(f"Attempting to fetch download link with ...")
+    give_up = time.monotonic() + deadline
 
-    status = None
-    cnt = 0
+    for attempt in range(max_download_tries):
+        remaining = give_up - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError(
+                f"No fresh download link within {deadline} seconds: {table_url}"
+            )
+        connect_timeout, read_timeout = DOWNLOAD_TIMEOUT
+        timeout = (min(connect_timeout, remaining), min(read_timeout, remaining))
 
-    while status != "fresh" and cnt < max_download_tries:
         log.info(f"Fetching download link...")
         try:
-            resp = requests.get(table_url)
+            resp = requests.get(table_url, timeout=timeout)
             resp.raise_for_status()
-        except:
-            log.info("Failed to get download link from Quandl")
-
-        payload = resp.json()
-
-        status = payload["datatable_bulk_download"]["file"]["status"]
-
-        if status == "fresh":
-            link = payload["datatable_bulk_download"]["file"]["link"]
-            log.info(f"Status is {status}. Returning download link: {link}")
-            return link
-
-        log.info(f"Status is {status}. Retrying in 10 seconds...")
-
-        time.sleep(10)
-
-
-def load_data_table(file, index_col=None):
-    """Load data table from zip file provided by Quandl."""
-    with ZipFile(file) as zip_file:
-        file_names = zip_file.namelist()
-        assert len(file_names) == 1, "Expected a single file from Quandl."
-        eod_prices = file_names.pop()
-        with zip_file.open(eod_prices) as table_file:
-            log.info("Parsing raw data.")
-            data_table = pd.read_csv(
-                table_file,
-                header=0,
-                names=[
-                    "ticker",
-                    "date",
-                    "open",
-                    "high",
-                    "low",
-                    "close",
-                    "volume",
-                    "dividend",
-                    "split",
-                ],
-                parse_dates=["date"],
-                index_col=index_col,
-                usecols=[
-                    "ticker",
-                    "date",
-                    "open",
-                    "high",
-                    "low",
-                    "close",
-                    "volume",
-                    "dividend",
-                    "split",
-                ],
-            ).rename(
-                columns={
-                    "ticker": "symbol",
-                    "dividend": "ex_dividend",
-                    "split": "split_ratio",
-                }
+            link = parse_download_link(resp.json())
+        except (requests.exceptions.RequestException, KeyError, ValueError) as e:
+            log.info(f"Failed to get download link from Quandl: {e}")
+        else:
+            if link is not None:
+                return link
+
+        if attempt == max_download_tries - 1:
+            break
+        delay = backoff_delay(attempt, base_delay, max_delay)
+        if time.monotonic() + delay >= give_up:
+            raise TimeoutError(
+                f"No fresh download link within {deadline} seconds: {table_url}"
+            )
+        log.info(f"Retrying in {delay:.1f} seconds...")
+        time.sleep(delay)
+
+    raise RuntimeError(
+        f"Failed to get a fresh download link after {max_download_tries} tries."
+    )
+
+
+async def fetch_download_link_async(
+    session,
+    table_url,
+    deadline=DOWNLOAD_LINK_DEADLINE,
+    base_delay=DOWNLOAD_LINK_BASE_DELAY,
+    max_delay=DOWNLOAD_LINK_MAX_DELAY,
+):
+    """
+    Poll a datatable export until its bulk download is fresh.
+
+    Parameters
+    ----------
+    session : aiohttp.ClientSession
+        The session to poll with.
+    table_url : str
+        An export URL such as one from ``format_metadata_url``.
+    deadline : float
+        Seconds to keep polling for before giving up.
+    base_delay, max_delay : float
+        Bounds of the exponential backoff between polls, in seconds.
+
+    Returns
+    -------
+    link : str
+        The download link.
+    """
+    loop = asyncio.get_running_loop()
+    give_up = loop.time() + deadline
+
+    attempt = 0
+    while True:
+        # aiohttp reads a total of 0 as no timeout at all
+        remaining = give_up - loop.time()
+        if remaining <= 0:
+            raise TimeoutError(
+                f"No fresh download link within {deadline} seconds: {table_url}"
+            )
+        timeout = aiohttp.ClientTimeout(total=remaining)
+        try:
+            async with session.get(table_url, timeout=timeout) as resp:
+                resp.raise_for_status()
+                link = parse_download_link(await resp.json())
+        except (aiohttp.ClientError, asyncio.TimeoutError, KeyError, ValueError) as e:
+            log.info(f"Failed to get download link from Quandl: {e}")
+        else:
+            if link is not None:
+                return link
+
+        delay = backoff_delay(attempt, base_delay, max_delay)
+        if loop.time() + delay >= give_up:
+            raise TimeoutError(
+                f"No fresh download link within {deadline} seconds: {table_url}"
             )
+        await asyncio.sleep(delay)
+        attempt += 1
+
+
+async def fetch_and_download_tables_async(
+    table_urls, download_dir=None, deadline=DOWNLOAD_LINK_DEADLINE
+):
+    """
+    Poll several datatable exports at once, downloading each as soon as its
+    link is fresh while the others are still polled.
+
+    Each table is spooled to ``download_dir`` as ``<VENDOR>_<TABLE>.zip``,
+    e.g. ``QUOTEMEDIA_PRICES.zip``. Returns the paths of the zip files in
+    the order of ``table_urls``.
+    """
+    download_dir = download_dir or tempfile.gettempdir()
+
+    async def fetch_and_download(session, table_url):
+        link = await fetch_download_link_async(session, table_url, deadline)
+        vendor, table = urlsplit(table_url).path.split("/")[-2:]
+        path = os.path.join(download_dir, f"{vendor}_{table}.zip")
+        return await asyncio.to_thread(
+            download_to_file, link, path, chunk_size=ONE_MEGABYTE
+        )
+
+    async with aiohttp.ClientSession() as session:
+        return await asyncio.gather(
+            *(fetch_and_download(session, table_url) for table_url in table_urls)
+        )
+
+
+def fetch_and_download_tables(table_urls, download_dir=None, **kwargs):
+    """Blocking wrapper of ``fetch_and_download_tables_async``."""
+    return asyncio.run(
+        fetch_and_download_tables_async(table_urls, download_dir, **kwargs)
+    )
+
+
+def load_data_table(file, index_col=None, dtype=None, engine=None):
+    """
+    Load data table from zip file provided by Quandl.
+
+    ``dtype`` is forwarded to ``pd.read_csv`` using the raw column names,
+    e.g. ``COMPACT_DTYPES``. By default dtypes are inferred.
+
+    ``engine`` selects the ``pd.read_csv`` parser. ``"pyarrow"`` parses with
+    Arrow's multithreaded reader and gives the same frame as the default
+    single threaded one.
+    """
+    with ZipFile(file) as zip_file, open_data_table(zip_file) as table_file:
+        log.info("Parsing raw data.")
+        data_table = pd.read_csv(
+            table_file,
+            header=0,
+            names=TABLE_COLUMNS,
+            parse_dates=["date"],
+            date_format=DATE_FORMAT,
+            index_col=index_col,
+            usecols=TABLE_COLUMNS,
+            dtype=dtype,
+            engine=engine,
+        ).rename(columns=TABLE_RENAMES)
+
+    return data_table
+
+
+def open_data_table(zip_file):
+    """Open the single table member of a zip file provided by Quandl."""
+    file_names = zip_file.namelist()
+    assert len(file_names) == 1, "Expected a single file from Quandl."
+    return zip_file.open(file_names.pop())
 
+
+def iter_data_table(file, chunk_size, usecols=None, dtype=None):
+    """
+    Read the data table from a zip file provided by Quandl in chunks.
+
+    Parameters
+    ----------
+    file : str or file-like
+        The zip file containing the table export.
+    chunk_size : int
+        Number of rows to parse at a time.
+    usecols : list of str, optional
+        Raw column names to read. ``ticker`` and ``date`` are always read.
+        Defaults to every column.
+    dtype : dict, optional
+        Forwarded to ``pd.read_csv``, see ``load_data_table``.
+
+    Yields
+    ------
+    chunk : pd.DataFrame
+        The next ``chunk_size`` rows, renamed as in ``load_data_table``.
+    """
+    usecols = set(TABLE_COLUMNS if usecols is None else usecols)
+    usecols = [c for c in TABLE_COLUMNS if c in usecols | {"ticker", "date"}]
+
+    with ZipFile(file) as zip_file, open_data_table(zip_file) as table_file:
+        reader = pd.read_csv(
+            table_file,
+            header=0,
+            names=TABLE_COLUMNS,
+            parse_dates=["date"],
+            date_format=DATE_FORMAT,
+            usecols=usecols,
+            dtype=dtype,
+            chunksize=chunk_size,
+        )
+        for chunk in reader:
+            yield chunk.rename(columns=TABLE_RENAMES)
+
+
+def fetch_table_link(api_key, start_date=DATA_START_DATE):
+    """Fetch the download link of the WIKI Prices data table export."""
+    log.info(f"Fetching data table from {start_date}...")
+
+    table_url = format_metadata_url(api_key, start_date)
+    return fetch_download_link(table_url)
+
+
+def download_data_table(download_link, download_dir=None):
+    """
+    Download the zipped WIKI Prices data table from Quandl to
+    ``download_dir``, defaulting to the system temp directory. Returns the
+    path of the zip file.
+    """
+    path = os.path.join(download_dir or tempfile.gettempdir(), DOWNLOAD_FILE_NAME)
+    return download_to_file(download_link, path, chunk_size=ONE_MEGABYTE)
+
+
+def fetch_data_table(
+    api_key,
+    download_dir=None,
+    start_date=DATA_START_DATE,
+    dtype=None,
+    engine=None,
+    cache_dir=None,
+):
+    """
+    Fetch WIKI Prices data table from Quandl
+
+    When ``cache_dir`` is given the parsed table is cached there, and is
+    reloaded from the cache for as long as Quandl serves the same export.
+    """
+    download_link = fetch_table_link(api_key, start_date)
+
+    if cache_dir is not None:
+        key = table_cache_key(download_link, dtype)
+        data_table = read_cached_table(cache_dir, key)
+        if data_table is not None:
+            return data_table
+
+    raw_file = download_data_table(download_link, download_dir)
+    data_table = load_data_table(file=raw_file, dtype=dtype, engine=engine)
+
+    if cache_dir is not None:
+        write_cached_table(cache_dir, key, data_table)
     return data_table
 
 
-def fetch_data_table(api_key):
-    """Fetch WIKI Prices data table from Quandl"""
-    log.info(f"Fetching data table...")
+def table_cache_key(download_link, dtype=None):
+    """
+    Key a parsed table by its download link, without the query string which
+    carries the link's signature, and by the dtypes it was parsed with.
+    """
+    link = urlsplit(download_link)
+    return hashlib.sha1(f"{link.netloc}{link.path}|{dtype}".encode()).hexdigest()
+
+
+def read_cached_table(cache_dir, key):
+    """Memory map a cached table, or return None if it is not cached."""
+    path = os.path.join(cache_dir, f"{key}.feather")
+    if not os.path.exists(path):
+        return None
+
+    log.info(f"Loading cached data table {path}.")
+    # Mark the table as recently used for eviction.
+    os.utime(path)
+    return feather.read_table(path, memory_map=True).to_pandas()
 
-    table_url = format_metadata_url(api_key)
-    download_link = fetch_download_link(table_url)
-    raw_file = download_with_progress(download_link, chunk_size=ONE_MEGABYTE)
 
-    return load_data_table(file=raw_file)
+def write_cached_table(cache_dir, key, data_table, max_bytes=TABLE_CACHE_MAX_BYTES):
+    """
+    Cache a parsed table as uncompressed Feather, so it can be memory mapped,
+    then evict the least recently used tables beyond ``max_bytes``.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, f"{key}.feather")
+    data_table.to_feather(f"{path}.tmp", compression="uncompressed")
+    os.replace(f"{path}.tmp", path)
+
+    evict_table_cache(cache_dir, max_bytes)
+
+
+def evict_table_cache(cache_dir, max_bytes):
+    """
+    Remove the least recently used cached tables until the cache fits in
+    ``max_bytes``. The most recently used table is always kept.
+    """
+    paths = [
+        os.path.join(cache_dir, name)
+        for name in os.listdir(cache_dir)
+        if name.endswith(".feather")
+    ]
+    paths.sort(key=os.path.getmtime, reverse=True)
+
+    total_bytes = 0
+    for i, path in enumerate(paths):
+        total_bytes += os.path.getsize(path)
+        if i and total_bytes > max_bytes:
+            log.info(f"Evicting cached data table {path}.")
+            os.remove(path)
+
+
+def clear_table_cache(cache_dir):
+    """Remove every cached table, returning how many were removed."""
+    evicted = 0
+    for name in os.listdir(cache_dir):
+        if name.endswith(".feather"):
+            os.remove(os.path.join(cache_dir, name))
+            evicted += 1
+    return evicted
+
+
+def load_watermarks(store_dir):
+    """
+    Load the last ingested session of each symbol, or None if nothing has
+    been ingested into ``store_dir`` yet.
+    """
+    path = os.path.join(store_dir, WATERMARKS_FILE_NAME)
+    if not os.path.exists(path):
+        return None
+    return pd.read_csv(path, index_col="symbol", parse_dates=["date"]).date
+
+
+def fetch_incremental_data_table(
+    api_key, store_dir, download_dir=None, dtype=None, engine=None, cache_dir=None
+):
+    """
+    Fetch the WIKI Prices data table, downloading only the sessions after
+    the last ingest.
+
+    The full table and the last session of each symbol are kept in
+    ``store_dir``. Rows are requested from Quandl from the oldest watermark
+    of the symbols updated within ``WATERMARK_OVERLAP`` of the latest one,
+    and of those only the rows past each symbol's own watermark are
+    appended, which brings in new sessions along with their splits and
+    dividends. A symbol lagging further behind, such as one delisted, only
+    gets rows from that date on. The first run fetches the full history.
+
+    Returns
+    -------
+    data_table : pd.DataFrame
+        The full table, as returned by ``fetch_data_table``.
+    """
+    table_path = os.path.join(store_dir, STORE_FILE_NAME)
+    watermarks = load_watermarks(store_dir)
+
+    if watermarks is None:
+        data_table = fetch_data_table(
+            api_key, download_dir, dtype=dtype, engine=engine, cache_dir=cache_dir
+        )
+    else:
+        latest = watermarks.max()
+        start = max(watermarks.min(), latest - WATERMARK_OVERLAP)
+        start_date = start.strftime("%Y-%m-%d")
+        delta = fetch_data_table(
+            api_key, download_dir, start_date, dtype, engine, cache_dir
+        )
+        lagging = watermarks[watermarks < start].index.intersection(
+            delta.symbol.unique()
+        )
+        if len(lagging):
+            log.warning(
+                f"{len(lagging)} symbols resumed after more than "
+                f"{WATERMARK_OVERLAP.days} days, rows before {start_date} may be "
+                f"missing: {', '.join(map(str, lagging[:10]))}"
+            )
+
+        # Symbols without a watermark compare as False, so they are kept.
+        # Mapping a categorical can give back a categorical, which doesn't
+        # compare with dates, so the symbols are mapped as plain strings.
+        ingested = delta.date <= delta.symbol.astype(str).map(watermarks)
+        delta = delta.loc[~ingested]
+        log.info(f"Appending {len(delta)} rows after {start_date}.")
+
+        data_table = pd.concat([pd.read_pickle(table_path), delta], ignore_index=True)
+        if isinstance(delta.symbol.dtype, pd.CategoricalDtype):
+            # Concatenating differing categories falls back to object.
+            data_table["symbol"] = data_table.symbol.astype("category")
+
+    os.makedirs(store_dir, exist_ok=True)
+    data_table.to_pickle(f"{table_path}.tmp")
+    os.replace(f"{table_path}.tmp", table_path)
+    data_table.groupby("symbol", observed=True).date.max().to_csv(
+        os.path.join(store_dir, WATERMARKS_FILE_NAME)
+    )
+
+    return data_table
 
 
 def gen_asset_metadata(data, show_progress):
     if show_progress:
         log.info("Generating asset metadata.")
 
-    data = data.groupby(by="symbol").agg({"date": ["min", "max"]})
+    data = data.groupby(by="symbol", observed=True).agg({"date": ["min", "max"]})
     data.reset_index(inplace=True)
+    data["symbol"] = data.symbol.astype(str)
     data["start_date"] = data.date.min(axis=1)
     data["end_date"] = data.date.max(axis=1)
     del data["date"]
@@ -148,7 +528,10 @@ def parse_splits(data, show_progress):
     if show_progress:
         log.info("Parsing split data.")
 
-    data["split_ratio"] = 1.0 / data.split_ratio
+    # The adjustment writer expects int64 sids and float64 ratios, which
+    # compact dtypes and category codes don't give.
+    data["sid"] = data.sid.astype(np.int64)
+    data["split_ratio"] = 1.0 / data.split_ratio.astype(np.float64)
     data.rename(
         columns={"split_ratio": "ratio", "date": "effective_date"},
         inplace=True,
@@ -161,6 +544,8 @@ def parse_dividends(data, show_progress):
     if show_progress:
         log.info("Parsing dividend data.")
 
+    data["sid"] = data.sid.astype(np.int64)
+    data["ex_dividend"] = data.ex_dividend.astype(np.float64)
     data["record_date"] = data["declared_date"] = data["pay_date"] = pd.NaT
     data.rename(
         columns={"ex_dividend": "amount", "date": "ex_date"}, inplace=True, copy=False
@@ -176,6 +561,179 @@ def parse_pricing_and_vol(data, sessions, symbol_map):
         yield asset_id, asset_data
 
 
+def pivot_pricing_and_vol(data, sessions, symbol_map):
+    """
+    Vectorized ``parse_pricing_and_vol``.
+
+    Instead of an ``xs`` scan of the whole index per asset, the rows are
+    sorted by asset once and split at the group boundaries. Each asset's rows
+    are then scattered into a zeroed sessions x fields block, which backs the
+    yielded frame without a further copy. All fields are returned as float64.
+    """
+    sessions = sessions.tz_localize(None)
+
+    assets = pd.Index(symbol_map.values).get_indexer(data.index.get_level_values(1))
+    rows = sessions.get_indexer(data.index.get_level_values(0))
+
+    # Rows for unknown symbols or non-sessions are dropped, as by reindex.
+    keep = np.flatnonzero((assets >= 0) & (rows >= 0))
+    keep = keep[np.argsort(assets[keep], kind="stable")]
+    assets, rows = assets[keep], rows[keep]
+    values = data.to_numpy(dtype=np.float64)[keep]
+    values[np.isnan(values)] = 0.0
+
+    bounds = np.searchsorted(assets, np.arange(len(symbol_map) + 1))
+    for i, asset_id in enumerate(symbol_map.index):
+        start, end = bounds[i], bounds[i + 1]
+        asset_data = np.zeros((len(sessions), values.shape[1]))
+        asset_data[rows[start:end]] = values[start:end]
+        yield asset_id, pd.DataFrame(
+            asset_data, index=sessions, columns=data.columns, copy=False
+        )
+
+
+def scan_data_table(file, chunk_size, dtype=None):
+    """
+    Collect the per-symbol date bounds and the sparse split and dividend rows
+    of the data table in a single chunked pass.
+
+    Returns
+    -------
+    bounds : pd.DataFrame
+        ``symbol`` and ``date`` rows holding each symbol's first and last
+        date, suitable for ``gen_asset_metadata``.
+    splits, dividends : pd.DataFrame
+        The rows with a split or dividend, keyed by ``symbol``.
+    """
+    bounds, splits, dividends = [], [], []
+    chunks = iter_data_table(file, chunk_size, ["dividend", "split"], dtype)
+    for chunk in chunks:
+        bounds.append(
+            chunk.groupby("symbol", observed=True)
+            .date.agg(["min", "max"])
+            .melt(ignore_index=False, value_name="date")
+            .reset_index()[["symbol", "date"]]
+        )
+        splits.append(
+            chunk.loc[chunk.split_ratio != 1, ["symbol", "date", "split_ratio"]]
+        )
+        dividends.append(
+            chunk.loc[chunk.ex_dividend != 0, ["symbol", "date", "ex_dividend"]]
+        )
+
+    return (
+        pd.concat(bounds, ignore_index=True),
+        pd.concat(splits, ignore_index=True),
+        pd.concat(dividends, ignore_index=True),
+    )
+
+
+def stream_pricing_and_vol(file, chunk_size, sessions, sids, dtype=None):
+    """
+    Streaming counterpart of ``parse_pricing_and_vol``.
+
+    Rows are read ``chunk_size`` at a time and each symbol is yielded as soon
+    as its run of rows ends, so only the current chunk and the rows of the
+    symbol spanning the chunk boundary are held in memory. The export must
+    be grouped by ticker, which is how Quandl writes it.
+
+    Parameters
+    ----------
+    file : str or file-like
+        The zip file containing the table export.
+    chunk_size : int
+        Number of rows to parse at a time.
+    sessions : pd.DatetimeIndex
+        The sessions each asset is reindexed to.
+    sids : pd.Series
+        Maps symbol to asset id.
+    dtype : dict, optional
+        Forwarded to ``pd.read_csv``, see ``load_data_table``.
+    """
+    sessions = sessions.tz_localize(None)
+    written = set()
+
+    def asset_bars(rows):
+        symbol = rows.symbol.iat[0]
+        if symbol in written:
+            raise ValueError(
+                f"Rows for {symbol} are not contiguous, the data table must be "
+                "grouped by ticker to be ingested in chunks."
+            )
+        written.add(symbol)
+        asset_data = (
+            rows.drop(columns="symbol").set_index("date").reindex(sessions).fillna(0.0)
+        )
+        return sids[symbol], asset_data
+
+    carry = None
+    for chunk in iter_data_table(file, chunk_size, dtype=dtype):
+        if carry is not None:
+            chunk = pd.concat([carry, chunk], ignore_index=True)
+
+        symbols = chunk.symbol.values
+        runs = np.r_[0, np.flatnonzero(symbols[1:] != symbols[:-1]) + 1]
+        for start, end in zip(runs[:-1], runs[1:]):
+            yield asset_bars(chunk.iloc[start:end])
+
+        # The last symbol may continue in the next chunk.
+        carry = chunk.iloc[runs[-1] :].copy()
+
+    if carry is not None:
+        yield asset_bars(carry)
+
+
+def gen_exchanges():
+    return pd.DataFrame(
+        data=[["QUOTEMEDIA", "QUOTEMEDIA", "US"]],
+        columns=["exchange", "canonical_name", "country_code"],
+    )
+
+
+def ingest_in_chunks(
+    api_key,
+    download_dir,
+    chunk_size,
+    asset_db_writer,
+    daily_bar_writer,
+    adjustment_writer,
+    calendar,
+    show_progress,
+    dtype=None,
+):
+    """
+    Ingest the Quotemedia table ``chunk_size`` rows at a time instead of
+    loading it into a single DataFrame.
+
+    The table is read twice: once for the asset metadata and the sparse
+    adjustments, then again to stream the daily bars to the writer.
+    """
+    raw_file = download_data_table(fetch_table_link(api_key), download_dir)
+
+    bounds, splits, dividends = scan_data_table(raw_file, chunk_size, dtype)
+
+    start_session, end_session = bounds.date.min(), bounds.date.max()
+    asset_metadata = gen_asset_metadata(bounds, show_progress)
+    asset_db_writer.write(equities=asset_metadata, exchanges=gen_exchanges())
+
+    sids = pd.Series(asset_metadata.index, index=asset_metadata.symbol)
+    sessions = calendar.sessions_in_range(start_session, end_session)
+
+    daily_bar_writer.write(
+        stream_pricing_and_vol(raw_file, chunk_size, sessions, sids, dtype),
+        show_progress=show_progress,
+    )
+
+    # With compact dtypes the symbols are categorical, and so is what they
+    # map to, but the adjustment writer needs integer sids.
+    splits.insert(0, "sid", splits.pop("symbol").map(sids).astype(np.int64))
+    dividends.insert(0, "sid", dividends.pop("symbol").map(sids).astype(np.int64))
+    adjustment_writer.write(
+        splits=parse_splits(splits, show_progress=show_progress),
+        dividends=parse_dividends(dividends, show_progress=show_progress),
+    )
+
+
 def daily_us_equities_bundle(
     environ,
     asset_db_writer,
@@ -193,6 +751,28 @@ def daily_us_equities_bundle(
     daily_us_equities_bundle builds a daily dataset using Quotemedia
     end of day equities data. For more information on the Quotemedia
     data see here: https://data.nasdaq.com/databases/EOD
+
+    Set DATALINK_CHUNK_SIZE to a number of rows to ingest the table in
+    chunks of that size, bounding peak memory by the chunk size rather than
+    by the size of the dataset.
+
+    Polling for the export gives up after ``DOWNLOAD_LINK_DEADLINE`` seconds.
+    The export is spooled to DATALINK_DOWNLOAD_DIR, or the system temp
+    directory, and an interrupted download resumes where it left off.
+
+    Set DATALINK_COMPACT_DTYPES to parse the table with ``COMPACT_DTYPES``,
+    with categorical symbols and 32 bit prices and volumes.
+
+    Set DATALINK_CSV_ENGINE to ``pyarrow`` to parse the table with Arrow's
+    multithreaded CSV reader. Chunked ingest always uses the default parser.
+
+    Set DATALINK_STORE_DIR to keep the table between runs and only download
+    the sessions added since the last ingest. Chunked ingest is not used in
+    this mode.
+
+    Set DATALINK_CACHE_DIR to cache the parsed table there, so that a failed
+    ingest can be retried without downloading and parsing it again. Clear
+    it with ``python daily_us_equities.py clear-cache``.
     """
     api_key = environ.get("DATALINK_API_KEY")
     if api_key is None:
@@ -200,23 +780,45 @@ def daily_us_equities_bundle(
             "Please set your DATALINK_API_KEY environment variable and retry."
         )
 
-    raw_data = fetch_data_table(api_key)
+    download_dir = environ.get("DATALINK_DOWNLOAD_DIR")
+    store_dir = environ.get("DATALINK_STORE_DIR")
+    chunk_size = environ.get("DATALINK_CHUNK_SIZE")
+    dtype = COMPACT_DTYPES if environ.get("DATALINK_COMPACT_DTYPES") else None
+    engine = environ.get("DATALINK_CSV_ENGINE")
+    cache_dir = environ.get("DATALINK_CACHE_DIR")
+    if chunk_size is not None and store_dir is None:
+        return ingest_in_chunks(
+            api_key,
+            download_dir,
+            int(chunk_size),
+            asset_db_writer,
+            daily_bar_writer,
+            adjustment_writer,
+            calendar,
+            show_progress,
+            dtype,
+        )
+
+    if store_dir is not None:
+        raw_data = fetch_incremental_data_table(
+            api_key, store_dir, download_dir, dtype, engine, cache_dir
+        )
+    else:
+        raw_data = fetch_data_table(
+            api_key, download_dir, dtype=dtype, engine=engine, cache_dir=cache_dir
+        )
 
     start_session, end_session = raw_data.date.min(), raw_data.date.max()
     asset_metadata = gen_asset_metadata(raw_data[["symbol", "date"]], show_progress)
 
-    exchanges = pd.DataFrame(
-        data=[["QUOTEMEDIA", "QUOTEMEDIA", "US"]],
-        columns=["exchange", "canonical_name", "country_code"],
-    )
-    asset_db_writer.write(equities=asset_metadata, exchanges=exchanges)
+    asset_db_writer.write(equities=asset_metadata, exchanges=gen_exchanges())
 
     symbol_map = asset_metadata.symbol
     sessions = calendar.sessions_in_range(start_session, end_session)
 
     raw_data.set_index(["date", "symbol"], inplace=True)
     daily_bar_writer.write(
-        parse_pricing_and_vol(raw_data, sessions, symbol_map),
+        pivot_pricing_and_vol(raw_data, sessions, symbol_map),
         show_progress=show_progress,
     )
 
@@ -235,32 +837,174 @@ def daily_us_equities_bundle(
     )
 
 
-def download_with_progress(url, chunk_size, **progress_kwargs):
+def download_to_file(
+    url,
+    path,
+    chunk_size,
+    max_tries=MAX_DOWNLOAD_TRIES,
+    md5=None,
+    timeout=DOWNLOAD_TIMEOUT,
+    **progress_kwargs,
+):
     """
-    Download streaming data from a URL, printing progress information to the
-    terminal.
+    Download streaming data from a URL to a file on disk, printing progress
+    information to the terminal.
+
+    Data is spooled to ``path + ".part"``. When the transfer is interrupted
+    it is resumed with an HTTP Range request from the bytes already on disk,
+    including across runs if the server still reports the same ETag or
+    Last-Modified date. Without either, it starts over. The file is only
+    moved to ``path`` once its size and checksum are verified.
+
     Parameters
     ----------
     url : str
         A URL that can be understood by ``requests.get``.
+    path : str
+        Where to write the downloaded file.
     chunk_size : int
         Number of bytes to read at a time from requests.
+    max_tries : int
+        Number of attempts before giving up on an interrupted transfer.
+    md5 : str, optional
+        Expected hex MD5 digest of the file. Defaults to the ETag when it is
+        a plain MD5, as it is for single part S3 objects.
+    timeout : float or tuple of float
+        Forwarded to ``requests.get``. A transfer that stalls for longer
+        than the read timeout is interrupted and resumed.
     **progress_kwargs
         Forwarded to click.progressbar.
+
     Returns
     -------
-    data : BytesIO
-        A BytesIO containing the downloaded data.
+    path : str
+        The path of the verified file.
     """
-    resp = requests.get(url, stream=True)
-    resp.raise_for_status()
+    part_path = f"{path}.part"
+    etag_path = f"{part_path}.etag"
+    modified_path = f"{part_path}.last-modified"
+
+    for attempt in range(max_tries):
+        if attempt:
+            time.sleep(2**attempt)
+
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        headers = {}
+        if offset:
+            validator_path = next(
+                (p for p in (etag_path, modified_path) if os.path.exists(p)), None
+            )
+            if validator_path is None:
+                # Without a validator the server can't tell us the file
+                # changed, so the bytes on disk can't safely be resumed.
+                log.info("No ETag or Last-Modified to resume from, restarting.")
+                os.remove(part_path)
+                offset = 0
+            else:
+                headers["Range"] = f"bytes={offset}-"
+                with open(validator_path) as f:
+                    headers["If-Range"] = f.read()
+
+        try:
+            with requests.get(
+                url, headers=headers, stream=True, timeout=timeout
+            ) as resp:
+                if resp.status_code == 416:
+                    # Nothing left to send, the previous attempt finished.
+                    content_range = resp.headers.get("content-range", "")
+                    total_size = content_range.rpartition("/")[2]
+                    if not total_size.isdigit() or offset != int(total_size):
+                        os.remove(part_path)
+                        continue
+                    total_size = int(total_size)
+                    break
+                resp.raise_for_status()
+
+                if resp.status_code != 206:
+                    offset = 0
+                    for validator_path in (etag_path, modified_path):
+                        if os.path.exists(validator_path):
+                            os.remove(validator_path)
+                total_size = offset + int(resp.headers["content-length"])
+
+                for validator_path, header in (
+                    (etag_path, "etag"),
+                    (modified_path, "last-modified"),
+                ):
+                    value = resp.headers.get(header)
+                    if value is not None:
+                        with open(validator_path, "w") as f:
+                            f.write(value)
+
+                if offset:
+                    log.info(f"Resuming download at byte {offset} of {total_size}.")
+                with open(part_path, "ab" if offset else "wb") as f, progressbar(
+                    length=total_size, **progress_kwargs
+                ) as pbar:
+                    pbar.update(offset)
+                    for chunk in resp.iter_content(chunk_size=chunk_size):
+                        f.write(chunk)
+                        pbar.update(len(chunk))
+        except (
+            requests.exceptions.ConnectionError,
+            requests.exceptions.ChunkedEncodingError,
+            requests.exceptions.Timeout,
+        ) as e:
+            log.info(f"Download interrupted: {e}")
+            continue
+
+        if os.path.getsize(part_path) == total_size:
+            break
+        log.info("Download ended early.")
+    else:
+        raise RuntimeError(f"Failed to download {path} after {max_tries} tries.")
+
+    size = os.path.getsize(part_path)
+    if size != total_size:
+        raise ValueError(f"Expected {total_size} bytes but downloaded {size}.")
+
+    if md5 is None and os.path.exists(etag_path):
+        with open(etag_path) as f:
+            etag = f.read().strip('"')
+        if re.fullmatch("[0-9a-f]{32}", etag):
+            md5 = etag
+
+    if md5 is not None:
+        digest = hashlib.md5()
+        with open(part_path, "rb") as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                digest.update(chunk)
+        if digest.hexdigest() != md5:
+            os.remove(part_path)
+            raise ValueError(
+                f"Checksum mismatch for {path}: expected {md5}, "
+                f"got {digest.hexdigest()}."
+            )
+
+    os.replace(part_path, path)
+    for validator_path in (etag_path, modified_path):
+        if os.path.exists(validator_path):
+            os.remove(validator_path)
+    return path
+
+
+@click.group()
+def main():
+    pass
+
+
+@main.command("clear-cache")
+@click.option(
+    "--cache-dir",
+    envvar="DATALINK_CACHE_DIR",
+    required=True,
+    help="The DATALINK_CACHE_DIR used by the bundle.",
+)
+def clear_cache(cache_dir):
+    """Invalidate the cached Quotemedia data tables."""
+    evicted = clear_table_cache(cache_dir)
+    click.echo(f"Removed {evicted} cached data tables from {cache_dir}.")
 
-    total_size = int(resp.headers["content-length"])
-    data = BytesIO()
-    with progressbar(length=total_size, **progress_kwargs) as pbar:
-        for chunk in resp.iter_content(chunk_size=chunk_size):
-            data.write(chunk)
-            pbar.update(len(chunk))
 
-    data.seek(0)
-    return data
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+# Cache of pipeline factor values for Zipline backtests
+# -----------------------------
+# Computes a factor once over every session of a bundle and keeps its
+# values in a memory-mapped sessions x sids .npy file, keyed by the factor's
+# definition, under a directory for the bundle's latest ingestion. Backtests
+# then read the factor through a pipeline loader instead of recomputing it,
+# and re-ingesting the bundle starts a new, empty cache. ``check`` compares
+# the cached values with computing the factor in a pipeline, which
+# 02_momentum_backtest.ipynb and the alphalens notebook run when they have
+# just filled the cache. bench_factor_cache.py exercises it on a synthetic
+# bundle.
+
+# HOW TO USE:
+# cache = FactorCache("quotemedia")
+# terms = dict(
+#     momentum=MomentumFactor(),
+#     dollar_volume=AverageDollarVolume(window_length=21),
+# )
+# Factors = cache.dataset(**terms)
+# if cache.computed:
+#     cache.check(Factors, "2022-01-03", "2022-12-30", **terms)
+# momentum = Factors.momentum.latest  # in make_pipeline
+# run_algorithm(..., custom_loader=cache.loaders)
+
+import hashlib
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from interface import implements
+from zipline.data import bundles
+from zipline.data.bundles.core import to_bundle_ingest_dirname
+from zipline.lib.adjusted_array import AdjustedArray
+from zipline.pipeline import Pipeline, SimplePipelineEngine
+from zipline.pipeline.data import Column, DataSet, USEquityPricing
+from zipline.pipeline.domain import US_EQUITIES
+from zipline.pipeline.loaders import USEquityPricingLoader
+from zipline.pipeline.loaders.base import PipelineLoader
+
+CACHE_DIR = Path("~", ".zipline", "factor_cache").expanduser()
+SESSIONS_FILE_NAME = "sessions.npy"
+SIDS_FILE_NAME = "sids.npy"
+# Sessions computed per pipeline run when filling the cache
+CHUNK_SIZE = 252
+
+
+def factor_key(term):
+    """
+    A digest of a pipeline term's definition: its repr, which names its
+    class, inputs and window length, its params, and the bytecode of its
+    ``compute``, for it and recursively for its inputs. Editing a
+    ``CustomFactor`` changes its key.
+    """
+    parts = [repr(term), repr(sorted(getattr(term, "params", {}).items()))]
+    compute = getattr(type(term), "compute", None)
+    if compute is not None:
+        parts += [compute.__code__.co_code.hex(), repr(compute.__code__.co_consts)]
+    inputs = getattr(term, "inputs", ())
+    if isinstance(inputs, (list, tuple)):
+        parts += [factor_key(term_input) for term_input in inputs]
+    return hashlib.sha1("\n".join(parts).encode()).hexdigest()
+
+
+def lookback(term):
+    """The number of sessions before a date that computing ``term`` reads."""
+    inputs = getattr(term, "inputs", ())
+    if not isinstance(inputs, (list, tuple)):
+        inputs = ()
+    window_length = getattr(term, "window_length", 0) or 0
+    return max(window_length - 1, 0) + max(map(lookback, inputs), default=0)
+
+
+class FactorCacheLoader(implements(PipelineLoader)):
+    """
+    Serve the columns of a ``FactorCache.dataset`` to pipelines, reading
+    only the requested sessions of each memory-mapped array. The values are
+    stored as computed, so like ``PipelineLoader``'s default it is not
+    ``currency_aware``.
+    """
+
+    def __init__(self, cache, keys):
+        self.cache = cache
+        # Cache key of each column
+        self.keys = keys
+
+    def load_adjusted_array(self, domain, columns, dates, sids, mask):
+        rows = self.cache.sessions.get_indexer(dates)
+        if (rows < 0).any():
+            raise ValueError(
+                f"Sessions {dates[rows < 0][0].date()} to {dates[-1].date()} "
+                f"are not in the factor cache of {self.cache.bundle!r}."
+            )
+        cols = self.cache.sids.get_indexer(sids)
+        known = cols >= 0
+
+        arrays = {}
+        for column in columns:
+            values = self.cache.values(self.keys[column])
+            data = np.full((len(dates), len(sids)), np.nan)
+            data[:, known] = values[rows[0] : rows[-1] + 1][:, cols[known]]
+            arrays[column] = AdjustedArray(data, {}, column.missing_value)
+        return arrays
+
+
+class FactorCache:
+    """
+    Factor values over every session of a bundle's latest ingestion, each
+    in a memory-mapped sessions x sids float64 array.
+
+    The cache lives in ``cache_dir/<bundle>/<ingestion>``. Opening it after
+    the bundle has been re-ingested deletes the directories of the older
+    ingestions, so values are never served from stale prices.
+
+    Parameters
+    ----------
+    bundle : str
+        The name of an ingested bundle.
+    cache_dir : str or Path
+        The root directory of the caches.
+    chunk_size : int
+        Sessions per pipeline run while computing a factor, which bounds the
+        memory used.
+    """
+
+    def __init__(self, bundle, cache_dir=CACHE_DIR, chunk_size=CHUNK_SIZE):
+        self.bundle = bundle
+        self.chunk_size = chunk_size
+        self.ingestion = bundles.ingestions_for_bundle(bundle)[0]
+        self.bundle_data = bundles.load(bundle, timestamp=self.ingestion)
+
+        bundle_dir = Path(cache_dir, bundle)
+        self.cache_dir = bundle_dir / to_bundle_ingest_dirname(self.ingestion)
+        if bundle_dir.exists():
+            for path in bundle_dir.iterdir():
+                if path != self.cache_dir:
+                    shutil.rmtree(path)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+        sessions_file = self.cache_dir / SESSIONS_FILE_NAME
+        sids_file = self.cache_dir / SIDS_FILE_NAME
+        if not sessions_file.exists():
+            np.save(
+                sids_file,
+                np.asarray(self.bundle_data.asset_finder.equities_sids, np.int64),
+            )
+            # The reader's sessions span its calendar, which can reach far
+            # beyond the bars on either side
+            reader = self.bundle_data.equity_daily_bar_reader
+            sessions = reader.sessions[
+                reader.sessions.slice_indexer(
+                    reader.first_trading_day, reader.last_available_dt
+                )
+            ]
+            np.save(sessions_file, sessions.to_numpy())
+        self.sessions = pd.DatetimeIndex(np.load(sessions_file))
+        self.sids = pd.Index(np.load(sids_file))
+
+        self.arrays = {}
+        self.loaders = {}
+        # Keys of the factors computed, rather than read, by this cache
+        self.computed = set()
+        self._engine = None
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            pricing_loader = USEquityPricingLoader.without_fx(
+                self.bundle_data.equity_daily_bar_reader,
+                self.bundle_data.adjustment_reader,
+            )
+
+            def get_loader(column):
+                if column in USEquityPricing.columns:
+                    return pricing_loader
+                if column in self.loaders:
+                    return self.loaders[column]
+                raise ValueError(f"No PipelineLoader registered for {column}.")
+
+            self._engine = SimplePipelineEngine(
+                get_loader, self.bundle_data.asset_finder, default_domain=US_EQUITIES
+            )
+        return self._engine
+
+    def path(self, key):
+        return self.cache_dir / f"{key}.npy"
+
+    def values(self, key):
+        """The memory-mapped sessions x sids array of a cached factor."""
+        if key not in self.arrays:
+            self.arrays[key] = np.load(self.path(key), mmap_mode="r")
+        return self.arrays[key]
+
+    def compute(self, term):
+        """
+        Compute ``term`` over every session with enough history before it
+        and store it, unless it is cached already. Returns its key, which is
+        added to ``computed`` on a miss.
+        """
+        key = factor_key(term)
+        path = self.path(key)
+        if path.exists():
+            return key
+
+        # Write to a temporary file first, so that an interrupted run or a
+        # concurrent one never leaves a partial array under the key
+        partial = path.with_suffix(f".{os.getpid()}.partial.npy")
+        values = np.lib.format.open_memmap(
+            partial,
+            mode="w+",
+            dtype=np.float64,
+            shape=(len(self.sessions), len(self.sids)),
+        )
+        values[:] = np.nan
+        pipeline = Pipeline({"factor": term}, domain=US_EQUITIES)
+        # One more session for the pricing loader, which reads the close of
+        # the session before each date
+        first = lookback(term) + 1
+        for start in range(first, len(self.sessions), self.chunk_size):
+            end = min(start + self.chunk_size, len(self.sessions)) - 1
+            factor = self.engine.run_pipeline(
+                pipeline, self.sessions[start], self.sessions[end]
+            )["factor"]
+            index = factor.index
+            rows = self.sessions.get_indexer(index.levels[0])[index.codes[0]]
+            level_sids = [asset.sid for asset in index.levels[1]]
+            cols = self.sids.get_indexer(level_sids)[index.codes[1]]
+            values[rows, cols] = factor.to_numpy(dtype=np.float64)
+        values.flush()
+        del values
+        os.replace(partial, path)
+        self.computed.add(key)
+        return key
+
+    def dataset(self, **terms):
+        """
+        A ``DataSet`` with a float column per keyword, holding the values of
+        the term passed for it, computed now if not yet cached.
+
+        The value of a column on a date is the term's value on that date, so
+        ``Factors.momentum.latest`` in a pipeline equals the factor itself.
+        Pass ``loaders`` as ``custom_loader`` to ``run_algorithm``.
+        """
+        keys = {name: self.compute(term) for name, term in terms.items()}
+        digest = hashlib.sha1("".join(keys.values()).encode()).hexdigest()
+        columns = {name: Column(np.float64) for name in keys}
+        dataset = type(f"CachedFactors_{digest[:8]}", (DataSet,), columns)
+        dataset = dataset.specialize(US_EQUITIES)
+        loader = FactorCacheLoader(
+            self, {getattr(dataset, name): key for name, key in keys.items()}
+        )
+        for column in loader.keys:
+            self.loaders[column] = loader
+        return dataset
+
+    def check(self, dataset, start, end, rtol=1e-9, **terms):
+        """
+        Compare the columns of a ``dataset`` with computing the terms passed
+        for them in a pipeline, from ``start`` to ``end``. Raises
+        AssertionError if any value differs.
+        """
+        columns = {}
+        for name, term in terms.items():
+            columns[name] = term
+            columns[f"{name}_cached"] = getattr(dataset, name).latest
+        result = self.engine.run_pipeline(
+            Pipeline(columns, domain=US_EQUITIES),
+            pd.Timestamp(start),
+            pd.Timestamp(end),
+        )
+        for name in terms:
+            np.testing.assert_allclose(
+                result[f"{name}_cached"],
+                result[name],
+                rtol=rtol,
+                equal_nan=True,
+                err_msg=f"Cached {name} differs from the pipeline's.",
+            )
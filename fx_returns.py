@@ -0,0 +1,133 @@
+import numpy as np
+import pandas as pd
+
+# Daily risk free rate, as in nzd_adjusted_returns.py
+RISK_FREE_RATE = 0.05 / 252
+
+
+class FxAdjustedReturns:
+    """
+    Returns of many assets converted into many currencies, generalizing the
+    single SPY x NZD/USD pair of ``nzd_adjusted_returns.py``.
+
+    The asset and FX closes are aligned on their shared dates once. An
+    asset's price in a currency is its close times that currency's FX close,
+    as ``fx_adj_close`` is computed in the script, so pass the inverse of a
+    rate quoted the other way round.
+
+    The statistics of every asset/currency pair are computed from matrix
+    products of the asset and FX returns, so memory grows with assets x
+    currencies rather than dates x assets x currencies. Each pair uses the
+    dates where both of its series have returns.
+
+    Parameters
+    ----------
+    prices : pd.DataFrame
+        Asset closes indexed by date with one column per asset.
+    fx : pd.DataFrame
+        FX closes indexed by date with one column per currency.
+    """
+
+    def __init__(self, prices, fx):
+        index = prices.index.intersection(fx.index).sort_values()
+        self.index = index[1:]
+        self.assets = prices.columns
+        self.currencies = fx.columns
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            # Gross returns, 1 + pct_change
+            self.asset_growth = self.growth(prices.reindex(index).to_numpy())
+            self.fx_growth = self.growth(fx.reindex(index).to_numpy())
+        self.asset_valid = ~np.isnan(self.asset_growth)
+        self.fx_valid = ~np.isnan(self.fx_growth)
+        # Net returns with missing days as 0, so that sums over the dates of
+        # a product of asset and FX terms only count days both have
+        self.asset_returns = np.where(self.asset_valid, self.asset_growth - 1, 0.0)
+        self.fx_returns = np.where(self.fx_valid, self.fx_growth - 1, 0.0)
+
+        # Days with returns for both series of each pair
+        self.counts = self.asset_valid.T.astype(np.float64) @ self.fx_valid
+
+    @staticmethod
+    def growth(values):
+        growth = values[1:] / values[:-1]
+        growth[~np.isfinite(growth)] = np.nan
+        return growth
+
+    def frame(self, values):
+        return pd.DataFrame(values, index=self.assets, columns=self.currencies)
+
+    def returns(self, currency):
+        """The daily returns of every asset in ``currency``."""
+        fx = self.fx_growth[:, self.currencies.get_loc(currency)]
+        return pd.DataFrame(
+            self.asset_growth * fx[:, None] - 1, index=self.index, columns=self.assets
+        )
+
+    def cumulative_returns(self, currency):
+        """The cumulative returns of every asset in ``currency``."""
+        return (1 + self.returns(currency)).cumprod() - 1
+
+    def total_returns(self):
+        """The cumulative return of every asset in every currency."""
+        log_assets = np.log1p(self.asset_returns)
+        log_fx = np.log1p(self.fx_returns)
+        log_total = log_assets.T @ self.fx_valid + self.asset_valid.T @ log_fx
+        return self.frame(np.expm1(log_total))
+
+    def moments(self):
+        """
+        The sums of the FX adjusted returns, ``a + f + a * f`` for asset
+        return ``a`` and FX return ``f``, and of their squares, over each
+        pair's days, expanded into products of asset and FX terms.
+        """
+        a, f = self.asset_returns, self.fx_returns
+        valid_a = self.asset_valid.astype(np.float64)
+        valid_f = self.fx_valid.astype(np.float64)
+        a2, f2 = a**2, f**2
+
+        sums = a.T @ valid_f + valid_a.T @ f + a.T @ f
+        squares = (
+            a2.T @ valid_f
+            + valid_a.T @ f2
+            + a2.T @ f2
+            + 2 * (a.T @ f + a2.T @ f + a.T @ f2)
+        )
+        return sums, squares
+
+    def sharpe(self, rf=RISK_FREE_RATE):
+        """
+        The daily Sharpe ratio, ``(mean - rf) / std``, of every asset in
+        every currency.
+        """
+        n = self.counts
+        sums, squares = self.moments()
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mean = sums / n
+            variance = (squares - sums * mean) / (n - 1)
+            sharpe = (mean - rf) / np.sqrt(np.maximum(variance, 0.0))
+        return self.frame(sharpe)
+
+    def fx_correlation(self):
+        """
+        The correlation of every asset's returns with every currency's
+        returns, over the days both have one.
+        """
+        n = self.counts
+        a, f = self.asset_returns, self.fx_returns
+        valid_a = self.asset_valid.astype(np.float64)
+        valid_f = self.fx_valid.astype(np.float64)
+
+        # Means and variances of each series over the days of each pair
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mean_a = a.T @ valid_f / n
+            mean_f = valid_a.T @ f / n
+            covariance = a.T @ f / n - mean_a * mean_f
+            var_a = (a**2).T @ valid_f / n - mean_a**2
+            var_f = valid_a.T @ f**2 / n - mean_f**2
+            correlation = covariance / np.sqrt(var_a * var_f)
+        return self.frame(np.clip(correlation, -1.0, 1.0))
+
+    def correlation(self, currency):
+        """The correlation matrix of the assets' returns in ``currency``."""
+        return self.returns(currency).corr()
@@ -0,0 +1,188 @@
+import threading
+import time
+
+import pandas as pd
+
+# Order statuses after which TWS sends no more updates for the order
+DONE_STATUSES = {"Filled", "Cancelled", "ApiCancelled", "Inactive"}
+# Error codes sent for an order that leave it working, such as a price
+# adjusted to the tick size. Codes from 2100 on are notices.
+ORDER_WARNING_CODES = {161, 399, 404, 434}
+
+POSITION_COLUMNS = ["Account", "Symbol", "SecType", "Currency", "Position", "Avg cost"]
+ORDER_COLUMNS = [
+    "Symbol",
+    "Action",
+    "Quantity",
+    "Status",
+    "Filled",
+    "Remaining",
+    "Avg fill price",
+    "Submitted",
+    "Done",
+    "Error",
+]
+
+
+class PositionBook:
+    """
+    Positions and orders of an IB account, kept up to date from the
+    ``EWrapper`` callbacks.
+
+    Positions are keyed by symbol and orders by order id, so each callback
+    is an O(1) dict update under a lock. Waiting for the positions or for
+    orders to finish blocks on the ``positionEnd`` and ``orderStatus``
+    callbacks rather than sleeping.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        self.positions = {}
+        self.orders = {}
+        self.positions_done = False
+        # Account summary values by tag, such as "TotalCashValue"
+        self.account = {}
+        self.account_done = False
+
+    def request_positions(self):
+        """Mark the positions incomplete until the next ``positionEnd``."""
+        with self.lock:
+            self.positions_done = False
+
+    def on_position(self, account, contract, position, avg_cost):
+        with self.lock:
+            self.positions[contract.symbol] = {
+                "Account": account,
+                "Symbol": contract.symbol,
+                "SecType": contract.secType,
+                "Currency": contract.currency,
+                "Position": position,
+                "Avg cost": avg_cost,
+            }
+
+    def request_account_summary(self):
+        """Mark the account summary incomplete until ``accountSummaryEnd``."""
+        with self.lock:
+            self.account_done = False
+
+    def on_account_summary(self, tag, value):
+        with self.lock:
+            self.account[tag] = value
+
+    def on_account_summary_end(self):
+        with self.changed:
+            self.account_done = True
+            self.changed.notify_all()
+
+    def wait_for_account_summary(self, timeout=None):
+        """
+        Block until ``accountSummaryEnd`` has been received since the last
+        ``request_account_summary``. Returns False on timeout.
+        """
+        with self.changed:
+            return self.changed.wait_for(lambda: self.account_done, timeout)
+
+    def on_position_end(self):
+        with self.changed:
+            self.positions_done = True
+            self.changed.notify_all()
+
+    def on_order_submitted(self, order_id, contract, order):
+        """Start tracking an order. Call before ``placeOrder``."""
+        with self.lock:
+            self.orders[order_id] = {
+                "Symbol": contract.symbol,
+                "Action": order.action,
+                "Quantity": order.totalQuantity,
+                "Status": "PendingSubmit",
+                "Filled": 0.0,
+                "Remaining": order.totalQuantity,
+                "Avg fill price": 0.0,
+                "Submitted": time.monotonic(),
+                "Done": None,
+                "Error": None,
+            }
+
+    def on_order_status(self, order_id, status, filled, remaining, avg_fill_price):
+        with self.changed:
+            order = self.orders.get(order_id)
+            if order is None:
+                # Orders placed by another session
+                return
+            order.update(
+                {
+                    "Status": status,
+                    "Filled": filled,
+                    "Remaining": remaining,
+                    "Avg fill price": avg_fill_price,
+                }
+            )
+            if status in DONE_STATUSES and order["Done"] is None:
+                order["Done"] = time.monotonic()
+                self.changed.notify_all()
+
+    def on_error(self, req_id, error_code, error_string):
+        """
+        Mark an order rejected by an error, such as 201 for an order TWS
+        refuses, which may come without any ``orderStatus``.
+        """
+        if error_code in ORDER_WARNING_CODES or error_code >= 2100:
+            return
+        with self.changed:
+            order = self.orders.get(req_id)
+            if order is None or order["Done"] is not None:
+                # Errors of other requests, or of orders already done
+                return
+            order["Status"] = "Rejected"
+            order["Error"] = f"{error_code}: {error_string}"
+            order["Done"] = time.monotonic()
+            self.changed.notify_all()
+
+    def wait_for_positions(self, timeout=None):
+        """
+        Block until ``positionEnd`` has been received since the last
+        ``request_positions``. Returns False on timeout.
+        """
+        with self.changed:
+            return self.changed.wait_for(lambda: self.positions_done, timeout)
+
+    def wait_for_orders(self, order_ids, timeout=None):
+        """
+        Block until every order in ``order_ids`` is filled, cancelled,
+        inactive or rejected. Returns False on timeout.
+        """
+        with self.changed:
+            return self.changed.wait_for(
+                lambda: all(
+                    self.orders[order_id]["Done"] is not None for order_id in order_ids
+                ),
+                timeout,
+            )
+
+    def wait_for_change(self, timeout=None):
+        """Block until an order finishes or ``positionEnd`` arrives."""
+        with self.changed:
+            self.changed.wait(timeout)
+
+    def fill_value(self, order_ids):
+        """The value filled so far of the orders in ``order_ids``."""
+        with self.lock:
+            return sum(
+                self.orders[order_id]["Filled"]
+                * self.orders[order_id]["Avg fill price"]
+                for order_id in order_ids
+            )
+
+    def snapshot(self):
+        """The positions at one instant, in the layout of ``pos_df``."""
+        with self.lock:
+            rows = list(self.positions.values())
+        return pd.DataFrame(rows, columns=POSITION_COLUMNS)
+
+    def order_snapshot(self):
+        """The orders at one instant, indexed by order id."""
+        with self.lock:
+            orders = {order_id: dict(order) for order_id, order in self.orders.items()}
+        return pd.DataFrame.from_dict(orders, orient="index", columns=ORDER_COLUMNS)
+
@@ -1,10 +1,13 @@
 import pandas as pd
 import numpy as np
 from openbb import obb
-from arcticdb import Arctic, QueryBuilder
+from arcticdb import Arctic, DataError, QueryBuilder, ReadRequest, UpdatePayload
 import pytz
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+ac = Arctic("lmdb:///data/arcticdb")
+
 def today_ny():
     # Define time zones
     nz_timezone = pytz.timezone('Pacific/Auckland')  # New Zealand Time Zone
@@ -22,31 +25,115 @@ def today_ny():
     
 today = today_ny()
 
-def get_data(symbol, interval='DAILY'):
-    ac = Arctic("lmdb:///data/arcticdb")
+def fetch_remote(symbol, start_date=None):
+    data = obb.equity.price.historical(symbol=symbol, start_date=start_date, interval="1d", provider="yfinance").to_df()
+    data.index = pd.to_datetime(data.index)
+    return data
+
+def watermark(data):
+    # Symbol metadata recording the last date stored, so staleness checks don't read the data
+    return {"last_date": data.index[-1].strftime('%Y-%m-%d')}
+
+def read_last_date(lib, symbol, metadata):
+    if metadata and "last_date" in metadata:
+        return pd.Timestamp(metadata["last_date"])
+    # Symbols written before watermarks were stored
+    return lib.tail(symbol, n=1).data.index[-1]
+
+def get_data(symbol, interval='DAILY', date_range=None, columns=None, query_builder=None):
     lib = ac[interval]
-    try:
-        # Try loading from the local DB
-        data_local = lib.read(symbol)
-        first_date = data_local.data.head(1).index
-        last_date = data_local.data.tail(1).index
-        str_date_range = f"{np.datetime_as_string(first_date, unit='D')[0]} to {np.datetime_as_string(last_date, unit='D')[0]}"
+    if lib.has_symbol(symbol):
+        last_date = read_last_date(lib, symbol, lib.read_metadata(symbol).metadata)
         # Get the latest data
         if last_date < today:
-            print(f"{symbol} Retreiving latest data up to {today}. Current data range {str_date_range}")
-            data_remote = obb.equity.price.historical(symbol=symbol, start_date = last_date, interval="1d", provider="yfinance")    
-            # Write the new data to the DB
-            lib.write(symbol, data_remote.to_df())
+            print(f"{symbol} Retreiving latest data up to {today}. Current data up to {last_date:%Y-%m-%d}")
+            data_remote = fetch_remote(symbol, start_date=last_date)
+            # Update replaces the overlapping last_date row rather than duplicating it,
+            # and keeps the history before it
+            if len(data_remote):
+                lib.update(symbol, data_remote, metadata=watermark(data_remote))
         else:
-            print(f"{symbol} Data up to date {str_date_range}")
-    except:
+            print(f"{symbol} Data up to date {last_date:%Y-%m-%d}")
+    else:
         # get all of the data if the symbol doesn't yet exist
-        data_remote = obb.equity.price.historical(symbol=symbol, interval="1d", provider="yfinance")
+        data_remote = fetch_remote(symbol)
+        if not len(data_remote):
+            print(f"{symbol} No data available")
+            return None
         # Write the new data to the DB
-        lib.write(symbol, data_remote.to_df())
+        lib.write(symbol, data_remote, metadata=watermark(data_remote))
     
-    # Load all the data from the DB for analysis
-    return lib.read(symbol)
+    # Load the data from the DB for analysis. The date range, columns and
+    # QueryBuilder filter are applied by ArcticDB, so only the slice asked
+    # for is read
+    return lib.read(symbol, date_range=date_range, columns=columns, query_builder=query_builder)
+
+def read_wide(symbols, column='close', interval='DAILY', date_range=None, query_builder=None):
+    """Read one column of many symbols as a dates x symbols frame.
+
+    The symbols are read in one batch with the date range, column and
+    QueryBuilder filter pushed down to ArcticDB, then aligned on the union
+    of their dates.
+    """
+    lib = ac[interval]
+    symbols = list(symbols)
+    requests = [ReadRequest(symbol, date_range=date_range, columns=[column], query_builder=query_builder) for symbol in symbols]
+    frames = {}
+    for item in lib.read_batch(requests):
+        if isinstance(item, DataError):
+            print(f"{item.symbol} Failed to read: {item.exception_string}")
+        else:
+            frames[item.symbol] = item.data[column]
+    if not frames:
+        return pd.DataFrame(index=pd.DatetimeIndex([]), columns=symbols, dtype=float)
+    return pd.concat(frames, axis=1)
+
+def refresh_symbols(symbols, interval='DAILY', max_workers=8):
+    """Bring many symbols up to date at once.
+
+    Staleness is read from the last_date watermarks in the symbol metadata.
+    Stale and missing symbols are fetched concurrently on a pool of
+    max_workers threads sharing one Arctic connection. Everything fetched is
+    then written in one update_batch: stale symbols are updated from their
+    last_date as in get_data, so a partial last bar stored earlier is
+    replaced, and new symbols are created by the upsert.
+    Returns the symbols that were written.
+    """
+    lib = ac[interval]
+    symbols = list(dict.fromkeys(symbols))
+    existing = set(lib.list_symbols())
+    metadata = lib.read_metadata_batch([symbol for symbol in symbols if symbol in existing])
+    metadata = {item.symbol: item.metadata for item in metadata if not isinstance(item, DataError)}
+
+    def refresh(symbol):
+        try:
+            if symbol not in existing:
+                return fetch_remote(symbol)
+            last_date = read_last_date(lib, symbol, metadata.get(symbol))
+            if last_date >= today:
+                return None
+            return fetch_remote(symbol, start_date=last_date)
+        except Exception as e:
+            print(f"{symbol} Failed to refresh: {e}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        results = dict(zip(symbols, pool.map(refresh, symbols)))
+
+    payloads = [UpdatePayload(symbol, data, metadata=watermark(data)) for symbol, data in results.items() if data is not None and len(data)]
+    new = [payload for payload in payloads if payload.symbol not in existing]
+    written = []
+    # Update replaces the overlapping last_date row, as in get_data, and the
+    # upsert writes symbols that don't exist yet
+    for result in lib.update_batch(payloads, upsert=True) if payloads else []:
+        # Batch writes return errors rather than raising them
+        if isinstance(result, DataError):
+            print(f"{result.symbol} Failed to write: {result.exception_string}")
+        else:
+            written.append(result.symbol)
+
+    print(f"Refreshed {len(payloads)} of {len(results)} symbols, {len(new)} new")
+    return written
 
 data = get_data("GOOG")
 
@@ -54,12 +141,13 @@ undervalued_growth = obb.equity.discovery.undervalued_growth(sort="desc")
 
 undervalued_growth.to_df()
 
-for sym in undervalued_growth.to_df().symbol:
-    get_data(sym)
+refresh_symbols(undervalued_growth.to_df().symbol)
 
 
 lib = ac['DAILY']
 lib.list_symbols()
+
+closes = read_wide(lib.list_symbols(), date_range=(pd.Timestamp(today) - pd.DateOffset(years=1), None))
     
 data = openbb.stocks.load('AAPL', start_date='2020-01-01')
 
@@ -1,4 +1,5 @@
 import numpy as np
+import pandas as pd
 from openbb_terminal.sdk import openbb
 from arcticdb import Arctic, QueryBuilder
 import pytz
@@ -24,28 +25,38 @@ def today_ny():
     
 today = today_ny()
 
+def watermark(data):
+    # Symbol metadata recording the last date stored, so staleness checks don't read the data
+    return {"last_date": data.index[-1].strftime('%Y-%m-%d')}
+
+def read_last_date(lib, symbol, metadata):
+    if metadata and "last_date" in metadata:
+        return pd.Timestamp(metadata["last_date"])
+    # Symbols written before watermarks were stored
+    return lib.tail(symbol, n=1).data.index[-1]
+
 def get_data(symbol, interval='DAILY'):
     lib = ac[interval]
-    try:
-        # Try loading from the local DB
-        data_local = lib.read(symbol)
-        first_date = data_local.data.head(1).index
-        last_date = data_local.data.tail(1).index
-        str_date_range = f"{np.datetime_as_string(first_date, unit='D')[0]} to {np.datetime_as_string(last_date, unit='D')[0]}"
+    if lib.has_symbol(symbol):
+        last_date = read_last_date(lib, symbol, lib.read_metadata(symbol).metadata)
         # Get the latest data
         if last_date < today:
-            print(f"{symbol} Retreiving latest data up to {today}. Current data range {str_date_range}")
-            data_remote = openbb.stocks.load(symbol, start_date=last_date, end_date=today)    
-            # Write the new data to the DB
-            lib.write(symbol, data_remote)
+            print(f"{symbol} Retreiving latest data up to {today}. Current data up to {last_date:%Y-%m-%d}")
+            data_remote = openbb.stocks.load(symbol, start_date=last_date, end_date=today)
+            # Update replaces the overlapping last_date row rather than duplicating it,
+            # and keeps the history before it
+            if len(data_remote):
+                lib.update(symbol, data_remote, metadata=watermark(data_remote))
         else:
-            print(f"{symbol} Data up to date {str_date_range}")
-    except:
+            print(f"{symbol} Data up to date {last_date:%Y-%m-%d}")
+    else:
         # get all of the data if the symbol doesn't yet exist
         data_remote = openbb.stocks.load(symbol)
+        if not len(data_remote):
+            print(f"{symbol} No data available")
+            return None
         # Write the new data to the DB
-        lib.write(symbol, data_remote)
+        lib.write(symbol, data_remote, metadata=watermark(data_remote))
     
     # Load all the data from the DB for analysis
     return lib.read(symbol)
-
@@ -0,0 +1,273 @@
+import numpy as np
+import pandas as pd
+
+LONG_WINDOW = 252
+SHORT_WINDOW = 21
+VOL_WINDOW = 126
+
+
+def momentum(close):
+    """
+    The momentum of a single 252 day window of closes, as applied with
+    ``groupby("symbol").rolling(252).close.apply(momentum)`` in the momentum
+    notebooks.
+
+    The return over the past year excluding the last month, less the return
+    over the last month, normalized by the standard deviation of the daily
+    returns over the past 126 days.
+    """
+    returns = close.pct_change()[-126:]
+    return (
+        (close.iloc[-21] - close.iloc[-252]) / close.iloc[-252]
+        - (close.iloc[-1] - close.iloc[-21]) / close.iloc[-21]
+    ) / np.std(returns)
+
+
+def lag(values, periods):
+    """Shift the rows of a 2-D array down by ``periods``, filling with NaN."""
+    lagged = np.full_like(values, np.nan)
+    lagged[periods:] = values[: len(values) - periods]
+    return lagged
+
+
+def rolling_sum(values, window):
+    """
+    Trailing sums over ``window`` rows of a 2-D array, updated in O(1) per
+    row from a cumulative sum. The first ``window - 1`` rows are NaN.
+    """
+    cumsum = np.cumsum(values, axis=0)
+    sums = np.full_like(cumsum, np.nan)
+    sums[window - 1 :] = cumsum[window - 1 :]
+    sums[window:] -= cumsum[:-window]
+    return sums
+
+
+def rolling_std(values, window):
+    """
+    Trailing population standard deviation over ``window`` rows of a 2-D
+    array without NaNs, from rolling sums and sums of squares.
+    """
+    # Centering each column first keeps the sums of squares well conditioned.
+    values = values - values.mean(axis=0)
+    mean = rolling_sum(values, window) / window
+    variance = rolling_sum(values**2, window) / window - mean**2
+    return np.sqrt(np.maximum(variance, 0.0))
+
+
+def momentum_factor(
+    close,
+    long_window=LONG_WINDOW,
+    short_window=SHORT_WINDOW,
+    vol_window=VOL_WINDOW,
+):
+    """
+    Compute ``momentum`` over every rolling window of a dates x symbols close
+    matrix in one vectorized pass.
+
+    Each row is scored from lagged closes and an O(1) per row rolling
+    standard deviation of daily returns, rather than calling ``momentum`` once
+    per symbol per day. A score is only produced when the whole
+    ``long_window`` of closes is present, as with ``rolling(252)``.
+
+    Parameters
+    ----------
+    close : pd.DataFrame
+        Closing prices indexed by date with one column per symbol. Windows
+        are counted in rows, so each column should hold consecutive trading
+        days for its symbol, with NaN before it starts trading.
+    long_window : int
+        Length of the window, the ``252`` in ``close[-252]``.
+    short_window : int
+        Length of the recent period, the ``21`` in ``close[-21]``.
+    vol_window : int
+        Number of daily returns in the standard deviation.
+
+    Returns
+    -------
+    factor : pd.DataFrame
+        The momentum scores, shaped like ``close``.
+    """
+    values = close.to_numpy(dtype=np.float64)
+
+    complete = rolling_sum(np.isfinite(values).astype(np.float64), long_window)
+    complete = complete == long_window
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        returns = np.full_like(values, np.nan)
+        returns[1:] = values[1:] / values[:-1] - 1
+        returns[~np.isfinite(returns)] = 0.0
+
+        start = lag(values, long_window - 1)
+        month_ago = lag(values, short_window - 1)
+        factor = (
+            (month_ago - start) / start - (values - month_ago) / month_ago
+        ) / rolling_std(returns, vol_window)
+
+    factor[~complete] = np.nan
+    return pd.DataFrame(factor, index=close.index, columns=close.columns)
+
+
+def momentum_long(prices, column="close", **kwargs):
+    """
+    ``momentum_factor`` for a long frame indexed by (symbol, date), as built
+    in the momentum notebooks. Returns a Series on the same index.
+
+    Windows are counted in each symbol's own rows, as with
+    ``groupby("symbol").rolling(252)``, so a date missing for one symbol
+    doesn't break its windows.
+    """
+    close = prices[column].sort_index()
+    # Lay each symbol's rows out consecutively in its own column rather than
+    # by date, where its missing dates would become NaN rows
+    rows = close.groupby(level=0).cumcount().to_numpy()
+    cols, symbols = pd.factorize(close.index.get_level_values(0))
+    compact = np.full((rows.max(initial=-1) + 1, len(symbols)), np.nan)
+    compact[rows, cols] = close.to_numpy(dtype=np.float64)
+
+    factor = momentum_factor(pd.DataFrame(compact, columns=symbols), **kwargs)
+    factor = factor.to_numpy()[rows, cols]
+    return pd.Series(factor, index=close.index).reindex(prices.index)
+
+
+class MomentumScorer:
+    """
+    Incremental daily ``momentum`` scoring.
+
+    Keeps a ring buffer of the last ``long_window`` closes of each symbol,
+    with running sums and sums of squares of its last ``vol_window`` daily
+    returns, so each new bar is scored in O(symbols) without reloading or
+    recomputing the history. The state can be saved and loaded to resume
+    after a restart.
+
+    Windows are counted in each symbol's own bars, as with
+    ``groupby("symbol").rolling(252)``.
+    """
+
+    def __init__(
+        self,
+        symbols=(),
+        long_window=LONG_WINDOW,
+        short_window=SHORT_WINDOW,
+        vol_window=VOL_WINDOW,
+    ):
+        self.long_window = long_window
+        self.short_window = short_window
+        self.vol_window = vol_window
+
+        self.symbols = pd.Index([])
+        self.closes = np.empty((long_window, 0))
+        self.counts = np.empty(0, dtype=np.int64)
+        self.sum_returns = np.empty(0)
+        self.sum_squares = np.empty(0)
+        self.add_symbols(symbols)
+
+    def add_symbols(self, symbols):
+        """Start tracking symbols that are not tracked yet."""
+        symbols = pd.Index(symbols).difference(self.symbols)
+        n = len(symbols)
+        self.symbols = self.symbols.append(symbols)
+        self.closes = np.hstack([self.closes, np.full((self.long_window, n), np.nan)])
+        self.counts = np.concatenate([self.counts, np.zeros(n, dtype=np.int64)])
+        self.sum_returns = np.concatenate([self.sum_returns, np.zeros(n)])
+        self.sum_squares = np.concatenate([self.sum_squares, np.zeros(n)])
+
+    def update(self, close):
+        """
+        Add one bar per symbol and score it.
+
+        Parameters
+        ----------
+        close : pd.Series
+            Today's close indexed by symbol. Symbols that are missing or NaN
+            have no bar today.
+
+        Returns
+        -------
+        scores : pd.DataFrame
+            ``momentum`` and its descending cross-sectional ``factor_rank``,
+            indexed by symbol, for the symbols with a bar today and a full
+            window.
+        """
+        close = close.dropna()
+        self.add_symbols(close.index)
+        sids = self.symbols.get_indexer(close.index)
+        values = close.to_numpy(dtype=np.float64)
+
+        window = self.long_window
+        # Position of today's close in each symbol's own history
+        t = self.counts[sids]
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            previous = self.closes[(t - 1) % window, sids]
+            entering = np.where(t >= 1, values / previous - 1, 0.0)
+
+            # The return falling out of the vol window, from closes still in
+            # the buffer as today's close only overwrites the oldest one.
+            start = t - self.vol_window
+            leaving = np.where(
+                start >= 1,
+                self.closes[start % window, sids]
+                / self.closes[(start - 1) % window, sids]
+                - 1,
+                0.0,
+            )
+            # A zero close makes the next return infinite, which
+            # momentum_factor counts as no return.
+            entering[~np.isfinite(entering)] = 0.0
+            leaving[~np.isfinite(leaving)] = 0.0
+
+        self.sum_returns[sids] += entering - leaving
+        self.sum_squares[sids] += entering**2 - leaving**2
+        self.closes[t % window, sids] = values
+        self.counts[sids] += 1
+
+        full = t >= window - 1
+        t, sids, values = t[full], sids[full], values[full]
+
+        start = self.closes[(t - (window - 1)) % window, sids]
+        month_ago = self.closes[(t - (self.short_window - 1)) % window, sids]
+        mean = self.sum_returns[sids] / self.vol_window
+        with np.errstate(divide="ignore", invalid="ignore"):
+            variance = self.sum_squares[sids] / self.vol_window - mean**2
+            factor = (
+                (month_ago - start) / start - (values - month_ago) / month_ago
+            ) / np.sqrt(np.maximum(variance, 0.0))
+
+        scores = pd.DataFrame({"momentum": factor}, index=self.symbols[sids])
+        scores["factor_rank"] = scores.momentum.rank(ascending=False)
+        return scores
+
+    @classmethod
+    def from_close(cls, close, **kwargs):
+        """
+        Build the state from a dates x symbols close matrix by replaying its
+        last ``long_window`` rows, which is all the state depends on.
+        """
+        scorer = cls(close.columns, **kwargs)
+        for date in close.index[-scorer.long_window :]:
+            scorer.update(close.loc[date])
+        return scorer
+
+    def save(self, path):
+        """Save the state to an ``.npz`` file."""
+        np.savez(
+            path,
+            windows=[self.long_window, self.short_window, self.vol_window],
+            symbols=self.symbols.to_numpy(dtype=str),
+            closes=self.closes,
+            counts=self.counts,
+            sum_returns=self.sum_returns,
+            sum_squares=self.sum_squares,
+        )
+
+    @classmethod
+    def load(cls, path):
+        """Resume from a state saved with ``save``."""
+        with np.load(path) as state:
+            scorer = cls((), *state["windows"].tolist())
+            scorer.symbols = pd.Index(state["symbols"].astype(object))
+            scorer.closes = state["closes"]
+            scorer.counts = state["counts"]
+            scorer.sum_returns = state["sum_returns"]
+            scorer.sum_squares = state["sum_squares"]
+        return scorer
@@ -0,0 +1,473 @@
+# Vectorized backtest of the momentum long/short strategy
+# -----------------------------
+# Replays the strategy of 02_momentum_backtest.ipynb on dates x assets arrays
+# of closes and volumes instead of through run_algorithm, so that parameter
+# studies over N_LONGS, the factor windows and the rebalance frequency run in
+# seconds.
+#
+# The pipeline (MomentumFactor, AverageDollarVolume, top and bottom) is
+# computed for every date at once. The trading is modelled on Zipline's daily
+# mode: orders placed at a rebalance fill from the next bar's close, with
+# VolumeShareSlippage volume limits and price impact and PerShare
+# commissions, in one compiled loop over the dates.
+#
+# bench_momentum_backtest.py checks its portfolio values against
+# run_algorithm on a synthetic bundle, where they agree to rounding. Prices
+# are adjusted, so on a real bundle splits and dividends are not traded the
+# way Zipline trades them; compare_with_zipline measures the drift.
+
+# HOW TO USE:
+# python momentum_backtest.py
+
+from itertools import product
+
+import numpy as np
+import pandas as pd
+from numba import njit
+
+from cross_section import bottom, top
+from momentum import lag, rolling_sum
+
+N_LONGS = N_SHORTS = 50
+DOLLAR_VOLUME = 500
+DOLLAR_VOLUME_WINDOW = 21
+LONG_WINDOW = 252
+SHORT_WINDOW = 21
+RETURNS_WINDOW = 126
+REBALANCE = "week_start"
+
+CAPITAL_BASE = 100_000
+# commission.PerShare(cost=0.005, min_trade_cost=2.0)
+COST_PER_SHARE = 0.005
+MIN_TRADE_COST = 2.0
+# slippage.VolumeShareSlippage(volume_limit=0.0025, price_impact=0.01)
+VOLUME_LIMIT = 0.0025
+PRICE_IMPACT = 0.01
+
+TRADING_DAYS = 252
+
+PERF_COLUMNS = [
+    "portfolio_value",
+    "cash",
+    "long_value",
+    "short_value",
+    "traded_value",
+    "commission",
+    "slippage",
+]
+
+
+def load_bundle_arrays(bundle, start, end, calendar="XNYS"):
+    """
+    Read the closes and volumes of every asset of an ingested bundle from
+    ``start``, or the bundle's first session if later, to ``end``, adjusted
+    for splits and dividends as of ``end``.
+
+    Returns
+    -------
+    close, volume : pd.DataFrame
+        Indexed by session with one column per asset.
+    """
+    from zipline.data import bundles
+    from zipline.data.data_portal import DataPortal
+    from zipline.utils.calendar_utils import get_calendar
+
+    trading_calendar = get_calendar(calendar)
+    bundle_data = bundles.load(bundle)
+    reader = bundle_data.equity_daily_bar_reader
+    portal = DataPortal(
+        bundle_data.asset_finder,
+        trading_calendar=trading_calendar,
+        first_trading_day=reader.first_trading_day,
+        equity_daily_reader=reader,
+        adjustment_reader=bundle_data.adjustment_reader,
+    )
+    # History windows can't reach before the bundle's first session
+    start = max(pd.Timestamp(start), reader.first_trading_day)
+    sessions = trading_calendar.sessions_in_range(start, end)
+    assets = bundle_data.asset_finder.retrieve_all(
+        bundle_data.asset_finder.equities_sids
+    )
+    close, volume = (
+        portal.get_history_window(
+            assets, sessions[-1], len(sessions), "1d", field, "daily"
+        )
+        for field in ("close", "volume")
+    )
+    return close, volume
+
+
+def momentum_factor(
+    close,
+    long_window=LONG_WINDOW,
+    short_window=SHORT_WINDOW,
+    returns_window=RETURNS_WINDOW,
+):
+    """
+    The notebook's ``MomentumFactor`` for every date of a dates x assets
+    close matrix, each row computed from the window ending on that row.
+
+    As in the pipeline, the normalization is the standard deviation of the
+    ``Returns(window_length=returns_window)`` values over the whole
+    ``long_window``, not of daily returns as in ``momentum.momentum_factor``.
+    """
+    values = close.to_numpy(dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        returns = values / lag(values, returns_window - 1) - 1
+    volatility = (
+        pd.DataFrame(returns).rolling(long_window, min_periods=1).std(ddof=0).to_numpy()
+    )
+    with np.errstate(divide="ignore", invalid="ignore"):
+        start = lag(values, long_window - 1)
+        month_ago = lag(values, short_window - 1)
+        factor = (
+            (month_ago - start) / start - (values - month_ago) / month_ago
+        ) / volatility
+    return pd.DataFrame(factor, index=close.index, columns=close.columns)
+
+
+def average_dollar_volume(close, volume, window=DOLLAR_VOLUME_WINDOW):
+    """Zipline's ``AverageDollarVolume``, NaNs counting as no volume."""
+    dollars = np.nan_to_num(close.to_numpy(dtype=np.float64) * volume.to_numpy())
+    average = rolling_sum(dollars, window) / window
+    return pd.DataFrame(average, index=close.index, columns=close.columns)
+
+
+def pipeline_assets(close):
+    """
+    Mark, on each date, the assets that the pipeline run on the next
+    session ranks, given the data up to that date.
+
+    Zipline's ``top`` and ``bottom`` rank the assets that exist on the
+    session the pipeline runs for, from their first bar to their last, so an
+    asset whose last bar is on a date drops out of the next day's ranking.
+    Assets with a bar on the last date are taken to still exist after it.
+    Mask the factor and the screen's values with it before ranking them.
+    """
+    valid = np.isfinite(close.to_numpy(dtype=np.float64))
+    n_dates = len(valid)
+    listed = valid.any(axis=0)
+    first = np.where(listed, valid.argmax(axis=0), n_dates)
+    last = np.where(listed, n_dates - 1 - valid[::-1].argmax(axis=0), -1)
+    next_date = np.minimum(np.arange(n_dates) + 1, n_dates - 1)[:, None]
+    mask = (first <= next_date) & (next_date <= last)
+    return pd.DataFrame(mask, index=close.index, columns=close.columns)
+
+
+def rebalance_days(index, frequency=REBALANCE):
+    """
+    Mark the sessions of ``index`` on which to rebalance, the first of each
+    week or month like ``date_rules.week_start()`` and
+    ``date_rules.month_start()``, or every session.
+
+    The first session of ``index`` is taken as the start of its week or
+    month. A backtest starting mid-week should mark the whole history and
+    then slice it, as Zipline waits for the next week to start.
+    """
+    if frequency == "daily":
+        return np.ones(len(index), dtype=bool)
+    if frequency == "week_start":
+        period = index.to_period("W")
+    elif frequency == "month_start":
+        period = index.to_period("M")
+    else:
+        raise ValueError(f"Unknown rebalance frequency {frequency!r}.")
+    first = np.ones(len(index), dtype=bool)
+    first[1:] = period[1:] != period[:-1]
+    return first
+
+
+def target_weights(factor, screen, n_longs=N_LONGS, n_shorts=N_SHORTS):
+    """
+    The target weight of every asset on every date from the pipeline of
+    the notebook: ``1 / n_longs`` for the top ``n_longs`` factor values and
+    ``-1 / n_shorts`` for the bottom ``n_shorts``, among the assets passing
+    ``screen``, and 0 for the rest.
+
+    Like the pipeline output in ``before_trading_start``, each date uses the
+    factor and screen of the previous session. ``top`` and ``bottom`` run
+    over all assets and the screen is applied after, as in
+    ``make_pipeline``.
+
+    Parameters
+    ----------
+    factor : pd.DataFrame
+        The factor, such as ``momentum_factor``.
+    screen : pd.DataFrame
+        Boolean mask of the assets that may be held, such as
+        ``top(average_dollar_volume(close, volume), DOLLAR_VOLUME)``.
+        Both it and ``factor`` should be masked with ``pipeline_assets``.
+    n_longs, n_shorts : int
+        The numbers of assets to buy and to sell short.
+    """
+    screen = screen.to_numpy()
+    longs = top(factor, n_longs).to_numpy() & screen
+    shorts = bottom(factor, n_shorts).to_numpy() & screen
+    weights = np.where(longs, 1 / n_longs, np.where(shorts, -1 / n_shorts, 0.0))
+    weights = lag(weights, 1)
+    weights[0] = 0.0
+    return pd.DataFrame(weights, index=factor.index, columns=factor.columns)
+
+
+@njit(cache=True)
+def _round_shares(amount):
+    # Zipline's round_if_close_to_whole, then int()
+    if abs(amount - np.round(amount)) < 1e-4:
+        amount = np.round(amount)
+    return np.trunc(amount)
+
+
+@njit(cache=True)
+def _simulate(
+    close,
+    volume,
+    weights,
+    rebalance,
+    capital_base,
+    cost_per_share,
+    min_trade_cost,
+    volume_limit,
+    price_impact,
+):
+    n_dates, n_assets = close.shape
+    # Assets can be traded from their first close to their last, and are
+    # closed out at the last price the session after, like an auto close.
+    first = np.full(n_assets, n_dates)
+    last = np.full(n_assets, -1)
+    for t in range(n_dates):
+        for i in range(n_assets):
+            if np.isfinite(close[t, i]):
+                if first[i] == n_dates:
+                    first[i] = t
+                last[i] = t
+
+    positions = np.zeros((n_dates, n_assets))
+    perf = np.zeros((n_dates, 7))
+    shares = np.zeros(n_assets)
+    price = np.full(n_assets, np.nan)
+    # The open order of each asset: shares left to fill, shares filled and
+    # commission charged so far
+    open_amount = np.zeros(n_assets)
+    filled = np.zeros(n_assets)
+    charged = np.zeros(n_assets)
+    cash = capital_base
+
+    for t in range(n_dates):
+        traded = 0.0
+        commission = 0.0
+        slippage = 0.0
+        for i in range(n_assets):
+            if t == last[i] + 1:
+                # Assets without a bar have no price, but hold no shares
+                if shares[i] != 0.0:
+                    cash += shares[i] * price[i]
+                shares[i] = 0.0
+                open_amount[i] = 0.0
+
+            # Fill the orders placed on earlier sessions from this bar
+            if open_amount[i] != 0.0 and volume[t, i] > 0 and np.isfinite(close[t, i]):
+                amount = np.floor(min(volume_limit * volume[t, i], abs(open_amount[i])))
+                if amount >= 1:
+                    # VolumeShareSlippage.process_order takes the volume share
+                    # of the whole shares filled, not of the unfloored limit
+                    share = min(amount / volume[t, i], volume_limit)
+                    impact = share**2 * price_impact * close[t, i]
+                    direction = np.sign(open_amount[i])
+                    amount *= direction
+                    fill_price = close[t, i] + direction * impact
+
+                    filled[i] += amount
+                    open_amount[i] -= amount
+                    fee = abs(filled[i]) * cost_per_share
+                    if charged[i] == 0.0:
+                        fee = max(min_trade_cost, fee)
+                    elif fee < min_trade_cost:
+                        fee = charged[i]
+                    fee -= charged[i]
+                    charged[i] += fee
+
+                    shares[i] += amount
+                    cash -= amount * fill_price + fee
+                    traded += abs(amount) * fill_price
+                    commission += fee
+                    slippage += abs(amount) * impact
+
+            if np.isfinite(close[t, i]):
+                price[i] = close[t, i]
+
+        long_value = 0.0
+        short_value = 0.0
+        for i in range(n_assets):
+            if shares[i] > 0:
+                long_value += shares[i] * price[i]
+            elif shares[i] < 0:
+                short_value += shares[i] * price[i]
+        portfolio_value = cash + long_value + short_value
+
+        if rebalance[t]:
+            for i in range(n_assets):
+                can_trade = first[i] <= t <= last[i]
+                if not can_trade or open_amount[i] != 0.0:
+                    continue
+                if weights[t, i] == 0.0 and shares[i] == 0.0:
+                    continue
+                target = weights[t, i] * portfolio_value / price[i]
+                amount = _round_shares(target - shares[i])
+                if amount != 0.0:
+                    open_amount[i] = amount
+                    filled[i] = 0.0
+                    charged[i] = 0.0
+
+        positions[t] = shares
+        perf[t, 0] = portfolio_value
+        perf[t, 1] = cash
+        perf[t, 2] = long_value
+        perf[t, 3] = short_value
+        perf[t, 4] = traded
+        perf[t, 5] = commission
+        perf[t, 6] = slippage
+    return perf, positions
+
+
+def backtest(
+    close,
+    volume,
+    weights,
+    rebalance,
+    capital_base=CAPITAL_BASE,
+    cost_per_share=COST_PER_SHARE,
+    min_trade_cost=MIN_TRADE_COST,
+    volume_limit=VOLUME_LIMIT,
+    price_impact=PRICE_IMPACT,
+):
+    """
+    Trade towards ``weights`` on the ``rebalance`` sessions, modelled on
+    ``order_target_percent`` in ``exec_trades``.
+
+    On a rebalance session each asset that can trade and has no open order
+    is ordered the whole shares between its position and its target, valued
+    at that session's close. Orders fill from the following sessions'
+    closes, at most ``volume_limit`` of each session's volume, at a price
+    moved by ``price_impact`` times the squared volume share, and pay
+    ``cost_per_share`` with at least ``min_trade_cost`` per order. What does
+    not fill stays open, like Zipline's default ``NeverCancel`` policy.
+
+    Parameters
+    ----------
+    close, volume : pd.DataFrame
+        Closes and volumes indexed by session with one column per asset,
+        NaN where an asset has no bar.
+    weights : pd.DataFrame
+        Target weights of the portfolio value, shaped like ``close``.
+    rebalance : np.ndarray
+        Boolean mask of the rebalance sessions.
+
+    Returns
+    -------
+    perf : pd.DataFrame
+        By session, the ``portfolio_value``, ``cash``, ``long_value``,
+        ``short_value``, ``traded_value``, ``commission`` and ``slippage``,
+        with the ``returns``, ``gross_leverage`` and ``turnover``.
+    positions : pd.DataFrame
+        The shares held at each session's close.
+    """
+    values, shares = _simulate(
+        np.ascontiguousarray(close.to_numpy(dtype=np.float64)),
+        np.ascontiguousarray(volume.to_numpy(dtype=np.float64)),
+        np.ascontiguousarray(weights.to_numpy(dtype=np.float64)),
+        np.asarray(rebalance, dtype=np.bool_),
+        float(capital_base),
+        cost_per_share,
+        min_trade_cost,
+        volume_limit,
+        price_impact,
+    )
+    perf = pd.DataFrame(values, index=close.index, columns=PERF_COLUMNS)
+    value = perf.portfolio_value
+    perf["returns"] = value.pct_change().fillna(value.iloc[0] / capital_base - 1)
+    perf["gross_leverage"] = (perf.long_value - perf.short_value) / value
+    perf["turnover"] = perf.traded_value / value
+    positions = pd.DataFrame(shares, index=close.index, columns=close.columns)
+    return perf, positions
+
+
+def summarize(perf):
+    """The annualized Sharpe ratio, return and costs of a backtest."""
+    returns = perf.returns
+    value = perf.portfolio_value
+    return {
+        "total_return": (1 + returns).prod() - 1,
+        "sharpe": np.sqrt(TRADING_DAYS) * returns.mean() / returns.std(),
+        "max_drawdown": (value / value.cummax() - 1).min(),
+        "turnover": perf.turnover.mean() * TRADING_DAYS,
+        "commission": perf.commission.sum(),
+        "slippage": perf.slippage.sum(),
+    }
+
+
+def sweep(
+    close,
+    volume,
+    n_longs=(N_LONGS,),
+    long_windows=(LONG_WINDOW,),
+    short_windows=(SHORT_WINDOW,),
+    frequencies=(REBALANCE,),
+    universe=DOLLAR_VOLUME,
+    start=None,
+    **kwargs,
+):
+    """
+    Backtest every combination of the numbers of longs (and as many
+    shorts), factor windows and rebalance frequencies.
+
+    The screen is computed once, the factor once per pair of windows and
+    the weights once per number of longs, so each variant costs little more
+    than its simulation. ``start`` drops the warm up sessions before
+    trading, and ``kwargs`` go to ``backtest``.
+
+    Returns
+    -------
+    results : pd.DataFrame
+        One row per combination with its parameters and ``summarize``.
+    """
+    assets = pipeline_assets(close)
+    screen = top(average_dollar_volume(close, volume).where(assets), universe)
+    trading = slice(start, None)
+    rows = close.index.slice_indexer(start)
+    rebalances = {
+        frequency: rebalance_days(close.index, frequency)[rows]
+        for frequency in frequencies
+    }
+    rows = []
+    for long_window, short_window in product(long_windows, short_windows):
+        factor = momentum_factor(close, long_window, short_window).where(assets)
+        for n in n_longs:
+            weights = target_weights(factor, screen, n, n)[trading]
+            for frequency, rebalance in rebalances.items():
+                perf, _ = backtest(
+                    close[trading], volume[trading], weights, rebalance, **kwargs
+                )
+                rows.append(
+                    {
+                        "n_longs": n,
+                        "long_window": long_window,
+                        "short_window": short_window,
+                        "frequency": frequency,
+                        **summarize(perf),
+                    }
+                )
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    close, volume = load_bundle_arrays("quotemedia", "2019-01-01", "2022-12-31")
+    results = sweep(
+        close,
+        volume,
+        n_longs=[10, 25, 50, 100],
+        long_windows=[126, 252],
+        short_windows=[5, 21],
+        frequencies=["daily", "week_start", "month_start"],
+        start="2020-01-01",
+    )
+    print(results.sort_values("sharpe", ascending=False).to_string())
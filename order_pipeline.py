@@ -0,0 +1,176 @@
+import threading
+import time
+
+import pandas as pd
+from ibapi.contract import Contract
+from ibapi.order import Order
+
+# TWS rejects clients sending more than 50 messages a second. Orders are
+# paced below that, with a small burst, so no one second window exceeds it.
+ORDER_RATE = 45
+ORDER_BURST = 5
+# Seconds a rebalance waits for sells to fund its buys and for its fills
+REBALANCE_TIMEOUT = 300
+
+
+class TokenBucket:
+    """
+    Allow ``rate`` events a second on average and up to ``capacity`` at
+    once, blocking callers of ``acquire`` until a token is available.
+    """
+
+    def __init__(self, rate=ORDER_RATE, capacity=ORDER_BURST):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                time.sleep((1 - self.tokens) / self.rate)
+
+
+def stock_contract(symbol, secType="STK", exchange="SMART", currency="USD"):
+    contract = Contract()
+    contract.symbol = symbol
+    contract.secType = secType
+    contract.exchange = exchange
+    contract.currency = currency
+    return contract
+
+
+def market_order(action, quantity):
+    order = Order()
+    order.action = action
+    order.totalQuantity = quantity
+    order.orderType = "MKT"
+    order.transmit = True
+    order.eTradeOnly = ""
+    order.firmQuoteOnly = ""
+    return order
+
+
+class OrderPipeline:
+    """
+    Submit a rebalance as one paced batch of market orders.
+
+    Order ids are allocated locally from the ``nextValidId`` received at
+    connection, so submitting never waits on TWS. Every ``placeOrder`` takes
+    a token from a bucket refilled at ``rate`` a second.
+
+    Parameters
+    ----------
+    client : EClient
+        The connected client, or the ``FakeTWS`` of bench_order_pipeline.py.
+    book : PositionBook
+        The book fed by the client's wrapper, which tracks the orders.
+    next_order_id : int
+        The id received in ``nextValidId``.
+    rate, burst : float
+        The pace of order submission and the largest burst.
+    """
+
+    def __init__(self, client, book, next_order_id, rate=ORDER_RATE, burst=ORDER_BURST):
+        self.client = client
+        self.book = book
+        self.next_order_id = next_order_id
+        self.bucket = TokenBucket(rate, burst)
+        self.lock = threading.Lock()
+
+    def submit(self, symbol, action, quantity):
+        """Place a market order, waiting for a token, and return its id."""
+        with self.lock:
+            order_id = self.next_order_id
+            self.next_order_id += 1
+        contract = stock_contract(symbol)
+        order = market_order(action, quantity)
+        self.bucket.acquire()
+        self.book.on_order_submitted(order_id, contract, order)
+        self.client.placeOrder(order_id, contract, order)
+        return order_id
+
+    def rebalance(self, df_change, cash, timeout=REBALANCE_TIMEOUT):
+        """
+        Trade the ``buy`` and ``sell`` share counts of ``df_change``, indexed
+        by symbol, as built in ``competition_1.py``.
+
+        All sells are placed first. Buys are placed while their cost at
+        ``last_price`` fits in ``cash`` plus the proceeds of the filled
+        sells. When a buy doesn't fit, it waits for more sells to fill, and
+        is cut to the shares affordable once they all have or ``timeout``
+        seconds have passed since the call. Symbols without a
+        ``last_price`` are not bought.
+
+        Returns
+        -------
+        report : pd.DataFrame
+            One row per order with its status, fill and fill ``Latency`` in
+            seconds, indexed by order id. Orders TWS rejected have a
+            ``Rejected`` status and the ``Error`` it sent. The shares of buys that were cut
+            or skipped follow, with a ``NotSubmitted`` status and no order
+            id.
+        """
+        deadline = time.monotonic() + timeout
+        sells = [
+            self.submit(symbol, "SELL", row.sell)
+            for symbol, row in df_change[df_change.sell > 0].iterrows()
+        ]
+
+        buys = []
+        not_submitted = []
+        committed = 0.0
+        for symbol, row in df_change[df_change.buy > 0].iterrows():
+            price = row.last_price
+            quantity = row.buy
+            if not price > 0:
+                not_submitted.append((symbol, row.buy))
+                continue
+            while True:
+                sold = self.book.wait_for_orders(sells, timeout=0)
+                available = cash + self.book.fill_value(sells) - committed
+                if quantity * price <= available:
+                    break
+                remaining = deadline - time.monotonic()
+                if sold or remaining <= 0:
+                    quantity = int(max(available, 0) // price)
+                    break
+                self.book.wait_for_change(timeout=min(1, remaining))
+            if quantity > 0:
+                buys.append(self.submit(symbol, "BUY", quantity))
+                committed += quantity * price
+            if quantity < row.buy:
+                not_submitted.append((symbol, row.buy - quantity))
+        if not_submitted:
+            symbols = ", ".join(symbol for symbol, _ in not_submitted)
+            print(f"Short of cash or price, bought less than planned of {symbols}")
+
+        order_ids = sells + buys
+        remaining = max(deadline - time.monotonic(), 0)
+        if order_ids and not self.book.wait_for_orders(order_ids, remaining):
+            print("Timed out waiting for fills")
+        report = self.book.order_snapshot().loc[order_ids]
+        report["Latency"] = report["Done"] - report["Submitted"]
+        if not_submitted:
+            skipped = pd.DataFrame(
+                {
+                    "Symbol": [symbol for symbol, _ in not_submitted],
+                    "Action": "BUY",
+                    "Quantity": [quantity for _, quantity in not_submitted],
+                    "Status": "NotSubmitted",
+                    "Filled": 0.0,
+                    "Remaining": [quantity for _, quantity in not_submitted],
+                },
+                index=pd.Index([pd.NA] * len(not_submitted), dtype="Int64"),
+            )
+            report = pd.concat([report, skipped])
+        return report
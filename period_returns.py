@@ -1,27 +1,42 @@
-import pandas as pd
-import numpy as np
+import os
+from glob import glob
+
 import matplotlib.pyplot as plt
 import streamlit as st
 
-df_stock_history = pd.read_csv('data/SPY.csv')
+from return_store import open_store
+
+def csv_mtimes(data_dir='data'):
+    return tuple(sorted((path, os.path.getmtime(path)) for path in glob(os.path.join(data_dir, '*.csv'))))
+
+# The sorted 1 to 45 day returns of every data/<SYMBOL>.csv, built into
+# data/returns once and rebuilt when a CSV changes. The cached store is
+# keyed on the CSV files and their mtimes, so a changed, added or removed
+# CSV opens the store again, which rebuilds it
+@st.cache_resource(max_entries=1)
+def load_store(mtimes):
+    return open_store('data/returns', 'data')
 
-def plot_returns(df, period, tails):
-    data = df[f'Return-{period}'].dropna()
-    lower_tail = np.percentile(data, tails)
-    upper_tail = np.percentile(data, 100-tails)
-    plt.hist(data, bins=50)
+def plot_returns(store, symbol, period, tails):
+    data = store.returns(symbol, period)
+    lower_tail, upper_tail = store.tails(symbol, period, tails)
+    fig, ax = plt.subplots()
+    ax.hist(data, bins=50)
     # show the upper and lower tail amount labels at the top of the chart
-    plt.text(lower_tail, 50, f'{lower_tail:.4f}', rotation=90, va='top')
-    plt.text(upper_tail, 50, f'{upper_tail:.4f}', rotation=90, va='top')
-    plt.axvline(lower_tail, color='r', linestyle='dashed', linewidth=2)
-    plt.axvline(upper_tail, color='r', linestyle='dashed', linewidth=2)
-    return plt
+    ax.text(lower_tail, 50, f'{lower_tail:.4f}', rotation=90, va='top')
+    ax.text(upper_tail, 50, f'{upper_tail:.4f}', rotation=90, va='top')
+    ax.axvline(lower_tail, color='r', linestyle='dashed', linewidth=2)
+    ax.axvline(upper_tail, color='r', linestyle='dashed', linewidth=2)
+    return fig
+
+store = load_store(csv_mtimes())
 
 # Streamlit code
-st.title('SPY Period Return Distribution')
+symbol = st.selectbox('Select a symbol', store.symbols, index=store.symbols.get_loc('SPY') if 'SPY' in store.symbols else 0)
+st.title(f'{symbol} Period Return Distribution')
 
 period = st.slider('Select a period', min_value=1, max_value=45, value=1)
 tails = st.slider('Select tails', min_value=0, max_value=100, value=5)
-plt = plot_returns(df_stock_history, period, tails)
-st.pyplot(plt)
-
+fig = plot_returns(store, symbol, period, tails)
+st.pyplot(fig)
+plt.close(fig)
@@ -0,0 +1,137 @@
+import os
+from glob import glob
+
+import numpy as np
+import pandas as pd
+
+MAX_PERIOD = 45
+RETURNS_FILE_NAME = "returns.npy"
+COUNTS_FILE_NAME = "counts.npy"
+SYMBOLS_FILE_NAME = "symbols.npy"
+
+
+def load_closes(data_dir):
+    """
+    Read the closes of every ``<SYMBOL>.csv`` in ``data_dir`` into a dates x
+    symbols frame, using adjusted closes where the file has them.
+    """
+    closes = {}
+    for path in sorted(glob(os.path.join(data_dir, "*.csv"))):
+        symbol = os.path.splitext(os.path.basename(path))[0]
+        frame = pd.read_csv(path, index_col="Date", parse_dates=True)
+        closes[symbol] = frame["Adj Close" if "Adj Close" in frame else "Close"]
+    return pd.concat(closes, axis=1).sort_index()
+
+
+class ReturnStore:
+    """
+    The distributions of 1 to ``max_period`` day returns of many symbols,
+    held in a memory-mapped ``.npy`` file.
+
+    The returns of each (symbol, period) are stored sorted, as float32, so a
+    percentile is read from one or two elements rather than recomputed, and
+    opening the store reads no return data until it is used.
+    """
+
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        self.symbols = pd.Index(
+            np.load(os.path.join(store_dir, SYMBOLS_FILE_NAME)).astype(object)
+        )
+        self.counts = np.load(os.path.join(store_dir, COUNTS_FILE_NAME))
+        # symbols x periods x returns, NaN padded past each count
+        self.sorted_returns = np.load(
+            os.path.join(store_dir, RETURNS_FILE_NAME), mmap_mode="r"
+        )
+        self.max_period = self.sorted_returns.shape[1]
+
+    @classmethod
+    def build(cls, closes, store_dir, max_period=MAX_PERIOD):
+        """
+        Compute and sort the returns over every period from 1 to
+        ``max_period`` days of a dates x symbols close frame and write them
+        to ``store_dir``.
+
+        Periods are counted in each symbol's own closes, so a symbol trading
+        on fewer dates than the others, which are NaN in ``closes``, keeps
+        all its returns.
+
+        Each period is computed and sorted for all symbols at once, straight
+        into the memory-mapped file, so memory use is bounded by one period.
+        """
+        os.makedirs(store_dir, exist_ok=True)
+        symbols = closes.columns.to_numpy(dtype=str)
+        closes = closes.to_numpy(dtype=np.float64)
+        # Move each symbol's closes up to consecutive rows
+        valid = ~np.isnan(closes)
+        rows, cols = np.nonzero(valid)
+        positions = np.cumsum(valid, axis=0) - 1
+        values = np.full((valid.sum(axis=0).max(initial=0), closes.shape[1]), np.nan)
+        values[positions[rows, cols], cols] = closes[rows, cols]
+        n_dates, n_symbols = values.shape
+
+        sorted_returns = np.lib.format.open_memmap(
+            os.path.join(store_dir, RETURNS_FILE_NAME),
+            mode="w+",
+            dtype=np.float32,
+            shape=(n_symbols, max_period, max(n_dates - 1, 0)),
+        )
+        counts = np.zeros((n_symbols, max_period), dtype=np.int64)
+        for period in range(1, max_period + 1):
+            returns = np.full((n_symbols, sorted_returns.shape[2]), np.nan)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                returns[:, : n_dates - period] = (
+                    values[period:] / values[:-period]
+                ).T - 1
+            returns[~np.isfinite(returns)] = np.nan
+            # NaNs sort last, after the count of valid returns
+            sorted_returns[:, period - 1] = np.sort(returns, axis=1)
+            counts[:, period - 1] = np.sum(~np.isnan(returns), axis=1)
+        sorted_returns.flush()
+        del sorted_returns
+
+        np.save(os.path.join(store_dir, COUNTS_FILE_NAME), counts)
+        np.save(os.path.join(store_dir, SYMBOLS_FILE_NAME), symbols)
+        return cls(store_dir)
+
+    def returns(self, symbol, period):
+        """The sorted ``period`` day returns of ``symbol``."""
+        i = self.symbols.get_loc(symbol)
+        return self.sorted_returns[i, period - 1, : self.counts[i, period - 1]]
+
+    def percentile(self, symbol, period, q):
+        """
+        The ``q``-th percentile of the ``period`` day returns of ``symbol``,
+        interpolated linearly like ``np.percentile``, or NaN if the symbol
+        has no ``period`` day returns.
+        """
+        returns = self.returns(symbol, period)
+        if len(returns) == 0:
+            return np.full(np.shape(q), np.nan)[()]
+        position = np.asarray(q, dtype=np.float64) / 100 * (len(returns) - 1)
+        lower = np.floor(position).astype(np.int64)
+        upper = np.minimum(lower + 1, len(returns) - 1)
+        fraction = position - lower
+        return returns[lower] + (returns[upper] - returns[lower]) * fraction
+
+    def tails(self, symbol, period, tails):
+        """The lower and upper ``tails`` percent cut-offs of the returns."""
+        return tuple(self.percentile(symbol, period, [tails, 100 - tails]))
+
+
+def open_store(store_dir, data_dir, max_period=MAX_PERIOD):
+    """
+    Open the store in ``store_dir``, building it from the CSV files in
+    ``data_dir`` first if it is missing, older than any of them or holds
+    other symbols than they do.
+    """
+    returns_file = os.path.join(store_dir, RETURNS_FILE_NAME)
+    csv_files = glob(os.path.join(data_dir, "*.csv"))
+    symbols = {os.path.splitext(os.path.basename(f))[0] for f in csv_files}
+    if os.path.exists(returns_file) and all(
+        os.path.getmtime(f) <= os.path.getmtime(returns_file) for f in csv_files
+    ):
+        store = ReturnStore(store_dir)
+        if store.max_period >= max_period and set(store.symbols) == symbols:
+            return store
+    return ReturnStore.build(load_closes(data_dir), store_dir, max_period)
@@ -0,0 +1,276 @@
+import numpy as np
+import pandas as pd
+from numba import njit
+
+# RiskMetrics decay, the d=0.94 passed to port.assets_stats in competition_1.py
+DECAY = 0.94
+WINDOW = 252
+# Weight of the shrinkage target, as in Riskfolio's method_cov="shrunk"
+SHRINKAGE = 0.1
+
+
+def shrink(cov, intensity=SHRINKAGE, target="identity"):
+    """
+    Shrink a covariance matrix towards a structured target.
+
+    Parameters
+    ----------
+    cov : np.ndarray
+        The sample covariance matrix.
+    intensity : float
+        Weight of the target, from 0 for ``cov`` itself to 1 for the target.
+    target : {"identity", "constant_correlation"}
+        ``"identity"`` is the average variance times the identity, as in
+        scikit-learn's ``ShrunkCovariance``. ``"constant_correlation"`` keeps
+        the variances and sets every correlation to the average one.
+
+    Returns
+    -------
+    shrunk : np.ndarray
+    """
+    variances = np.diag(cov)
+    if target == "identity":
+        prior = np.mean(variances) * np.eye(len(cov))
+    elif target == "constant_correlation":
+        vols = np.sqrt(variances)
+        correlation = cov / np.outer(vols, vols)
+        n = len(cov)
+        average = (correlation.sum() - n) / (n * (n - 1)) if n > 1 else 0.0
+        prior = average * np.outer(vols, vols)
+        np.fill_diagonal(prior, variances)
+    else:
+        raise ValueError(f"Unknown shrinkage target {target!r}.")
+    return (1 - intensity) * cov + intensity * prior
+
+
+def ledoit_wolf_shrinkage(returns):
+    """
+    The Ledoit-Wolf optimal intensity for shrinking the covariance of a
+    dates x assets array of returns towards the scaled identity, as computed
+    by scikit-learn's ``ledoit_wolf_shrinkage``.
+    """
+    n, p = returns.shape
+    x = returns - returns.mean(axis=0)
+    x2 = x**2
+    trace = x2.sum() / n
+    mu = trace / p
+    beta = (x2.T @ x2).sum()
+    delta = ((x.T @ x) ** 2).sum() / n**2
+    beta = (beta / n - delta) / (p * n)
+    delta = (delta - 2 * mu * trace + p * mu**2) / p
+    beta = min(beta, delta)
+    return 0.0 if beta == 0 else beta / delta
+
+
+@njit(cache=True)
+def _risk_parity(cov, budgets, x, tol, max_iter):
+    # Cyclical coordinate descent on 1/2 x'Cx - sum(b log x), whose minimum
+    # has x_i (Cx)_i = b_i. Each coordinate is solved exactly from the
+    # quadratic x_i^2 C_ii + x_i c_i - b_i = 0.
+    cx = cov @ x
+    for sweep in range(max_iter):
+        change = 0.0
+        for i in range(len(x)):
+            c = cx[i] - cov[i, i] * x[i]
+            new = (-c + np.sqrt(c * c + 4 * cov[i, i] * budgets[i])) / (2 * cov[i, i])
+            delta = new - x[i]
+            cx += cov[i] * delta
+            x[i] = new
+            change = max(change, abs(delta) / new)
+        if change < tol:
+            break
+    return x / x.sum(), sweep + 1
+
+
+def risk_parity(cov, budgets=None, weights=None, tol=1e-10, max_iter=1000):
+    """
+    Long-only risk budgeting weights for a covariance matrix, each asset
+    contributing its budget share of the portfolio variance, as
+    ``rp_optimization(model="Classic", rm="MV", b=budgets)``.
+
+    Solved by cyclical coordinate descent, which starts from ``weights``
+    when they are given, so re-solving after a small change in ``cov`` takes
+    a few sweeps.
+
+    Parameters
+    ----------
+    cov : np.ndarray
+        The covariance matrix.
+    budgets : np.ndarray, optional
+        The risk budget of each asset, by default equal.
+    weights : np.ndarray, optional
+        Weights to start from, such as yesterday's.
+    tol : float
+        Stop when no weight changes by more than this fraction in a sweep.
+    max_iter : int
+        Maximum number of sweeps over the assets.
+
+    Returns
+    -------
+    weights : np.ndarray
+        The weights, summing to 1.
+    """
+    cov = np.ascontiguousarray(cov, dtype=np.float64)
+    n = len(cov)
+    budgets = np.full(n, 1.0 / n) if budgets is None else np.asarray(budgets, float)
+    budgets = budgets / budgets.sum()
+    x = np.full(n, 1.0 / n) if weights is None else np.asarray(weights, float).copy()
+    x = np.where(x > 0, x, 1.0 / n)
+    # Scale so that the portfolio variance equals the total budget, as it
+    # does at the solution
+    x *= np.sqrt(1.0 / (x @ cov @ x))
+    weights, _ = _risk_parity(cov, budgets, x, tol, max_iter)
+    return weights
+
+
+class CovarianceModel:
+    """
+    Base class of the incrementally updated covariance models.
+
+    Keeps the last risk parity weights so that the next solve starts from
+    them, and saves and loads its state to resume after a restart.
+    """
+
+    # Names of the array attributes saved by ``save``
+    state = ()
+
+    def __init__(self, assets):
+        self.assets = pd.Index(assets)
+        self.last_date = None
+        self.weights = None
+
+    def update(self, returns):
+        """
+        Add one or more bars of returns.
+
+        Parameters
+        ----------
+        returns : pd.DataFrame
+            Returns indexed by date with a column for each asset. Missing
+            returns count as 0.
+        """
+        values = returns.reindex(columns=self.assets).fillna(0.0).to_numpy()
+        for row in values:
+            self.update_bar(row)
+        if len(returns):
+            self.last_date = returns.index[-1]
+
+    @classmethod
+    def from_returns(cls, returns, **kwargs):
+        """Build a model from a dates x assets frame of returns."""
+        model = cls(returns.columns, **kwargs)
+        model.update(returns)
+        return model
+
+    def risk_parity(self, shrinkage=0.0, target="identity", budgets=None):
+        """
+        Risk parity weights for the covariance, shrunk by ``shrinkage``
+        towards ``target``, starting from the last weights solved for.
+        """
+        cov = shrink(self.covariance, shrinkage, target)
+        self.weights = risk_parity(cov, budgets, self.weights)
+        return pd.Series(self.weights, index=self.assets, name="weights")
+
+    def covariance_frame(self):
+        return pd.DataFrame(self.covariance, index=self.assets, columns=self.assets)
+
+    def save(self, path):
+        """Save the state to an ``.npz`` file."""
+        np.savez(
+            path,
+            assets=self.assets.to_numpy(dtype=str),
+            last_date=str(self.last_date),
+            weights=np.array([]) if self.weights is None else self.weights,
+            **{name: getattr(self, name) for name in self.state},
+        )
+
+    @classmethod
+    def load(cls, path):
+        """Resume from a state saved with ``save``."""
+        with np.load(path) as saved:
+            model = cls(saved["assets"].astype(object))
+            for name in cls.state:
+                setattr(model, name, saved[name])
+            last_date = str(saved["last_date"])
+            model.last_date = None if last_date == "None" else pd.Timestamp(last_date)
+            model.weights = saved["weights"] if len(saved["weights"]) else None
+        return model
+
+
+class EwmaCovariance(CovarianceModel):
+    """
+    Exponentially weighted covariance updated in O(assets^2) per bar, equal
+    to ``returns.ewm(alpha=1 - decay, adjust=False).cov(bias=True)``.
+    """
+
+    state = ("decay", "count", "mean", "cov")
+
+    def __init__(self, assets, decay=DECAY):
+        super().__init__(assets)
+        n = len(self.assets)
+        self.decay = np.float64(decay)
+        self.count = np.int64(0)
+        self.mean = np.zeros(n)
+        self.cov = np.zeros((n, n))
+
+    def update_bar(self, returns):
+        if self.count == 0:
+            self.mean = returns.copy()
+        else:
+            alpha = 1 - self.decay
+            deviation = returns - self.mean
+            self.mean += alpha * deviation
+            self.cov += alpha * np.outer(deviation, deviation)
+            self.cov *= self.decay
+        self.count += 1
+
+    @property
+    def covariance(self):
+        return self.cov
+
+
+class RollingCovariance(CovarianceModel):
+    """
+    Sample covariance of the last ``window`` bars, updated in O(assets^2)
+    per bar from running sums of the returns and their outer products.
+    """
+
+    state = ("count", "bars", "sums", "products")
+
+    def __init__(self, assets, window=WINDOW):
+        super().__init__(assets)
+        n = len(self.assets)
+        self.count = np.int64(0)
+        self.bars = np.zeros((window, n))
+        self.sums = np.zeros(n)
+        self.products = np.zeros((n, n))
+
+    def update_bar(self, returns):
+        slot = self.count % len(self.bars)
+        if self.count >= len(self.bars):
+            old = self.bars[slot]
+            self.sums -= old
+            self.products -= np.outer(old, old)
+        self.bars[slot] = returns
+        self.sums += returns
+        self.products += np.outer(returns, returns)
+        self.count += 1
+
+        if self.count % len(self.bars) == 0:
+            # Recompute the sums once per window so rounding errors from the
+            # subtractions don't accumulate
+            self.sums = self.bars.sum(axis=0)
+            self.products = self.bars.T @ self.bars
+
+    @property
+    def recent_bars(self):
+        return self.bars[: min(self.count, len(self.bars))]
+
+    @property
+    def covariance(self):
+        n = min(self.count, len(self.bars))
+        return (self.products - np.outer(self.sums, self.sums) / n) / (n - 1)
+
+    def ledoit_wolf(self):
+        """The Ledoit-Wolf shrinkage intensity for the current window."""
+        return ledoit_wolf_shrinkage(self.recent_bars)
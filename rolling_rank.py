@@ -0,0 +1,184 @@
+import numpy as np
+from numba import njit, prange
+
+
+@njit(cache=True)
+def _dense_codes(column):
+    """
+    Number the distinct values of a column 1, 2, ... in ascending order, as
+    positions in a Fenwick tree. NaNs get code 0.
+    """
+    order = np.argsort(column)
+    codes = np.zeros(len(column), dtype=np.int64)
+    code = 0
+    previous = np.nan
+    for i in order:
+        value = column[i]
+        if np.isnan(value):
+            break
+        if code == 0 or value != previous:
+            code += 1
+            previous = value
+        codes[i] = code
+    return codes, code
+
+
+@njit(cache=True)
+def _add(tree, code, count):
+    while code < len(tree):
+        tree[code] += count
+        code += code & -code
+
+
+@njit(cache=True)
+def _count_to(tree, code):
+    """Number of values in the tree with a code of at most ``code``."""
+    total = 0
+    while code > 0:
+        total += tree[code]
+        code -= code & -code
+    return total
+
+
+@njit(parallel=True, cache=True)
+def _rolling_rank(values, window, min_periods, method, ascending, pct):
+    n, m = values.shape
+    out = np.full((n, m), np.nan)
+    for j in prange(m):
+        column = values[:, j]
+        codes, n_codes = _dense_codes(column)
+        tree = np.zeros(n_codes + 1, dtype=np.int64)
+        nobs = 0
+        for t in range(n):
+            if codes[t]:
+                _add(tree, codes[t], 1)
+                nobs += 1
+            if t >= window and codes[t - window]:
+                _add(tree, codes[t - window], -1)
+                nobs -= 1
+            if not codes[t] or nobs < min_periods:
+                continue
+
+            below = _count_to(tree, codes[t] - 1)
+            equal = _count_to(tree, codes[t]) - below
+            if not ascending:
+                below = nobs - below - equal
+            if method == 0:
+                rank = below + (equal + 1) / 2
+            elif method == 1:
+                rank = below + 1.0
+            else:
+                rank = below + equal + 0.0
+            out[t, j] = rank / nobs if pct else rank
+    return out
+
+
+RANK_METHODS = {"average": 0, "min": 1, "max": 2}
+
+
+def rolling_rank(
+    values, window, min_periods=None, method="average", ascending=True, pct=False
+):
+    """
+    Rolling rank of each value within its trailing window, column by column,
+    matching ``pd.DataFrame.rolling(window, min_periods).rank(...)``.
+
+    Each column's values are numbered once in sorted order and the window is
+    kept as counts in a Fenwick tree over those numbers, so adding, removing
+    and ranking a value are O(log n) whatever the window. Columns are scored
+    in parallel.
+
+    Parameters
+    ----------
+    values : np.ndarray
+        A 1-D series or a 2-D array with one series per column, such as one
+        column per refiner or per window.
+    window : int
+        Number of rows in each window.
+    min_periods : int, optional
+        Minimum number of non-NaN values in a window to rank, by default
+        ``window``.
+    method : {"average", "min", "max"}
+        How tied values are ranked.
+    ascending : bool
+        Rank the smallest value 1 if True, the largest if False.
+    pct : bool
+        Divide the ranks by the number of non-NaN values in the window.
+
+    Returns
+    -------
+    ranks : np.ndarray
+        The ranks, shaped like ``values``, NaN where the value is NaN or the
+        window has fewer than ``min_periods`` values.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if min_periods is None:
+        min_periods = window
+    ranks = _rolling_rank(
+        np.atleast_2d(values.T).T,
+        window,
+        max(min_periods, 1),
+        RANK_METHODS[method],
+        ascending,
+        pct,
+    )
+    return ranks.reshape(values.shape)
+
+
+@njit(parallel=True, cache=True)
+def _rolling_zscore(values, window, min_periods):
+    n, m = values.shape
+    out = np.full((n, m), np.nan)
+    for j in prange(m):
+        nobs = 0
+        mean = 0.0
+        ssqdm = 0.0
+        # Run of equal values ending at the latest one, so windows of a
+        # single value have exactly zero variance
+        repeats = 0
+        previous = np.nan
+        for t in range(n):
+            value = values[t, j]
+            if not np.isnan(value):
+                repeats = repeats + 1 if value == previous else 1
+                previous = value
+                nobs += 1
+                delta = value - mean
+                mean += delta / nobs
+                ssqdm += delta * (value - mean)
+            if t >= window:
+                old = values[t - window, j]
+                if not np.isnan(old):
+                    nobs -= 1
+                    if nobs:
+                        delta = old - mean
+                        mean -= delta / nobs
+                        ssqdm -= delta * (old - mean)
+                    else:
+                        mean = 0.0
+                        ssqdm = 0.0
+            if np.isnan(value) or nobs < min_periods or nobs < 2:
+                continue
+            if repeats >= nobs:
+                # The z-score of a constant window is 0 / 0
+                continue
+            std = np.sqrt(max(ssqdm, 0.0) / (nobs - 1))
+            out[t, j] = (value - mean) / std
+    return out
+
+
+def rolling_zscore(values, window, min_periods=None):
+    """
+    Rolling z-score of each value against the mean and sample standard
+    deviation of its trailing window, column by column, like
+    ``(x - x.rolling(window).mean()) / x.rolling(window).std()``.
+
+    The mean and variance are updated in O(1) per row with Welford's method,
+    so they agree with pandas to rounding. Windows of a single repeated
+    value are NaN.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if min_periods is None:
+        min_periods = window
+    zscores = _rolling_zscore(np.atleast_2d(values.T).T, window, max(min_periods, 1))
+    return zscores.reshape(values.shape)
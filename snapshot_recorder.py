@@ -0,0 +1,184 @@
+# Snapshots of per-asset values recorded during a Zipline backtest
+# -----------------------------
+# Records a factor and the prices of the assets at each rebalance into
+# preallocated dates x assets arrays, carried forward to every session as
+# record() does, instead of a frame per day appended to a list. The arrays
+# are saved to one .npz file with the backtest and exported as the factor
+# and prices inputs of alphalens. The alphalens notebook in
+# QS04-Part4-Risk-Management uses it, and bench_snapshot_recorder.py times
+# it against concatenating frames.
+
+# HOW TO USE:
+# recorder = SnapshotRecorder()  # in initialize
+# recorder.record(get_datetime(), factor=ranking, price=prices)  # at a rebalance
+# recorder.record(get_datetime())  # in before_trading_start
+# recorder.save("momentum-factor.npz")
+# factor, prices = SnapshotRecorder.load("momentum-factor.npz").alphalens_inputs()
+
+import numpy as np
+import pandas as pd
+
+FIELDS = ("factor", "price")
+DATES_CAPACITY = 256
+ASSETS_CAPACITY = 1024
+
+
+class SnapshotRecorder:
+    """
+    Record per-asset snapshots, such as a factor and the prices, during a
+    backtest into preallocated dates x assets arrays, one per field.
+
+    Each ``record`` writes one row with a single fancy-indexed assignment,
+    growing the arrays by doubling when a new date or asset doesn't fit, so
+    nothing is allocated per day. As with Zipline's ``record``, a field keeps
+    its last recorded values on later dates until it is recorded again, so
+    calling ``record(date)`` on every session gives one row per session.
+    Exporting to the long (date, asset) format of alphalens is one reshape
+    of each array, rather than a frame per day concatenated and stacked.
+
+    Parameters
+    ----------
+    fields : tuple of str
+        The names of the recorded values.
+    n_dates, n_assets : int
+        The initial capacity, such as the number of sessions of the backtest.
+    """
+
+    def __init__(self, fields=FIELDS, n_dates=DATES_CAPACITY, n_assets=ASSETS_CAPACITY):
+        self.fields = tuple(fields)
+        self.dates = []
+        self.assets = []
+        # Column of each asset
+        self.columns = {}
+        self.arrays = {field: np.full((n_dates, n_assets), np.nan) for field in fields}
+
+    def grow(self, n_dates, n_assets):
+        """Make room for at least ``n_dates`` x ``n_assets`` values."""
+        rows, cols = self.arrays[self.fields[0]].shape
+        if n_dates <= rows and n_assets <= cols:
+            return
+        new_rows, new_cols = max(rows, 1), max(cols, 1)
+        while new_rows < n_dates:
+            new_rows *= 2
+        while new_cols < n_assets:
+            new_cols *= 2
+        for field, values in self.arrays.items():
+            grown = np.full((new_rows, new_cols), np.nan)
+            grown[:rows, :cols] = values
+            self.arrays[field] = grown
+
+    def record(self, date, **snapshots):
+        """
+        Record the values of one date.
+
+        A new date starts as a copy of the last one. Recording a field again
+        on the same date replaces its values.
+
+        Parameters
+        ----------
+        date : pd.Timestamp
+            The date, such as ``get_datetime()``. It is normalized to
+            midnight without a time zone.
+        **snapshots : pd.Series
+            The values of a field indexed by asset, such as
+            ``factor=factor_data.ranking`` and
+            ``price=data.current(assets, "price")``. Fields not given keep
+            their values.
+        """
+        date = pd.Timestamp(date)
+        if date.tz is not None:
+            date = date.tz_convert(None)
+        date = date.normalize()
+        new_date = not self.dates or date != self.dates[-1]
+        if new_date:
+            self.dates.append(date)
+
+        for snapshot in snapshots.values():
+            for asset in snapshot.index:
+                if asset not in self.columns:
+                    self.columns[asset] = len(self.assets)
+                    self.assets.append(asset)
+        self.grow(len(self.dates), len(self.assets))
+
+        row = len(self.dates) - 1
+        if new_date and row > 0:
+            for values in self.arrays.values():
+                values[row] = values[row - 1]
+        for field, snapshot in snapshots.items():
+            cols = np.fromiter(
+                (self.columns[asset] for asset in snapshot.index),
+                dtype=np.int64,
+                count=len(snapshot),
+            )
+            self.arrays[field][row] = np.nan
+            self.arrays[field][row, cols] = snapshot.to_numpy(dtype=np.float64)
+
+    def labels(self):
+        """The assets as their ``symbol`` where they have one."""
+        return pd.Index([getattr(asset, "symbol", asset) for asset in self.assets])
+
+    def to_frame(self, field):
+        """The recorded values of ``field`` as a dates x assets frame."""
+        values = self.arrays[field][: len(self.dates), : len(self.assets)]
+        return pd.DataFrame(
+            values.copy(), index=pd.DatetimeIndex(self.dates), columns=self.labels()
+        )
+
+    def to_long(self, field):
+        """
+        The recorded values of ``field`` as a Series indexed by (date, asset),
+        without the missing ones, as alphalens takes a factor.
+        """
+        n_dates, n_assets = len(self.dates), len(self.assets)
+        values = self.arrays[field][:n_dates, :n_assets].reshape(-1)
+        present = np.flatnonzero(~np.isnan(values))
+        dates = pd.DatetimeIndex(self.dates)
+        unique_dates = dates.unique()
+        # Assets can share a symbol, such as a re-listed ticker, so their
+        # labels are deduplicated for the level.
+        labels = self.labels()
+        unique_labels = pd.Index(pd.unique(labels))
+        index = pd.MultiIndex(
+            levels=[unique_dates, unique_labels],
+            codes=[
+                unique_dates.get_indexer(dates)[present // n_assets],
+                unique_labels.get_indexer(labels)[present % n_assets],
+            ],
+            names=["date", "asset"],
+        )
+        return pd.Series(values[present], index=index, name=field)
+
+    def alphalens_inputs(self, factor="factor", prices="price"):
+        """
+        The ``factor`` and ``prices`` arguments of
+        ``get_clean_factor_and_forward_returns``.
+        """
+        prices = self.to_frame(prices).dropna(how="all")
+        return self.to_long(factor), prices
+
+    def save(self, path):
+        """Save the recorded values to an ``.npz`` file, assets as labels."""
+        n_dates, n_assets = len(self.dates), len(self.assets)
+        np.savez(
+            path,
+            fields=np.array(self.fields),
+            dates=pd.DatetimeIndex(self.dates).to_numpy(),
+            assets=self.labels().to_numpy(dtype=str),
+            **{
+                field: values[:n_dates, :n_assets]
+                for field, values in self.arrays.items()
+            },
+        )
+
+    @classmethod
+    def load(cls, path):
+        """Load values saved with ``save``."""
+        with np.load(path) as saved:
+            fields = saved["fields"].tolist()
+            recorder = cls(fields, *saved[fields[0]].shape)
+            recorder.dates = list(pd.DatetimeIndex(saved["dates"]))
+            recorder.assets = saved["assets"].astype(object).tolist()
+            recorder.columns = {asset: i for i, asset in enumerate(recorder.assets)}
+            for field in fields:
+                recorder.arrays[field] = saved[field]
+        return recorder